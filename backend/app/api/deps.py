@@ -1,16 +1,19 @@
-from typing import Generator
+from typing import AsyncGenerator, Generator, Optional
 from uuid import UUID
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.db.session import SessionLocal
+from app.db.session import AsyncSessionLocal, SessionLocal
 from app.core.config import settings
 from app.core.security import ALGORITHM
 from app.models.user import User
 from app.schemas.user import TokenPayload
+from app.services.identity_cache import BotSnapshot, UserSnapshot, identity_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
 
@@ -23,28 +26,41 @@ def get_db() -> Generator:
         db.close()
 
 
-def get_current_user(
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme)
-) -> User:
-    """Get current authenticated user"""
-    credentials_exception = HTTPException(
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """AsyncSession (asyncpg) for async endpoints; never call Session.query on the event loop."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def _decode_token(token: str) -> str:
+    """User id (JWT subject) of a valid access token."""
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
         if user_id is None:
-            raise credentials_exception
+            raise _credentials_exception()
         token_data = TokenPayload(sub=user_id)
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+    return token_data.sub
+
 
-    user = db.query(User).filter(User.id == token_data.sub).first()
+def get_current_user(
+    db: Session = Depends(get_db),
+    token: str = Depends(oauth2_scheme)
+) -> User:
+    """Get current authenticated user"""
+    user = db.query(User).filter(User.id == _decode_token(token)).first()
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
     return user
 
 
@@ -57,27 +73,92 @@ def get_current_active_user(
     return current_user
 
 
-def get_current_bot(
+async def load_user_snapshot(user_id: UUID) -> Optional[UserSnapshot]:
+    """Cached UserSnapshot, read from Postgres (and cached) on a miss."""
+    user = await identity_cache.get("user", user_id)
+    if user is None:
+        async with AsyncSessionLocal() as db:
+            row = await db.get(User, user_id)
+        if row is None:
+            return None
+        user = UserSnapshot.from_orm(row)
+        await identity_cache.put("user", user)
+    return user
+
+
+async def load_bot_snapshot(bot_uuid: UUID) -> Optional[BotSnapshot]:
+    """Cached BotSnapshot, read from Postgres (and cached) on a miss."""
+    from app.models.bot import Bot as BotModel
+
+    bot = await identity_cache.get("bot", bot_uuid)
+    if bot is None:
+        async with AsyncSessionLocal() as db:
+            row = await db.get(BotModel, bot_uuid)
+        if row is None:
+            return None
+        bot = BotSnapshot.from_orm(row)
+        await identity_cache.put("bot", bot)
+    return bot
+
+
+def _parse_bot_id(bot_id: str) -> UUID:
+    try:
+        return UUID(bot_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid bot ID format")
+
+
+async def get_current_user_snapshot(token: str = Depends(oauth2_scheme)) -> UserSnapshot:
+    """
+    get_current_user for read-only endpoints on the hot path (chat, history, retrieval):
+    a cached UserSnapshot, so Postgres is only hit on a cache miss.
+    """
+    try:
+        user_id = UUID(_decode_token(token))
+    except ValueError:
+        raise _credentials_exception()
+    user = await load_user_snapshot(user_id)
+    if user is None:
+        raise _credentials_exception()
+    return user
+
+
+async def get_current_active_user_snapshot(
+    current_user: UserSnapshot = Depends(get_current_user_snapshot),
+) -> UserSnapshot:
+    if not current_user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return current_user
+
+
+async def get_current_bot_snapshot(
     bot_id: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user),
+    current_user: UserSnapshot = Depends(get_current_active_user_snapshot),
+) -> BotSnapshot:
+    """get_current_bot returning a cached BotSnapshot; use get_current_bot to modify the bot."""
+    bot = await load_bot_snapshot(_parse_bot_id(bot_id))
+    if bot is None or bot.tenant_id != current_user.tenant_id:
+        raise HTTPException(status_code=404, detail="Bot not found")
+    return bot
+
+
+async def get_current_bot(
+    bot_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserSnapshot = Depends(get_current_active_user_snapshot),
 ):
     """
     Shared dependency: validate bot_id format, verify tenant ownership, return Bot.
     Eliminates the repeated UUID-check + query pattern across all bot endpoints.
+    The Bot is attached to the request's AsyncSession, so endpoints can modify it.
     """
     # Import here to avoid circular imports at module load time
     from app.models.bot import Bot as BotModel
 
-    try:
-        bot_uuid = UUID(bot_id)
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid bot ID format")
-
-    bot = db.query(BotModel).filter(
-        BotModel.id == bot_uuid,
+    bot = (await db.execute(select(BotModel).where(
+        BotModel.id == _parse_bot_id(bot_id),
         BotModel.tenant_id == current_user.tenant_id,
-    ).first()
+    ))).scalar_one_or_none()
     if not bot:
         raise HTTPException(status_code=404, detail="Bot not found")
     return bot
@@ -1,12 +1,12 @@
 from datetime import datetime, timedelta
 from typing import List, Optional
 from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, and_, select
 
-from app.api.deps import get_current_user, get_db
+from app.api.deps import get_async_db, get_current_user_snapshot
 from app.db.mongodb import get_mongodb
-from app.models.user import User
+from app.services.identity_cache import UserSnapshot
 from app.models.bot import Bot
 from app.models.document import Document
 
@@ -15,8 +15,8 @@ router = APIRouter()
 
 @router.get("/stats")
 async def get_analytics_stats(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: UserSnapshot = Depends(get_current_user_snapshot),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Get overall analytics statistics for the current tenant.
@@ -25,7 +25,7 @@ async def get_analytics_stats(
     conversations_collection = mongo_db.conversations
     
     # Get tenant's bots
-    bots = db.query(Bot).filter(Bot.tenant_id == current_user.tenant_id).all()
+    bots = (await db.execute(select(Bot).where(Bot.tenant_id == current_user.tenant_id))).scalars().all()
     bot_ids = [str(bot.id) for bot in bots]
     
     # Count total messages from MongoDB
@@ -71,8 +71,8 @@ async def get_analytics_stats(
 @router.get("/conversations")
 async def get_recent_conversations(
     limit: int = Query(10, ge=1, le=100),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: UserSnapshot = Depends(get_current_user_snapshot),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Get recent conversations for the current tenant.
@@ -81,7 +81,7 @@ async def get_recent_conversations(
     conversations_collection = mongo_db.conversations
     
     # Get tenant's bots
-    bots = db.query(Bot).filter(Bot.tenant_id == current_user.tenant_id).all()
+    bots = (await db.execute(select(Bot).where(Bot.tenant_id == current_user.tenant_id))).scalars().all()
     bot_ids = [str(bot.id) for bot in bots]
     bot_map = {str(bot.id): bot.name for bot in bots}
     
@@ -120,8 +120,8 @@ async def get_recent_conversations(
 @router.get("/messages-over-time")
 async def get_messages_over_time(
     period: str = Query("30d", regex="^[0-9]+(d|h)$"),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: UserSnapshot = Depends(get_current_user_snapshot),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Get message count over time for charts.
@@ -144,7 +144,7 @@ async def get_messages_over_time(
         group_format = "%Y-%m-%d"
     
     # Get tenant's bots
-    bots = db.query(Bot).filter(Bot.tenant_id == current_user.tenant_id).all()
+    bots = (await db.execute(select(Bot).where(Bot.tenant_id == current_user.tenant_id))).scalars().all()
     bot_ids = [str(bot.id) for bot in bots]
     
     # Aggregate messages by time
@@ -177,8 +177,8 @@ async def get_messages_over_time(
 
 @router.get("/bot-usage")
 async def get_bot_usage_stats(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: UserSnapshot = Depends(get_current_user_snapshot),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Get usage statistics per bot.
@@ -187,7 +187,7 @@ async def get_bot_usage_stats(
     conversations_collection = mongo_db.conversations
     
     # Get tenant's bots
-    bots = db.query(Bot).filter(Bot.tenant_id == current_user.tenant_id).all()
+    bots = (await db.execute(select(Bot).where(Bot.tenant_id == current_user.tenant_id))).scalars().all()
     bot_ids = [str(bot.id) for bot in bots]
     bot_map = {str(bot.id): {"name": bot.name, "is_active": bot.is_active} for bot in bots}
     
@@ -222,8 +222,8 @@ async def get_bot_usage_stats(
 @router.get("/top-queries")
 async def get_top_queries(
     limit: int = 10,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: UserSnapshot = Depends(get_current_user_snapshot),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Get top user queries by frequency.
@@ -232,7 +232,7 @@ async def get_top_queries(
     conversations_collection = mongo_db.conversations
     
     # Get tenant's bots
-    bots = db.query(Bot).filter(Bot.tenant_id == current_user.tenant_id).all()
+    bots = (await db.execute(select(Bot).where(Bot.tenant_id == current_user.tenant_id))).scalars().all()
     bot_ids = [str(bot.id) for bot in bots]
     
     pipeline = [
@@ -252,8 +252,8 @@ async def get_top_queries(
 
 @router.get("/response-time-distribution")
 async def get_response_time_distribution(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: UserSnapshot = Depends(get_current_user_snapshot),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Get distribution of response times.
@@ -262,7 +262,7 @@ async def get_response_time_distribution(
     conversations_collection = mongo_db.conversations
     
     # Get tenant's bots
-    bots = db.query(Bot).filter(Bot.tenant_id == current_user.tenant_id).all()
+    bots = (await db.execute(select(Bot).where(Bot.tenant_id == current_user.tenant_id))).scalars().all()
     bot_ids = [str(bot.id) for bot in bots]
     
     # We'll fetch response times and bucket them in Python for flexibility, 
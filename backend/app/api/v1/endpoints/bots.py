@@ -1,7 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Dict, Any, Optional
+import asyncio
+import contextlib
 import uuid
 from uuid import UUID
 import secrets
@@ -32,12 +35,13 @@ from pydantic import BaseModel
 from app.api import deps
 from app.models.bot import Bot as BotModel
 from app.models.document import Document as DocumentModel
-from app.models.user import User
 from app.schemas.bot import Bot, BotCreate, BotUpdate
 from app.schemas.document import Document
 from app.schemas.chat import ChatRequest, ChatResponse
+from app.services.identity_cache import BotSnapshot, UserSnapshot, identity_cache
 from app.services.openrouter_rag_service import get_openrouter_rag_service
 from app.services.memory_service import memory_service
+from app.services.lexical_index import lexical_index_store
 from app.services.storage_service import storage_service
 from app.tasks.document_tasks import process_document_task
 
@@ -48,23 +52,23 @@ rag_service = get_openrouter_rag_service()
 router = APIRouter()
 
 @router.get("/", response_model=List[Bot])
-def read_bots(
+async def read_bots(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(deps.get_db),
-    current_user: User = Depends(deps.get_current_active_user),
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_user: UserSnapshot = Depends(deps.get_current_active_user_snapshot),
 ):
     """Get all bots for current user's tenant"""
-    bots = db.query(BotModel).filter(
-        BotModel.tenant_id == current_user.tenant_id
-    ).offset(skip).limit(limit).all()
+    bots = (await db.execute(
+        select(BotModel).where(BotModel.tenant_id == current_user.tenant_id).offset(skip).limit(limit)
+    )).scalars().all()
     return bots
 
 @router.post("/", response_model=Bot, status_code=201)
-def create_bot(
+async def create_bot(
     bot_in: BotCreate,
-    db: Session = Depends(deps.get_db),
-    current_user: User = Depends(deps.get_current_active_user),
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_user: UserSnapshot = Depends(deps.get_current_active_user_snapshot),
 ):
     """Create a new bot for current user's tenant"""
     bot = BotModel(
@@ -74,22 +78,22 @@ def create_bot(
         api_key=secrets.token_urlsafe(32),  # Generate API key
     )
     db.add(bot)
-    db.commit()
-    db.refresh(bot)
+    await db.commit()
+    await db.refresh(bot)
     return bot
 
 @router.get("/{bot_id}", response_model=Bot)
-def read_bot(
+async def read_bot(
     bot: BotModel = Depends(deps.get_current_bot),
 ):
     """Get a specific bot"""
     return bot
 
 @router.put("/{bot_id}", response_model=Bot)
-def update_bot(
+async def update_bot(
     bot_in: BotUpdate,
     bot: BotModel = Depends(deps.get_current_bot),
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
 ):
     """Update a bot"""
     update_data = bot_in.model_dump(exclude_unset=True)
@@ -97,18 +101,21 @@ def update_bot(
         setattr(bot, field, value)
 
     db.add(bot)
-    db.commit()
-    db.refresh(bot)
+    await db.commit()
+    await db.refresh(bot)
+    await identity_cache.invalidate("bot", bot.id)
     return bot
 
 @router.delete("/{bot_id}", status_code=204)
-def delete_bot(
+async def delete_bot(
     bot: BotModel = Depends(deps.get_current_bot),
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
 ):
     """Delete a bot"""
-    db.delete(bot)
-    db.commit()
+    bot_uuid = bot.id
+    await db.delete(bot)
+    await db.commit()
+    await identity_cache.invalidate("bot", bot_uuid)
     return None
 
 @router.post("/{bot_id}/documents", response_model=Document)
@@ -118,8 +125,8 @@ async def upload_document(
     chunking_strategy: str = Form("recursive"),  # or "semantic"
     enable_knowledge_graph: bool = Form(False),
     bot: BotModel = Depends(deps.get_current_bot),
-    db: Session = Depends(deps.get_db),
-    current_user: User = Depends(deps.get_current_active_user),
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_user: UserSnapshot = Depends(deps.get_current_active_user_snapshot),
 ):
     """Upload a document to a bot's knowledge base with advanced processing"""
 
@@ -163,10 +170,10 @@ async def upload_document(
     safe_storage_name = f"{uuid.uuid4()}{suffix}"
 
     # ── Deduplication Check: prevent re-processing same file ─────────────
-    existing_doc = db.query(DocumentModel).filter(
+    existing_doc = (await db.execute(select(DocumentModel).where(
         DocumentModel.bot_id == bot.id,
         DocumentModel.filename == original_filename
-    ).first()
+    ))).scalars().first()
 
     if existing_doc:
         # If already processing or completed, return existing doc (idempotent)
@@ -180,7 +187,8 @@ async def upload_document(
 
     # Upload file to MinIO
     try:
-        file_path = storage_service.upload_file(
+        file_path = await asyncio.to_thread(
+            storage_service.upload_file,
             file.file,
             safe_storage_name,
             content_type=file.content_type or "application/octet-stream"
@@ -201,8 +209,8 @@ async def upload_document(
         doc_metadata={"chunking_strategy": chunking_strategy, "enable_knowledge_graph": enable_knowledge_graph}
     )
     db.add(doc)
-    db.commit()
-    db.refresh(doc)
+    await db.commit()
+    await db.refresh(doc)
 
     # Resolve chunk params: explicit form values override domain profile defaults
     from app.services.domain_config import get_domain_profile
@@ -214,6 +222,7 @@ async def upload_document(
     )
     effective_chunk_size = bot_cfg.get("chunk_size") or domain_profile.chunk_size
     effective_chunk_overlap = bot_cfg.get("chunk_overlap") or domain_profile.chunk_overlap
+    effective_vector_storage = bot_cfg.get("vector_storage") or domain_profile.vector_storage
 
     # Enqueue background processing
     process_document_task.delay(
@@ -225,27 +234,28 @@ async def upload_document(
         enable_knowledge_graph,
         effective_chunk_size,
         effective_chunk_overlap,
+        effective_vector_storage,
     )
     
     return doc
 
 @router.get("/{bot_id}/documents", response_model=List[Document])
-def list_documents(
+async def list_documents(
     bot: BotModel = Depends(deps.get_current_bot),
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
 ):
     """List all documents for a bot"""
-    documents = db.query(DocumentModel).filter(
-        DocumentModel.bot_id == bot.id
-    ).all()
+    documents = (await db.execute(
+        select(DocumentModel).where(DocumentModel.bot_id == bot.id)
+    )).scalars().all()
     return documents
 
 @router.delete("/{bot_id}/documents/{doc_id}", status_code=204)
-def delete_document(
+async def delete_document(
     bot_id: str,
     doc_id: str,
     bot: BotModel = Depends(deps.get_current_bot),
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
 ):
     """Delete a document and its vectors from both DB and Qdrant"""
     try:
@@ -253,33 +263,20 @@ def delete_document(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid document ID format")
 
-    doc = db.query(DocumentModel).filter(
+    doc = (await db.execute(select(DocumentModel).where(
         DocumentModel.id == doc_uuid,
         DocumentModel.bot_id == bot.id,
-    ).first()
+    ))).scalar_one_or_none()
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
     # DELETE VECTORS FROM QDRANT FIRST (Critical fix!)
     try:
-        from qdrant_client.models import Filter, FieldCondition, MatchValue
-        
-        rag_service.qdrant_client.delete(
-            collection_name=rag_service.collection_name,
-            points_selector=Filter(
-                must=[
-                    FieldCondition(
-                        key="bot_id",
-                        match=MatchValue(value=str(bot_id))
-                    ),
-                    FieldCondition(
-                        key="source",
-                        match=MatchValue(value=doc.filename)
-                    )
-                ]
-            )
-        )
+        # Routed delete: shared and/or dedicated collection, whichever holds this bot
+        await asyncio.to_thread(rag_service.delete_bot_points, str(bot_id), doc.filename)
         logger.info(f"Deleted vectors for document {doc.filename} from Qdrant")
+        if lexical_index_store.exists(str(bot_id)):
+            await asyncio.to_thread(lexical_index_store.remove_source, str(bot_id), doc.filename)
     except Exception as e:
         logger.error(f"Failed to delete vectors from Qdrant: {e}")
         raise HTTPException(
@@ -291,16 +288,16 @@ def delete_document(
     # Also delete file from storage if present
     if doc.file_path:
         try:
-            storage_service.delete_file(doc.file_path)
+            await asyncio.to_thread(storage_service.delete_file, doc.file_path)
         except Exception as e:
             logger.warning(f"Failed to delete file from storage for doc {doc.id}: {e}")
 
-    db.delete(doc)
-    db.commit()
+    await db.delete(doc)
+    await db.commit()
     
     # Invalidate cache for this bot
     try:
-        rag_service.invalidate_bot_cache(str(bot_id))
+        await rag_service.invalidate_bot_cache_async(str(bot_id))
     except Exception as e:
         logger.warning(f"Cache invalidation failed: {e}")
     
@@ -309,7 +306,7 @@ def delete_document(
 @router.get("/{bot_id}/knowledge-graph")
 async def get_bot_knowledge_graph(
     bot_id: str,
-    bot: BotModel = Depends(deps.get_current_bot),
+    bot: BotSnapshot = Depends(deps.get_current_bot_snapshot),
 ):
     """Get knowledge graph data for a specific bot for the 3D UI"""
         
@@ -317,7 +314,6 @@ async def get_bot_knowledge_graph(
     try:
         lightrag_service = get_lightrag_service(bot_id=bot_id)
         # Call synchronous method in asyncio to avoid blocking
-        import asyncio
         graph_data = await asyncio.to_thread(lightrag_service.get_graph_data_for_ui)
         return graph_data
     except Exception as e:
@@ -328,8 +324,8 @@ async def get_bot_knowledge_graph(
 async def chat_with_bot(
     bot_id: str,
     chat_in: ChatRequest,
-    bot: BotModel = Depends(deps.get_current_bot),
-    current_user: User = Depends(deps.get_current_active_user),
+    bot: BotSnapshot = Depends(deps.get_current_bot_snapshot),
+    current_user: UserSnapshot = Depends(deps.get_current_active_user_snapshot),
 ):
     """Chat with bot using advanced RAG with caching and optimizations"""
 
@@ -364,8 +360,8 @@ async def chat_with_bot(
 async def chat_with_bot_stream(
     bot_id: str,
     chat_in: ChatRequest,
-    bot: BotModel = Depends(deps.get_current_bot),
-    current_user: User = Depends(deps.get_current_active_user),
+    bot: BotSnapshot = Depends(deps.get_current_bot_snapshot),
+    current_user: UserSnapshot = Depends(deps.get_current_active_user_snapshot),
 ):
     """Chat with bot using streaming advanced RAG"""
 
@@ -377,16 +373,19 @@ async def chat_with_bot_stream(
     bot_config["user_id"] = str(current_user.id)
     
     async def event_generator():
+        # StreamingResponse cancels this generator when the browser disconnects;
+        # aclosing() closes chat_stream right away, which stops the upstream LLM stream.
         try:
             logger.info(f"[STREAM] Starting stream for bot={bot_id}")
-            async for chunk in rag_service.chat_stream(
+            async with contextlib.aclosing(rag_service.chat_stream(
                 bot_id=str(bot_id),
                 query=chat_in.message,
                 bot_config=bot_config,
                 conversation_history=conversation_history,
                 session_id=session_id
-            ):
-                yield f"data: {json.dumps(chunk)}\n\n"
+            )) as chunks:
+                async for chunk in chunks:
+                    yield f"data: {json.dumps(chunk)}\n\n"
         except Exception as e:
             logger.error(f"[STREAM] Streaming error: {e}", exc_info=True)
             yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
@@ -399,8 +398,8 @@ async def get_bot_chat_history(
     bot_id: str,
     session_id: Optional[str] = Query(None),
     limit: int = Query(20, ge=1, le=100),
-    bot: BotModel = Depends(deps.get_current_bot),
-    current_user: User = Depends(deps.get_current_active_user),
+    bot: BotSnapshot = Depends(deps.get_current_bot_snapshot),
+    current_user: UserSnapshot = Depends(deps.get_current_active_user_snapshot),
 ):
     """Get chat history for a specific bot and optional session"""
         
@@ -417,8 +416,8 @@ async def get_bot_chat_history(
 async def get_bot_sessions(
     bot_id: str,
     limit: int = Query(50, ge=1, le=100),
-    bot: BotModel = Depends(deps.get_current_bot),
-    current_user: User = Depends(deps.get_current_active_user),
+    bot: BotSnapshot = Depends(deps.get_current_bot_snapshot),
+    current_user: UserSnapshot = Depends(deps.get_current_active_user_snapshot),
 ):
     """Get all chat sessions for a specific bot and current user"""
         
@@ -434,8 +433,8 @@ async def get_bot_sessions(
 async def delete_bot_session(
     bot_id: str,
     session_id: str,
-    bot: BotModel = Depends(deps.get_current_bot),
-    current_user: User = Depends(deps.get_current_active_user),
+    bot: BotSnapshot = Depends(deps.get_current_bot_snapshot),
+    current_user: UserSnapshot = Depends(deps.get_current_active_user_snapshot),
 ):
     """Delete a specific chat session for a bot"""
         
@@ -453,8 +452,8 @@ async def delete_bot_session(
 @router.delete("/{bot_id}/history", status_code=204)
 async def clear_bot_history(
     bot_id: str,
-    bot: BotModel = Depends(deps.get_current_bot),
-    current_user: User = Depends(deps.get_current_active_user),
+    bot: BotSnapshot = Depends(deps.get_current_bot_snapshot),
+    current_user: UserSnapshot = Depends(deps.get_current_active_user_snapshot),
 ):
     """Clear all chat history/sessions for a bot"""
         
@@ -476,8 +475,8 @@ class PromptGenerationRequest(BaseModel):
 @router.get("/{bot_id}/memory", response_model=Dict[str, Any])
 async def get_user_memories(
     bot_id: str,
-    bot: BotModel = Depends(deps.get_current_bot),
-    current_user: User = Depends(deps.get_current_active_user),
+    bot: BotSnapshot = Depends(deps.get_current_bot_snapshot),
+    current_user: UserSnapshot = Depends(deps.get_current_active_user_snapshot),
 ):
     """Get all stored Mem0 memories for the current user+bot pair."""
     user_id = str(current_user.id)
@@ -494,8 +493,8 @@ async def get_user_memories(
 @router.delete("/{bot_id}/memory", response_model=Dict[str, Any])
 async def delete_user_memories(
     bot_id: str,
-    bot: BotModel = Depends(deps.get_current_bot),
-    current_user: User = Depends(deps.get_current_active_user),
+    bot: BotSnapshot = Depends(deps.get_current_bot_snapshot),
+    current_user: UserSnapshot = Depends(deps.get_current_active_user_snapshot),
 ):
     """Delete ALL stored memories for the current user+bot pair (GDPR compliance)."""
     user_id = str(current_user.id)
@@ -510,8 +509,8 @@ async def delete_user_memories(
 @router.post("/generate-prompt", response_model=Dict[str, str])
 async def generate_bot_prompt(
     request: PromptGenerationRequest,
-    db: Session = Depends(deps.get_db),
-    current_user: User = Depends(deps.get_current_active_user),
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_user: UserSnapshot = Depends(deps.get_current_active_user_snapshot),
 ):
     """Generate a high-quality system prompt based on bot name, description, and available documents"""
     
@@ -520,10 +519,10 @@ async def generate_bot_prompt(
     if request.bot_id:
         try:
             bot_uuid = UUID(request.bot_id)
-            documents = db.query(DocumentModel).filter(
+            documents = (await db.execute(select(DocumentModel).join(BotModel).where(
                 DocumentModel.bot_id == bot_uuid,
-                DocumentModel.tenant_id == current_user.tenant_id if hasattr(DocumentModel, 'tenant_id') else True # Safety check if tenant_id exists on Doc
-            ).all()
+                BotModel.tenant_id == current_user.tenant_id,
+            ))).scalars().all()
             
             if documents:
                 file_types = list(set([Path(doc.filename).suffix for doc in documents]))
@@ -551,8 +550,8 @@ async def generate_bot_prompt(
         messages = [{"role": "user", "content": meta_prompt}]
         
         # Accessing the internal openrouter service directly for valid lightweight generation
-        # We can reuse rag_service.openrouter.chat_completion
-        response = rag_service.openrouter.chat_completion(
+        # We can reuse rag_service.openrouter.achat_completion
+        response = await rag_service.openrouter.achat_completion(
             messages=messages,
             model="openai/gpt-4o-mini", # Fast and capable enough
             temperature=0.7
@@ -577,16 +576,22 @@ class RetrieveRequest(BaseModel):
 async def test_retrieval(
     bot_id: str,
     request: RetrieveRequest,
-    bot: BotModel = Depends(deps.get_current_bot),
+    bot: BotSnapshot = Depends(deps.get_current_bot_snapshot),
 ):
     """Debug: run hybrid search and return scored chunks for a query."""
 
     try:
-        import asyncio
-        query_embedding = await asyncio.to_thread(rag_service._embed_with_retry, request.query)
-        candidates = await asyncio.to_thread(
-            rag_service._hybrid_search,
-            bot_id, request.query, query_embedding, request.top_k
+        from app.services.domain_config import get_domain_profile
+        bot_config = bot.config or {}
+        profile = get_domain_profile(bot_config.get("domain", "general"))
+        query_embedding = await rag_service._embed_query(str(bot_id), request.query)
+        candidates = await rag_service._hybrid_search(
+            bot_id, request.query, query_embedding, request.top_k,
+            lexical_backend=bot_config.get("lexical_backend"),
+            rerank_pool=profile.rerank_pool_size,
+            rerank_keep=profile.rerank_top_n,
+            rerank_passage_tokens=profile.rerank_passage_tokens,
+            oversampling=bot_config.get("vector_oversampling") or profile.vector_oversampling,
         )
         results = [
             {
@@ -608,7 +613,7 @@ async def debug_retrieval(
     bot_id: str,
     query: str = Query(..., description="Query to debug"),
     top_k: int = Query(5, description="Number of chunks to retrieve"),
-    bot: BotModel = Depends(deps.get_current_bot),
+    bot: BotSnapshot = Depends(deps.get_current_bot_snapshot),
 ):
     """
     Retrieval Debugger — Returns full intermediate RAG pipeline results.
@@ -659,7 +664,7 @@ async def debug_retrieval(
                 "metadata": chunk.get("metadata", {}),
                 # Individual scores
                 "vector_score": chunk.get("initial_score", 0),  # From semantic search
-                "bm25_score": chunk.get("rrf_score", 0),  # Approximate from FTS
+                "bm25_score": chunk.get("bm25_score", chunk.get("rrf_score", 0)),  # BM25 index score, else RRF approximation
                 "rrf_score": chunk.get("rrf_score", 0),  # Reciprocal Rank Fusion
                 "reranker_score": chunk.get("rerank_raw", 0),  # Cross-Encoder raw
                 "hybrid_score": chunk.get("hybrid_score", 0),  # Final blended score
@@ -681,7 +686,8 @@ async def debug_retrieval(
             "bot_config": {
                 "domain": bot_config.get("domain", "general"),
                 "top_k": top_k,
-                "enable_multi_query": bot_config.get("enable_multi_query", True),
+                "enable_multi_query": bot_config.get("enable_multi_query", False),
+                "enable_hyde": bot_config.get("enable_hyde", False),
                 "enable_knowledge_graph": bot_config.get("enable_knowledge_graph", False),
             }
         }
@@ -696,7 +702,7 @@ async def submit_message_feedback(
     bot_id: str,
     message_id: str,
     feedback_in: FeedbackRequest,
-    current_user: User = Depends(deps.get_current_active_user),
+    current_user: UserSnapshot = Depends(deps.get_current_active_user_snapshot),
 ):
     """Store thumbs-up / thumbs-down feedback for a specific AI message."""
     try:
@@ -5,14 +5,16 @@ Handles incoming Zalo Bot messages and connect/disconnect flows.
 import hmac
 import logging
 from datetime import datetime
+from uuid import UUID
 from fastapi import APIRouter, Request, HTTPException, Depends
 from sqlalchemy.orm import Session
 from sqlalchemy.orm.attributes import flag_modified
 from pydantic import BaseModel
 
-from app.api.deps import get_current_user, get_db
+from app.api.deps import get_current_user, get_db, load_bot_snapshot
 from app.models.user import User
 from app.models.bot import Bot as BotModel
+from app.services.identity_cache import identity_cache
 from app.tasks.zalo_bot_tasks import process_zalo_bot_webhook_task
 
 logger = logging.getLogger(__name__)
@@ -35,26 +37,24 @@ async def zalo_bot_webhook(bot_id: str, request: Request):
     Each bot has its own unique webhook URL.
     Verifies the secret token from the x-bot-api-secret-token header.
     """
-    from app.db.session import SessionLocal
-
-    db = SessionLocal()
     try:
-        bot = db.query(BotModel).filter(BotModel.id == bot_id).first()
-        if not bot:
-            raise HTTPException(status_code=404, detail="Bot not found")
-
-        zalo_config = (bot.config or {}).get("zalo_bot", {})
-        expected_secret = zalo_config.get("webhook_secret", "")
-
-        # Verify secret token header using constant-time comparison to prevent timing attacks
-        received_secret = request.headers.get("x-bot-api-secret-token", "")
-        if not expected_secret or not hmac.compare_digest(
-            received_secret.encode(), expected_secret.encode()
-        ):
-            logger.warning(f"Zalo Bot webhook: Invalid secret for bot {bot_id}")
-            raise HTTPException(status_code=403, detail="Invalid secret token")
-    finally:
-        db.close()
+        bot_uuid = UUID(bot_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Bot not found")
+    bot = await load_bot_snapshot(bot_uuid)
+    if not bot:
+        raise HTTPException(status_code=404, detail="Bot not found")
+
+    zalo_config = (bot.config or {}).get("zalo_bot", {})
+    expected_secret = zalo_config.get("webhook_secret", "")
+
+    # Verify secret token header using constant-time comparison to prevent timing attacks
+    received_secret = request.headers.get("x-bot-api-secret-token", "")
+    if not expected_secret or not hmac.compare_digest(
+        received_secret.encode(), expected_secret.encode()
+    ):
+        logger.warning(f"Zalo Bot webhook: Invalid secret for bot {bot_id}")
+        raise HTTPException(status_code=403, detail="Invalid secret token")
 
     # Parse payload and dispatch to Celery
     payload = await request.json()
@@ -119,6 +119,7 @@ async def connect_zalo_bot(
         bot.config = config
         flag_modified(bot, "config")
         db.commit()
+        await identity_cache.invalidate("bot", bot.id)
 
         logger.info(f"Zalo Bot connected for bot '{bot.name}' (ID: {bot.id})")
 
@@ -153,6 +154,7 @@ async def disconnect_zalo_bot(
     bot.config = config
     flag_modified(bot, "config")
     db.commit()
+    await identity_cache.invalidate("bot", bot.id)
 
     logger.info(f"Zalo Bot disconnected for bot '{bot.name}' (ID: {bot.id})")
     return {"status": "disconnected"}
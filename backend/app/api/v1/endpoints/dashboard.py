@@ -1,13 +1,13 @@
 from datetime import datetime, timedelta
 from typing import Dict, Any
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
 
-from app.api.deps import get_current_user, get_db
+from app.api.deps import get_async_db, get_current_user_snapshot
 from app.db.mongodb import get_mongodb
 from app.db.redis import get_redis
-from app.models.user import User
+from app.services.identity_cache import UserSnapshot
 from app.models.bot import Bot
 from app.models.document import Document
 import json
@@ -19,14 +19,14 @@ CACHE_TTL = 300  # 5 minutes cache
 
 @router.get("/stats")
 async def get_dashboard_stats(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: UserSnapshot = Depends(get_current_user_snapshot),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Get real-time dashboard statistics with Redis caching.
     Returns: total_bots, active_sessions, messages_today, avg_response_time
     """
-    redis = await get_redis()
+    redis = get_redis()
     cache_key = f"dashboard:stats:{current_user.tenant_id}"
     
     # Try to get from cache
@@ -39,12 +39,12 @@ async def get_dashboard_stats(
     conversations_collection = mongo_db.conversations
     
     # Total bots for this tenant
-    total_bots = db.query(func.count(Bot.id)).filter(
+    total_bots = (await db.execute(select(func.count(Bot.id)).where(
         Bot.tenant_id == current_user.tenant_id
-    ).scalar()
+    ))).scalar()
     
     # Get tenant's bot IDs
-    bots = db.query(Bot).filter(Bot.tenant_id == current_user.tenant_id).all()
+    bots = (await db.execute(select(Bot).where(Bot.tenant_id == current_user.tenant_id))).scalars().all()
     bot_ids = [str(bot.id) for bot in bots]
     
     # Active sessions in last 24 hours (unique session_ids)
@@ -105,8 +105,8 @@ async def get_dashboard_stats(
 
 @router.get("/activity")
 async def get_dashboard_activity(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: UserSnapshot = Depends(get_current_user_snapshot),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Get recent activity feed for dashboard.
@@ -115,7 +115,7 @@ async def get_dashboard_activity(
     conversations_collection = mongo_db.conversations
     
     # Get tenant's bots
-    bots = db.query(Bot).filter(Bot.tenant_id == current_user.tenant_id).all()
+    bots = (await db.execute(select(Bot).where(Bot.tenant_id == current_user.tenant_id))).scalars().all()
     bot_ids = [str(bot.id) for bot in bots]
     bot_map = {str(bot.id): bot.name for bot in bots}
     
@@ -144,28 +144,28 @@ async def get_dashboard_activity(
 
 @router.get("/quick-stats")
 async def get_quick_stats(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: UserSnapshot = Depends(get_current_user_snapshot),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Get quick stats for dashboard cards (documents, active bots, etc.)
     """
     # Total documents
-    total_documents = db.query(func.count(Document.id)).join(Bot).filter(
+    total_documents = (await db.execute(select(func.count(Document.id)).join(Bot).where(
         Bot.tenant_id == current_user.tenant_id
-    ).scalar()
+    ))).scalar()
     
     # Active bots
-    active_bots = db.query(func.count(Bot.id)).filter(
+    active_bots = (await db.execute(select(func.count(Bot.id)).where(
         Bot.tenant_id == current_user.tenant_id,
         Bot.is_active == True
-    ).scalar()
+    ))).scalar()
     
     # Processing documents
-    processing_docs = db.query(func.count(Document.id)).join(Bot).filter(
+    processing_docs = (await db.execute(select(func.count(Document.id)).join(Bot).where(
         Bot.tenant_id == current_user.tenant_id,
         Document.status.in_(['pending', 'processing'])
-    ).scalar()
+    ))).scalar()
     
     return {
         "total_documents": total_documents or 0,
@@ -244,3 +244,24 @@ async def list_embedding_models():
             }
         ]
     }
+
+
+@router.get("/cache/stats")
+async def cache_stats(
+    current_user: User = Depends(deps.get_current_active_user),
+):
+    """Hit-rate counters of this worker's embedding and rerank caches (since process start)."""
+    from app.services.embedding_cache import embedding_cache
+
+    rerank_local = get_openrouter_rag_service().rerank_cache.local
+    rerank_lookups = rerank_local.hits + rerank_local.misses
+    return {
+        "status": "success",
+        "embedding": embedding_cache.stats(),
+        "rerank_local": {
+            "lookups": rerank_lookups,
+            "hits": rerank_local.hits,
+            "hit_rate": round(rerank_local.hits / rerank_lookups, 4) if rerank_lookups else 0.0,
+            "local_entries": len(rerank_local),
+        },
+    }
@@ -9,6 +9,7 @@ import hashlib
 from app.api.deps import get_current_user, get_db
 from app.models.user import User
 from app.core.security import get_password_hash
+from app.services.identity_cache import identity_cache
 
 router = APIRouter()
 
@@ -95,6 +96,7 @@ async def update_user_profile(
     current_user.updated_at = datetime.utcnow()
     db.commit()
     db.refresh(current_user)
+    await identity_cache.invalidate("user", current_user.id)
     
     return {
         "id": str(current_user.id),
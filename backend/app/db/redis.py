@@ -1,29 +1,88 @@
-import redis.asyncio as redis
+import asyncio
+import logging
+import threading
+import weakref
+
+import redis
+import redis.asyncio as aioredis
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
+
 class RedisClient:
-    client: redis.Redis = None
+    client: aioredis.Redis = None
+    loop: asyncio.AbstractEventLoop = None
 
 redis_client = RedisClient()
 
+# Clients for event loops other than the API's (Celery tasks run asyncio.run per task)
+_loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aioredis.Redis]" = weakref.WeakKeyDictionary()
 
-async def connect_to_redis():
-    """Connect to Redis"""
-    redis_client.client = await redis.from_url(
+_sync_client = None
+_sync_attempted = False
+_sync_lock = threading.Lock()
+
+
+def _new_client() -> aioredis.Redis:
+    # decode_responses=False: binary values (float16 embeddings) share the pool with JSON ones
+    return aioredis.from_url(
         settings.REDIS_URL,
-        encoding="utf-8",
-        decode_responses=True
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        socket_connect_timeout=5,
+        socket_timeout=5,
     )
+
+
+async def connect_to_redis():
+    """Connect to Redis"""
+    redis_client.client = _new_client()
+    redis_client.loop = asyncio.get_running_loop()
     print(f"Connected to Redis at {settings.REDIS_URL}")
 
 
 async def close_redis_connection():
     """Close Redis connection"""
     if redis_client.client:
-        await redis_client.client.close()
+        await redis_client.client.aclose()
         print("Closed Redis connection")
 
 
-def get_redis() -> redis.Redis:
-    """Get Redis client"""
-    return redis_client.client
+def get_redis() -> aioredis.Redis:
+    """Async Redis client (bytes in/out) for the running event loop."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return redis_client.client
+    if redis_client.client is not None and redis_client.loop is loop:
+        return redis_client.client
+    client = _loop_clients.get(loop)
+    if client is None:
+        client = _loop_clients[loop] = _new_client()
+    return client
+
+
+async def close_loop_redis():
+    """Close the running loop's client from get_redis(), unless it is the API's."""
+    client = _loop_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def get_sync_redis():
+    """
+    Blocking client (bytes in/out) for code that is itself synchronous — Celery task
+    bodies and Mem0's embedder. None if Redis is unreachable.
+    """
+    global _sync_client, _sync_attempted
+    if not _sync_attempted:
+        with _sync_lock:
+            if not _sync_attempted:
+                try:
+                    client = redis.from_url(settings.REDIS_URL, socket_connect_timeout=5, socket_timeout=5)
+                    client.ping()
+                    _sync_client = client
+                except Exception as e:
+                    logger.warning(f"Redis unavailable for sync callers ({e})")
+                _sync_attempted = True
+    return _sync_client
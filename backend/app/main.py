@@ -32,11 +32,23 @@ async def lifespan(app: FastAPI):
     loop = asyncio.get_event_loop()
     loop.run_in_executor(None, _preload_reranker)
 
+    # Drop auth snapshots (user / bot) invalidated by other workers
+    from app.services.identity_cache import identity_cache
+    identity_listener = asyncio.create_task(identity_cache.listen())
+
     yield
     
     # Shutdown
+    identity_listener.cancel()
+    try:
+        from app.services.openrouter_rag_service import get_openrouter_rag_service
+        await get_openrouter_rag_service().aclose()
+    except Exception as e:
+        logger.warning(f"Closing async Qdrant client failed (non-critical): {e}")
     await close_mongodb_connection()
     await close_redis_connection()
+    from app.db.session import async_engine
+    await async_engine.dispose()
 
 
 app = FastAPI(
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, UUID4, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Literal
 from datetime import datetime
 
 
@@ -18,10 +18,18 @@ class BotConfig(BaseModel):
     # Retrieval
     top_k: int = Field(default=5, ge=1, le=20)
     similarity_threshold: float = Field(default=0.0, ge=0.0, le=1.0)
+    lexical_backend: Literal["sparse", "bm25", "fts"] | None = Field(default=None, description="Override LEXICAL_SEARCH_BACKEND")
+    vector_storage: str | None = Field(default=None, description="Dedicated collection profile: int8 | binary (domain default)")
+    vector_oversampling: float | None = Field(default=None, ge=1.0, le=10.0)
+    enable_multi_query: bool = Field(default=False, description="Fuse searches over LLM query variants (one planning call)")
+    multi_query_variants: int | None = Field(default=None, ge=1, le=5, description="Variants per query (default QUERY_PLAN_VARIANTS)")
+    enable_hyde: bool = Field(default=False, description="Also search with a hypothetical answer passage (HyDE)")
 
     # Features
     enable_memory: bool = Field(default=True)
     enable_knowledge_graph: bool = Field(default=False, description="Whether a KG has been built for this bot")
+    semantic_cache: bool = Field(default=True, description="Reuse answers of near-identical earlier questions")
+    semantic_cache_threshold: float | None = Field(default=None, ge=0.5, le=1.0, description="Cosine threshold (default SEMANTIC_CACHE_THRESHOLD)")
 
     # Domain
     domain: str = Field(default="general", description="RAG domain profile: general | education | legal | sales")
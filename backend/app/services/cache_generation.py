@@ -0,0 +1,84 @@
+"""
+Per-bot cache generations: O(1) invalidation of every RAG cache of a bot.
+
+Each bot has a counter `rag:gen:{bot_id}` in Redis, and every bot-scoped cache key
+embeds it (`rag:{kind}:{bot_id}:g{generation}:...`). The caches covered are:
+
+  - semantic answers
+  - retrieval results
+  - rerank scores
+  - knowledge-graph context
+
+Invalidating a bot after an ingest, delete or KG build is a single INCR. From
+then on every worker computes keys under the new generation, and old entries
+are never read again and age out by their TTL. No SCAN, no key enumeration.
+
+A chat turn asks for the generation several times (answer, retrieval, rerank and
+KG caches). Each worker therefore keeps the value for CACHE_GENERATION_LOCAL_TTL,
+so the turn costs at most one GET. A bump is visible at once in the worker that
+made it, and in every other worker within that TTL.
+"""
+import logging
+from typing import Optional
+
+from app.core.config import settings
+from app.db.redis import get_redis, get_sync_redis
+from app.services.cache_service import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class BotCacheGenerations:
+    def __init__(self):
+        self.local = LRUCache(10000, settings.CACHE_GENERATION_LOCAL_TTL)
+
+    @staticmethod
+    def counter(bot_id: str) -> str:
+        return f"rag:gen:{bot_id}"
+
+    async def get(self, bot_id: str) -> int:
+        """Current generation (0 if never invalidated or Redis is down)."""
+        generation = self.local.get(bot_id)
+        if generation is not None:
+            return generation
+        try:
+            generation = int(await get_redis().get(self.counter(bot_id)) or 0)
+        except Exception as e:
+            logger.warning(f"Generation lookup failed for bot {bot_id}: {e}")
+            return 0
+        self.local.set(bot_id, generation)
+        return generation
+
+    def remember(self, bot_id: str, raw: Optional[bytes]) -> int:
+        """Cache a value the caller fetched itself (e.g. in a batched MGET)."""
+        generation = int(raw or 0)
+        self.local.set(bot_id, generation)
+        return generation
+
+    async def bump(self, bot_id: str) -> Optional[int]:
+        """Invalidate every cache of `bot_id`; returns the new generation (None without Redis)."""
+        try:
+            generation = int(await get_redis().incr(self.counter(bot_id)))
+        except Exception as e:
+            logger.error(f"Cache invalidation failed for bot {bot_id}: {e}")
+            return None
+        self.local.set(bot_id, generation)
+        logger.info(f"Bot {bot_id} caches invalidated (generation {generation})")
+        return generation
+
+    def bump_sync(self, bot_id: str) -> Optional[int]:
+        """bump() for synchronous callers (Celery task bodies)."""
+        client = get_sync_redis()
+        if client is None:
+            return None
+        generation = int(client.incr(self.counter(bot_id)))
+        self.local.set(bot_id, generation)
+        logger.info(f"Bot {bot_id} caches invalidated (generation {generation})")
+        return generation
+
+    @staticmethod
+    def key(kind: str, bot_id: str, generation: int, *parts: str) -> str:
+        return ":".join((f"rag:{kind}:{bot_id}:g{generation}",) + parts)
+
+
+bot_cache_generations = BotCacheGenerations()
@@ -1,8 +1,193 @@
-from typing import Optional, Any
+"""
+Cache helpers: the in-process LRU tier and CacheService (Redis, pluggable codecs).
+
+Values are written as a small frame — b"\\x00", codec id, compression id, payload —
+so reads need no codec argument and values written by older code (plain JSON text)
+still decode. Codecs:
+
+  "json"    — stdlib json (always available)
+  "orjson"  — orjson, much faster than stdlib json on large dicts
+  "msgpack" — msgpack, binary and more compact than JSON (default, CACHE_CODEC)
+
+Payloads larger than CACHE_COMPRESS_THRESHOLD bytes are zstd-compressed. Cached
+chat results (retrieved_chunks + agent_logs) are repetitive text and compress well. A codec whose package isn't installed falls back to json, and a missing
+zstandard disables compression; decoding a frame always needs the codec it names.
+
+Benchmark on real payloads: python scripts/benchmark_cache_codecs.py
+"""
+from typing import Optional, Any, Callable, Dict, Hashable, Iterable, List, Tuple
+from collections import OrderedDict
 import json
 import hashlib
+import logging
+import threading
+import time
+from app.core.config import settings
 from app.db.redis import get_redis
 
+logger = logging.getLogger(__name__)
+
+_FRAME_MAGIC = b"\x00"
+_ZSTD = 1
+
+
+def _fallback(obj: Any) -> Any:
+    """Serialize NumPy scalars/arrays as Python numbers; anything else as str (like json default=str)."""
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    return str(obj)
+
+
+class Codec:
+    name = "json"
+    codec_id = 0
+
+    def encode(self, value: Any) -> bytes:
+        return json.dumps(value, default=_fallback, ensure_ascii=False).encode()
+
+    def decode(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(Codec):
+    name = "orjson"
+    codec_id = 1
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    def encode(self, value: Any) -> bytes:
+        return self._orjson.dumps(value, default=_fallback, option=self._orjson.OPT_SERIALIZE_NUMPY)
+
+    def decode(self, data: bytes) -> Any:
+        return self._orjson.loads(data)
+
+
+class MsgpackCodec(Codec):
+    name = "msgpack"
+    codec_id = 2
+
+    def __init__(self):
+        import msgpack
+        self._msgpack = msgpack
+
+    def encode(self, value: Any) -> bytes:
+        return self._msgpack.packb(value, default=_fallback, use_bin_type=True)
+
+    def decode(self, data: bytes) -> Any:
+        return self._msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+_CODEC_TYPES = {c.name: c for c in (Codec, OrjsonCodec, MsgpackCodec)}
+_codecs: Dict[str, Codec] = {}
+_zstd = None
+
+
+def get_codec(name: Optional[str] = None) -> Codec:
+    """Codec by name (default CACHE_CODEC); json if the package for it isn't installed."""
+    name = name or settings.CACHE_CODEC
+    codec = _codecs.get(name)
+    if codec is None:
+        try:
+            codec = _CODEC_TYPES[name]()
+        except ImportError:
+            logger.warning(f"Cache codec '{name}' not installed, using json")
+            codec = Codec()
+        _codecs[name] = codec
+    return codec
+
+
+def _zstandard():
+    global _zstd
+    if _zstd is None:
+        try:
+            import zstandard
+            _zstd = (
+                zstandard.ZstdCompressor(level=settings.CACHE_ZSTD_LEVEL),
+                zstandard.ZstdDecompressor(),
+            )
+        except ImportError:
+            logger.warning("zstandard not installed, cache values are stored uncompressed")
+            _zstd = False
+    return _zstd
+
+
+def encode_value(value: Any, codec: Optional[str] = None, compress: Optional[bool] = None) -> bytes:
+    """
+    Frame `value` for Redis. compress=None → zstd above CACHE_COMPRESS_THRESHOLD bytes;
+    True/False force it on/off.
+    """
+    c = get_codec(codec)
+    payload = c.encode(value)
+    compression = 0
+    if compress is None:
+        compress = len(payload) > settings.CACHE_COMPRESS_THRESHOLD
+    if compress and _zstandard():
+        payload = _zstandard()[0].compress(payload)
+        compression = _ZSTD
+    return _FRAME_MAGIC + bytes((c.codec_id, compression)) + payload
+
+
+def decode_value(data: Optional[bytes]) -> Any:
+    """Inverse of encode_value(); plain JSON (values written before framing) is read as-is."""
+    if data is None:
+        return None
+    if not data.startswith(_FRAME_MAGIC):
+        return json.loads(data)
+    codec_id, compression = data[1], data[2]
+    payload = data[3:]
+    if compression == _ZSTD:
+        zstd = _zstandard()
+        if not zstd:
+            raise RuntimeError("Cache value is zstd-compressed but zstandard is not installed")
+        payload = zstd[1].decompress(payload)
+    name = next(n for n, t in _CODEC_TYPES.items() if t.codec_id == codec_id)
+    return get_codec(name).decode(payload)
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with per-entry TTL — the local tier in front of Redis."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches `predicate`; returns how many were removed."""
+        with self._lock:
+            stale = [k for k in self._data if predicate(k)]
+            for k in stale:
+                del self._data[k]
+            return len(stale)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
 class CacheService:
     def __init__(self):
         pass  # Redis client is accessed via dependency/global
@@ -24,15 +209,32 @@ class CacheService:
     async def get(self, prefix: str, key_data: Any) -> Optional[Any]:
         """Retrieve data from cache."""
         key = self._generate_key(prefix, key_data)
-        data = await self.redis.get(key)
-        if data:
-            return json.loads(data)
-        return None
+        return decode_value(await self.redis.get(key))
 
-    async def set(self, prefix: str, key_data: Any, value: Any, ttl: int = 3600):
-        """Set data in cache with TTL (default 1 hour)."""
+    async def set(
+        self, prefix: str, key_data: Any, value: Any, ttl: int = 3600,
+        codec: Optional[str] = None, compress: Optional[bool] = None,
+    ):
+        """Set data in cache with TTL (default 1 hour). codec: "json" | "orjson" | "msgpack"."""
         key = self._generate_key(prefix, key_data)
-        await self.redis.set(key, json.dumps(value), ex=ttl)
+        await self.redis.set(key, encode_value(value, codec, compress), ex=ttl)
+
+    async def mget(self, prefix: str, key_datas: List[Any]) -> List[Optional[Any]]:
+        """Batch get: one MGET, results in the order of `key_datas` (None for misses)."""
+        if not key_datas:
+            return []
+        values = await self.redis.mget([self._generate_key(prefix, k) for k in key_datas])
+        return [decode_value(v) for v in values]
+
+    async def mset(
+        self, prefix: str, items: Iterable[Tuple[Any, Any]], ttl: int = 3600,
+        codec: Optional[str] = None, compress: Optional[bool] = None,
+    ):
+        """Batch set of (key_data, value) pairs: one pipelined round-trip, every key with `ttl`."""
+        pipe = self.redis.pipeline(transaction=False)
+        for key_data, value in items:
+            pipe.set(self._generate_key(prefix, key_data), encode_value(value, codec, compress), ex=ttl)
+        await pipe.execute()
 
     async def delete(self, prefix: str, key_data: Any):
         """Delete data from cache."""
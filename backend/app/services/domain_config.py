@@ -14,10 +14,15 @@ class DomainProfile:
     chunk_size: int
     chunk_overlap: int
     retrieval_k: int       # number of chunks to retrieve
-    rerank_top_n: int
+    rerank_top_n: int      # survivors of the cheap rerank pass that get a full-length score
+    rerank_pool_size: int  # RRF candidates entering the rerank cascade (2 × retrieval_k; was top_k × 2)
+    rerank_passage_tokens: int  # passage budget (whitespace tokens) for the cheap first pass
     use_lightrag: bool
     system_prompt_suffix: str
     lightrag_mode: Literal["local", "global", "hybrid", "naive"]
+    # Dedicated-collection profile: "binary" keeps 1-bit vectors in RAM, originals on disk
+    vector_storage: Literal["int8", "binary"] = "int8"
+    vector_oversampling: float = 3.0  # binary only: candidates fetched per result before rescoring
 
 
 DOMAIN_PROFILES: dict[str, DomainProfile] = {
@@ -28,6 +33,8 @@ DOMAIN_PROFILES: dict[str, DomainProfile] = {
         chunk_overlap=64,
         retrieval_k=10,
         rerank_top_n=5,
+        rerank_pool_size=20,
+        rerank_passage_tokens=96,
         use_lightrag=False,
         system_prompt_suffix=(
             "\n\nAnswer in a clear, concise manner. "
@@ -42,6 +49,8 @@ DOMAIN_PROFILES: dict[str, DomainProfile] = {
         chunk_overlap=32,
         retrieval_k=12,
         rerank_top_n=6,
+        rerank_pool_size=24,
+        rerank_passage_tokens=96,
         use_lightrag=True,
         system_prompt_suffix=(
             "\n\nYou are an educational assistant. Explain concepts clearly and thoroughly. "
@@ -57,6 +66,8 @@ DOMAIN_PROFILES: dict[str, DomainProfile] = {
         chunk_overlap=128,
         retrieval_k=8,
         rerank_top_n=4,
+        rerank_pool_size=16,
+        rerank_passage_tokens=160,
         use_lightrag=True,
         system_prompt_suffix=(
             "\n\nYou are a legal information assistant. "
@@ -73,6 +84,8 @@ DOMAIN_PROFILES: dict[str, DomainProfile] = {
         chunk_overlap=32,
         retrieval_k=15,
         rerank_top_n=7,
+        rerank_pool_size=30,
+        rerank_passage_tokens=64,
         use_lightrag=False,
         system_prompt_suffix=(
             "\n\nYou are a knowledgeable sales assistant. "
@@ -81,6 +94,8 @@ DOMAIN_PROFILES: dict[str, DomainProfile] = {
             "Always suggest a clear next step or call to action."
         ),
         lightrag_mode="naive",
+        # Product catalogues are the largest corpora — keep dedicated collections compact
+        vector_storage="binary",
     ),
 }
 
@@ -0,0 +1,168 @@
+"""
+Two-tier cache of query embeddings: in-process LRU → Redis.
+
+Chat traffic is dominated by a small set of repeated messages (greetings, FAQs), and
+each one used to cost an embedding API round-trip. Entries are keyed by
+(embedding model, output dimension, normalized text); embeddings don't depend on the
+bot, so every bot and the memory layer share them, and nothing needs invalidating
+when documents change.
+
+Redis values are packed float16 bytes — 3 KB for a 1536-d vector instead of ~30 KB
+of JSON — under `rag:emb:{model_tag}:{text_hash}`. float16 keeps ~3 significant
+digits, far below what changes a cosine ranking.
+
+ChunkEmbeddingCache is the ingest-side counterpart: content-addressed by
+sha256(model + exact enriched chunk text), Redis only (ingest runs in Celery, where
+an LRU would not outlive the task), so re-uploading an edited document or the same
+handbook to several bots only embeds chunks that actually changed.
+"""
+import hashlib
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.core.config import settings
+from app.db.redis import get_redis, get_sync_redis
+from app.services.cache_service import LRUCache
+from app.services.local_embedding_service import KNOWN_DIMENSIONS
+from app.services.openrouter_service import NATIVE_EMBEDDING_DIMS
+from app.services.rerank_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+def _pack(vector: Sequence[float]) -> bytes:
+    return np.asarray(vector, dtype=np.float16).tobytes()
+
+
+def _unpack(packed: bytes) -> List[float]:
+    return np.frombuffer(packed, dtype=np.float16).astype(np.float32).tolist()
+
+
+class EmbeddingCache:
+    """(model, dim, normalized text) → embedding, shared by every bot in the process."""
+
+    def __init__(self):
+        self.local = LRUCache(settings.EMBED_CACHE_LOCAL_SIZE, settings.EMBED_CACHE_LOCAL_TTL)
+        self.redis_hits = 0
+        self.computed = 0
+
+    @staticmethod
+    def key(model: str, dim: Optional[int], text: str) -> str:
+        # No dimension and a dimension at/above the native size give the same vector
+        # (fit_dimensions leaves it whole), so both are keyed by the native size: Mem0's
+        # embedder (dim=None) and _embed_query (the registered 1536) share entries.
+        native = NATIVE_EMBEDDING_DIMS.get(model) or KNOWN_DIMENSIONS.get(model)
+        if native and (not dim or dim >= native):
+            dim = native
+        model_tag = hashlib.md5(f"{model}|{dim or 0}".encode()).hexdigest()[:8]
+        return f"rag:emb:{model_tag}:{hashlib.md5(normalize_query(text).encode()).hexdigest()}"
+
+    def remember(self, key: str, packed: Optional[bytes]) -> Optional[List[float]]:
+        """Decode a value the caller fetched from Redis (e.g. in a batched MGET) into the local tier."""
+        if not packed:
+            return None
+        vector = _unpack(packed)
+        self.local.set(key, vector)
+        self.redis_hits += 1
+        return vector
+
+    async def aset(self, key: str, vector: List[float]):
+        self.local.set(key, vector)
+        try:
+            await get_redis().set(key, _pack(vector), ex=settings.EMBED_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Embedding cache write failed (non-critical): {e}")
+
+    async def aget_or_compute(
+        self, model: str, dim: Optional[int], text: str, compute: Callable[[], Awaitable[List[float]]]
+    ) -> List[float]:
+        """Cached embedding of `text`, awaiting `compute()` on a miss."""
+        if not settings.EMBED_CACHE_ENABLED:
+            return await compute()
+        key = self.key(model, dim, text)
+        vector = self.local.get(key)
+        if vector is not None:
+            return vector
+        try:
+            vector = self.remember(key, await get_redis().get(key))
+        except Exception as e:
+            logger.warning(f"Embedding cache read failed (treating as miss): {e}")
+        if vector is None:
+            vector = await compute()
+            self.computed += 1
+            await self.aset(key, vector)
+        return vector
+
+    def get_or_compute(
+        self, model: str, dim: Optional[int], text: str, compute: Callable[[], List[float]]
+    ) -> List[float]:
+        """Blocking variant for synchronous callers (Mem0's embedder runs on its own threads)."""
+        if not settings.EMBED_CACHE_ENABLED:
+            return compute()
+        key = self.key(model, dim, text)
+        vector = self.local.get(key)
+        if vector is not None:
+            return vector
+        client = get_sync_redis()
+        if client is not None:
+            try:
+                vector = self.remember(key, client.get(key))
+            except Exception as e:
+                logger.warning(f"Embedding cache read failed (treating as miss): {e}")
+        if vector is None:
+            vector = compute()
+            self.computed += 1
+            self.local.set(key, vector)
+            if client is not None:
+                try:
+                    client.set(key, _pack(vector), ex=settings.EMBED_CACHE_TTL)
+                except Exception as e:
+                    logger.warning(f"Embedding cache write failed (non-critical): {e}")
+        return vector
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.local.hits + self.local.misses
+        hits = self.local.hits + self.redis_hits
+        return {
+            "lookups": lookups,
+            "local_hits": self.local.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.computed,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "local_entries": len(self.local),
+        }
+
+
+class ChunkEmbeddingCache:
+    """sha256(model + enriched chunk text) → native embedding, batched with MGET / pipelined SET."""
+
+    @staticmethod
+    def _key(model: str, text: str) -> str:
+        return "rag:chunkemb:" + hashlib.sha256((model + "\n" + text).encode()).hexdigest()
+
+    async def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        if not texts or not settings.EMBED_CACHE_ENABLED:
+            return [None] * len(texts)
+        try:
+            values = await get_redis().mget([self._key(model, t) for t in texts])
+        except Exception as e:
+            logger.warning(f"Chunk embedding cache read failed (embedding everything): {e}")
+            return [None] * len(texts)
+        return [_unpack(v) if v else None for v in values]
+
+    async def set_many(self, model: str, vectors: Dict[str, List[float]]):
+        if not vectors or not settings.EMBED_CACHE_ENABLED:
+            return
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for text, vector in vectors.items():
+                pipe.set(self._key(model, text), _pack(vector), ex=settings.CHUNK_EMBED_CACHE_TTL)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Chunk embedding cache write failed (non-critical): {e}")
+
+
+embedding_cache = EmbeddingCache()
+chunk_embedding_cache = ChunkEmbeddingCache()
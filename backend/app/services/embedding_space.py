@@ -0,0 +1,122 @@
+"""
+Embedding space of stored vectors: Matryoshka truncation + per-collection registry.
+
+text-embedding-3-* (and other Matryoshka-trained models) front-load information in
+the leading dimensions, so keeping the first N dims and L2-renormalizing gives a
+much smaller vector at a small recall cost. EMBEDDING_DIMENSIONS sets N (0 = native);
+`fit_dimensions` is applied to BOTH ingest and query embeddings so they always live
+in the same space.
+
+Every chunk collection has an entry in a payload-only registry collection recording
+which model and dimension its vectors were written with. Ingest checks the entry
+and refuses (EmbeddingSpaceMismatch) to write vectors from a different space —
+instead of the old behaviour of deleting and recreating the collection.
+
+Shared collections are named per embedding space (collection_name_for), so data
+embedded by the API and by the local model (USE_LOCAL_EMBEDDINGS), or at different
+dimensions, coexists in one Qdrant. A bot is served from whichever registered
+collection holds its chunks, and its queries are embedded with the model that
+collection is registered with.
+"""
+import hashlib
+import logging
+import re
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.models import PointStruct
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_COLLECTION_NAME = "omnirag_collection_registry"
+LEGACY_COLLECTION_NAME = "omnirag_openrouter_collection"
+
+
+class EmbeddingSpaceMismatch(RuntimeError):
+    """Vectors about to be written don't match the space the collection was built with."""
+
+
+def fit_dimensions(embeddings: Sequence[Sequence[float]], dim: Optional[int] = None) -> List[List[float]]:
+    """Truncate embeddings to `dim` (default EMBEDDING_DIMENSIONS) and L2-renormalize."""
+    dim = dim if dim is not None else settings.EMBEDDING_DIMENSIONS
+    if not dim or not len(embeddings) or len(embeddings[0]) <= dim:
+        return [list(e) for e in embeddings]
+    matrix = np.asarray(embeddings, dtype=np.float32)[:, :dim]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return (matrix / np.maximum(norms, 1e-12)).tolist()
+
+
+def collection_name_for(model: str, dim: int, native: bool) -> str:
+    """
+    Shared chunk collection for an embedding space. Full-size API vectors keep the
+    historical name; local models and truncated vectors get omnirag_{model}_d{dim}.
+    """
+    if native and model != settings.LOCAL_EMBEDDING_MODEL:
+        return LEGACY_COLLECTION_NAME
+    slug = re.sub(r"[^a-z0-9]+", "_", model.lower()).strip("_")
+    return f"omnirag_{slug}_d{dim}"
+
+
+def _registry_id(collection: str) -> str:
+    return str(uuid.UUID(hashlib.md5(collection.encode()).hexdigest()))
+
+
+def ensure_registry(client: QdrantClient) -> None:
+    if not client.collection_exists(REGISTRY_COLLECTION_NAME):
+        client.create_collection(collection_name=REGISTRY_COLLECTION_NAME, vectors_config={})
+
+
+def read_space(client: QdrantClient, collection: str) -> Optional[Dict]:
+    records = client.retrieve(
+        collection_name=REGISTRY_COLLECTION_NAME, ids=[_registry_id(collection)], with_vectors=False
+    )
+    return records[0].payload if records else None
+
+
+def list_spaces(client: QdrantClient) -> List[Dict]:
+    """Every registered space (one entry per chunk collection)."""
+    records, _ = client.scroll(
+        collection_name=REGISTRY_COLLECTION_NAME, limit=1000, with_payload=True, with_vectors=False
+    )
+    return [r.payload for r in records]
+
+
+async def alist_spaces(client: AsyncQdrantClient) -> List[Dict]:
+    """Async twin of list_spaces for the retrieval path."""
+    records, _ = await client.scroll(
+        collection_name=REGISTRY_COLLECTION_NAME, limit=1000, with_payload=True, with_vectors=False
+    )
+    return [r.payload for r in records]
+
+
+def record_space(client: QdrantClient, collection: str, model: str, dim: int) -> Dict:
+    """Write the registry entry for `collection` (called when it is created)."""
+    space = {
+        "collection": collection,
+        "embedding_model": model,
+        "embedding_dim": dim,
+        "truncated": bool(settings.EMBEDDING_DIMENSIONS),
+        "recorded_at": datetime.utcnow().isoformat(),
+    }
+    client.upsert(
+        collection_name=REGISTRY_COLLECTION_NAME,
+        points=[PointStruct(id=_registry_id(collection), vector={}, payload=space)],
+    )
+    return space
+
+
+def check_space(space: Dict, collection: str, model: str, dim: int) -> None:
+    """Raise EmbeddingSpaceMismatch unless (model, dim) matches the registered space."""
+    if space["embedding_dim"] == dim and space["embedding_model"] == model:
+        return
+    raise EmbeddingSpaceMismatch(
+        f"Collection '{collection}' holds {space['embedding_dim']}-d vectors from "
+        f"{space['embedding_model']}, but this worker produces {dim}-d vectors from {model}. "
+        f"Nothing was written. Restore OPENROUTER_EMBEDDING_MODEL / EMBEDDING_DIMENSIONS, or "
+        f"re-ingest into a new collection."
+    )
@@ -0,0 +1,174 @@
+"""
+User / bot snapshots for the authenticated request hot path.
+
+A chat turn used to cost two synchronous Postgres round-trips before any RAG work:
+`get_current_user` loads the User row from the JWT subject, and `get_current_bot`
+then loads the Bot row. Both rows change rarely, so the snapshot dependencies in
+`app.api.deps` read them from two tiers instead:
+
+  - an in-process LRU (AUTH_CACHE_LOCAL_TTL), which serves repeated turns of the same
+    user and bot without any I/O
+  - Redis `auth:user:{id}` / `auth:bot:{id}` (AUTH_CACHE_TTL), shared by all workers
+
+Only a miss in both tiers falls through to Postgres. Any write to a user or bot
+(profile update, bot update/delete, channel connect → `bot.config`) calls
+`invalidate_*`. That deletes the Redis key and publishes the id on `auth:invalidate`,
+and every API worker drops its local copy as soon as the message arrives. The local
+TTL only bounds staleness if a worker misses a message, e.g. while Redis reconnects.
+
+Snapshots hold what authorization and the chat pipeline read: ids, tenant, active
+flag and `bot.config`. They hold no password hash and no API key. Endpoints that
+modify the row keep using the ORM dependencies.
+"""
+import asyncio
+import copy
+import logging
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from app.core.config import settings
+from app.db.redis import get_redis, get_sync_redis
+from app.services.cache_service import LRUCache, decode_value, encode_value
+
+logger = logging.getLogger(__name__)
+
+INVALIDATE_CHANNEL = "auth:invalidate"
+
+
+@dataclass
+class UserSnapshot:
+    id: UUID
+    tenant_id: UUID
+    email: str
+    full_name: Optional[str] = None
+    role: Optional[str] = None
+    is_active: bool = True
+
+    @classmethod
+    def from_orm(cls, user) -> "UserSnapshot":
+        return cls(
+            id=user.id, tenant_id=user.tenant_id, email=user.email,
+            full_name=user.full_name, role=user.role, is_active=user.is_active,
+        )
+
+
+@dataclass
+class BotSnapshot:
+    id: UUID
+    tenant_id: UUID
+    name: str
+    description: Optional[str] = None
+    avatar_url: Optional[str] = None
+    config: Dict[str, Any] = field(default_factory=dict)
+    is_active: bool = True
+
+    @classmethod
+    def from_orm(cls, bot) -> "BotSnapshot":
+        return cls(
+            id=bot.id, tenant_id=bot.tenant_id, name=bot.name,
+            description=bot.description, avatar_url=bot.avatar_url,
+            config=copy.deepcopy(bot.config or {}), is_active=bot.is_active,
+        )
+
+
+_SNAPSHOTS = {"user": UserSnapshot, "bot": BotSnapshot}
+
+
+def _dump(snapshot) -> bytes:
+    data = asdict(snapshot)
+    data["id"], data["tenant_id"] = str(snapshot.id), str(snapshot.tenant_id)
+    return encode_value(data)
+
+
+def _load(kind: str, raw: bytes):
+    data = decode_value(raw)
+    data["id"], data["tenant_id"] = UUID(data["id"]), UUID(data["tenant_id"])
+    return _SNAPSHOTS[kind](**data)
+
+
+class IdentityCache:
+    def __init__(self):
+        self.local = LRUCache(10000, settings.AUTH_CACHE_LOCAL_TTL)
+
+    @staticmethod
+    def key(kind: str, entity_id) -> str:
+        return f"auth:{kind}:{entity_id}"
+
+    async def get(self, kind: str, entity_id) -> Optional[Any]:
+        """Snapshot of a user/bot, or None on a miss. Callers get their own copy."""
+        key = self.key(kind, entity_id)
+        snapshot = self.local.get(key)
+        if snapshot is None and settings.AUTH_CACHE_TTL > 0:
+            try:
+                raw = await get_redis().get(key)
+                if raw is not None:
+                    snapshot = _load(kind, raw)
+                    self.local.set(key, snapshot)
+            except Exception as e:
+                logger.warning(f"Identity cache read failed for {key}: {e}")
+        # chat endpoints annotate bot.config per request; never hand out the shared object
+        return copy.deepcopy(snapshot)
+
+    async def put(self, kind: str, snapshot):
+        key = self.key(kind, snapshot.id)
+        self.local.set(key, copy.deepcopy(snapshot))
+        if settings.AUTH_CACHE_TTL <= 0:
+            return
+        try:
+            await get_redis().set(key, _dump(snapshot), ex=settings.AUTH_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Identity cache write failed for {key}: {e}")
+
+    async def invalidate(self, kind: str, entity_id):
+        """Drop a user/bot snapshot everywhere; call after committing a change to the row."""
+        key = self.key(kind, entity_id)
+        self.local.discard_where(lambda k: k == key)
+        try:
+            redis = get_redis()
+            await redis.delete(key)
+            await redis.publish(INVALIDATE_CHANNEL, key)
+        except Exception as e:
+            logger.error(f"Identity cache invalidation failed for {key}: {e}")
+
+    def invalidate_sync(self, kind: str, entity_id):
+        """invalidate() for synchronous endpoints."""
+        key = self.key(kind, entity_id)
+        self.local.discard_where(lambda k: k == key)
+        client = get_sync_redis()
+        if client is None:
+            return
+        try:
+            client.delete(key)
+            client.publish(INVALIDATE_CHANNEL, key)
+        except Exception as e:
+            logger.error(f"Identity cache invalidation failed for {key}: {e}")
+
+    async def listen(self):
+        """Drop local snapshots invalidated by other workers. Runs for the app's lifetime."""
+        while True:
+            pubsub = None
+            try:
+                pubsub = get_redis().pubsub()
+                await pubsub.subscribe(INVALIDATE_CHANNEL)
+                # The subscription may have missed messages while it was down
+                self.local.discard_where(lambda k: True)
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None:
+                        key = message["data"].decode()
+                        self.local.discard_where(lambda k: k == key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Identity cache subscriber reconnecting: {e}")
+                await asyncio.sleep(1.0)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+
+
+identity_cache = IdentityCache()
@@ -0,0 +1,248 @@
+"""
+Per-bot in-process BM25 lexical index.
+
+Alternative lexical leg for bots whose Qdrant points predate the BM25 sparse
+vector (see sparse_encoder.py) and cannot be re-ingested. Instead of the unranked
+MatchText scroll, `_hybrid_search` ranks chunks here and fetches only the top
+point ids from Qdrant.
+
+Layout (all NumPy, no Python objects per posting):
+  - forward index, CSR by document: term ids + term frequencies per chunk
+    (kept so documents can be added/removed without re-tokenizing the corpus)
+  - inverted index, CSR by term: doc ids + precomputed BM25 TF weights,
+    rebuilt from the forward index with one argsort on every update
+Scoring a query is a bincount over the postings of its terms — sub-millisecond
+for typical bots.
+
+Persistence mirrors LightRAG's per-bot working dirs under ./rag_storage: Celery
+workers update the .npz on ingest, API workers reload it when its mtime changes.
+"""
+import fcntl
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.vi_tokenizer import tokenize_document, tokenize_query
+
+logger = logging.getLogger(__name__)
+
+
+class BM25Index:
+    """Compact BM25 inverted index over the chunks of one bot."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.terms: List[str] = []
+        self.vocab: Dict[str, int] = {}
+        self.point_ids: List[str] = []
+        self.sources: List[str] = []
+        self.doc_lens = np.zeros(0, dtype=np.int32)
+        self.fwd_indptr = np.zeros(1, dtype=np.int64)
+        self.fwd_terms = np.zeros(0, dtype=np.int32)
+        self.fwd_tfs = np.zeros(0, dtype=np.uint16)
+        self._rebuild_inverted()
+
+    def __len__(self) -> int:
+        return len(self.point_ids)
+
+    # ─── Updates ──────────────────────────────────────────────────────────
+
+    def add_documents(self, point_ids: List[str], sources: List[str], texts: List[str]):
+        """Index chunks; chunks whose point id is already indexed are replaced."""
+        incoming = set(point_ids)
+        if incoming.intersection(self.point_ids):
+            self._keep_docs(np.array([pid not in incoming for pid in self.point_ids], dtype=bool))
+
+        rows_terms, rows_tfs, lens = [], [], []
+        for text in texts:
+            tokens = tokenize_document(text)
+            ids, tfs = np.unique(
+                np.fromiter((self._term_id(t) for t in tokens), dtype=np.int32, count=len(tokens)),
+                return_counts=True,
+            )
+            rows_terms.append(ids)
+            rows_tfs.append(np.minimum(tfs, np.iinfo(np.uint16).max).astype(np.uint16))
+            lens.append(len(tokens))
+
+        row_sizes = np.array([len(r) for r in rows_terms], dtype=np.int64)
+        self.fwd_indptr = np.concatenate([self.fwd_indptr, self.fwd_indptr[-1] + np.cumsum(row_sizes)])
+        self.fwd_terms = np.concatenate([self.fwd_terms, *rows_terms]) if rows_terms else self.fwd_terms
+        self.fwd_tfs = np.concatenate([self.fwd_tfs, *rows_tfs]) if rows_tfs else self.fwd_tfs
+        self.doc_lens = np.concatenate([self.doc_lens, np.array(lens, dtype=np.int32)])
+        self.point_ids.extend(point_ids)
+        self.sources.extend(sources)
+        self._rebuild_inverted()
+
+    def remove_source(self, source: str) -> int:
+        """Drop every chunk ingested from `source`; returns the number removed."""
+        keep = np.array([s != source for s in self.sources], dtype=bool)
+        removed = int((~keep).sum())
+        if removed:
+            self._keep_docs(keep)
+            self._rebuild_inverted()
+        return removed
+
+    def _term_id(self, term: str) -> int:
+        tid = self.vocab.get(term)
+        if tid is None:
+            tid = len(self.terms)
+            self.vocab[term] = tid
+            self.terms.append(term)
+        return tid
+
+    def _keep_docs(self, keep: np.ndarray):
+        """Compact the forward index to the documents where keep is True."""
+        row_sizes = np.diff(self.fwd_indptr)
+        entry_mask = np.repeat(keep, row_sizes)
+        self.fwd_terms = self.fwd_terms[entry_mask]
+        self.fwd_tfs = self.fwd_tfs[entry_mask]
+        self.fwd_indptr = np.concatenate([[0], np.cumsum(row_sizes[keep])]).astype(np.int64)
+        self.doc_lens = self.doc_lens[keep]
+        self.point_ids = [p for p, k in zip(self.point_ids, keep) if k]
+        self.sources = [s for s, k in zip(self.sources, keep) if k]
+
+    def _rebuild_inverted(self):
+        """Derive term-major postings with precomputed BM25 TF weights and per-term IDF."""
+        n_docs, n_terms = len(self.point_ids), len(self.terms)
+        doc_of_entry = np.repeat(np.arange(n_docs, dtype=np.int32), np.diff(self.fwd_indptr))
+        order = np.argsort(self.fwd_terms, kind="stable")
+        self.inv_docs = doc_of_entry[order]
+        df = np.bincount(self.fwd_terms, minlength=n_terms)
+        self.inv_indptr = np.concatenate([[0], np.cumsum(df)]).astype(np.int64)
+
+        tfs = self.fwd_tfs[order].astype(np.float32)
+        avgdl = float(self.doc_lens.mean()) if n_docs else 1.0
+        dl = self.doc_lens[self.inv_docs].astype(np.float32)
+        self.inv_weights = tfs * (self.k1 + 1) / (tfs + self.k1 * (1 - self.b + self.b * dl / avgdl))
+        self.idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+    # ─── Query ────────────────────────────────────────────────────────────
+
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float]]:
+        """Return up to top_k (point_id, bm25_score) pairs, best first."""
+        term_ids = np.array(
+            sorted({self.vocab[t] for t in tokenize_query(query) if t in self.vocab}), dtype=np.int64
+        )
+        if not len(term_ids) or not len(self.point_ids):
+            return []
+        starts, ends = self.inv_indptr[term_ids], self.inv_indptr[term_ids + 1]
+        lengths = ends - starts
+        # Flattened posting positions for all query terms without a Python loop per posting
+        positions = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths) + np.arange(lengths.sum())
+        weights = self.inv_weights[positions] * np.repeat(self.idf[term_ids], lengths)
+        scores = np.bincount(self.inv_docs[positions], weights=weights, minlength=len(self.point_ids))
+
+        hits = int(np.count_nonzero(scores))
+        k = min(top_k, hits)
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.point_ids[i], float(scores[i])) for i in top]
+
+    # ─── Persistence ──────────────────────────────────────────────────────
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            terms=np.array(self.terms, dtype=str),
+            point_ids=np.array(self.point_ids, dtype=str),
+            sources=np.array(self.sources, dtype=str),
+            doc_lens=self.doc_lens,
+            fwd_indptr=self.fwd_indptr,
+            fwd_terms=self.fwd_terms,
+            fwd_tfs=self.fwd_tfs,
+        )
+        os.replace(tmp_path, path)  # atomic — readers never see a half-written index
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        index = cls()
+        with np.load(path, allow_pickle=False) as data:
+            index.terms = data["terms"].tolist()
+            index.vocab = {t: i for i, t in enumerate(index.terms)}
+            index.point_ids = data["point_ids"].tolist()
+            index.sources = data["sources"].tolist()
+            index.doc_lens = data["doc_lens"]
+            index.fwd_indptr = data["fwd_indptr"]
+            index.fwd_terms = data["fwd_terms"]
+            index.fwd_tfs = data["fwd_tfs"]
+        index._rebuild_inverted()
+        return index
+
+
+class LexicalIndexStore:
+    """
+    Per-bot BM25 indexes persisted under settings.LEXICAL_INDEX_DIR.
+
+    Updates (Celery ingest, API deletes) take an exclusive flock, re-read the file,
+    apply the change and atomically replace it. Readers keep the loaded index in
+    memory and reload only when the file's mtime changes.
+    """
+
+    def __init__(self, base_dir: Optional[str] = None):
+        self.base_dir = base_dir or settings.LEXICAL_INDEX_DIR
+        self._loaded: Dict[str, Tuple[float, BM25Index]] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, bot_id: str) -> str:
+        return os.path.join(self.base_dir, f"bm25_{bot_id}.npz")
+
+    def exists(self, bot_id: str) -> bool:
+        return os.path.exists(self._path(bot_id))
+
+    def get(self, bot_id: str) -> Optional[BM25Index]:
+        """Return the bot's index (reloading if another process updated it), or None."""
+        path = self._path(bot_id)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            self._loaded.pop(bot_id, None)
+            return None
+        cached = self._loaded.get(bot_id)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with self._lock:
+            index = BM25Index.load(path)
+            self._loaded[bot_id] = (mtime, index)
+        return index
+
+    @contextmanager
+    def _locked(self, bot_id: str):
+        os.makedirs(self.base_dir, exist_ok=True)
+        with open(f"{self._path(bot_id)}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def update(self, bot_id: str, mutate: Callable[[BM25Index], None], create: bool = False):
+        """Apply `mutate` to the bot's on-disk index. No-op if it doesn't exist and create=False."""
+        path = self._path(bot_id)
+        with self._locked(bot_id):
+            if os.path.exists(path):
+                index = BM25Index.load(path)
+            elif create:
+                index = BM25Index()
+            else:
+                return
+            mutate(index)
+            index.save(path)
+            self._loaded[bot_id] = (os.stat(path).st_mtime, index)
+
+    def add_documents(self, bot_id: str, point_ids: List[str], sources: List[str], texts: List[str], create: bool = False):
+        self.update(bot_id, lambda idx: idx.add_documents(point_ids, sources, texts), create=create)
+
+    def remove_source(self, bot_id: str, source: str):
+        self.update(bot_id, lambda idx: idx.remove_source(source))
+
+
+lexical_index_store = LexicalIndexStore()
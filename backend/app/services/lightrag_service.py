@@ -6,7 +6,6 @@ from typing import List, Dict, Any, Optional
 
 from lightrag import LightRAG, QueryParam
 from lightrag.utils import EmbeddingFunc
-from lightrag.llm.openai import openai_complete
 from app.core.config import settings
 from app.services.openrouter_service import get_openrouter_service
 
@@ -19,11 +18,37 @@ logger = logging.getLogger(__name__)
 #   openai/gpt-4o-mini                   → reliable, cheap
 #   meta-llama/llama-3.1-8b-instruct     → free tier available
 LIGHTRAG_LLM_MODEL    = os.getenv("LIGHTRAG_LLM_MODEL", "openai/gpt-5.4-nano")
-LIGHTRAG_OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+
+async def _global_llm_func(
+    prompt: str,
+    system_prompt: Optional[str] = None,
+    history_messages: Optional[List[Dict[str, str]]] = None,
+    keyword_extraction: bool = False,
+    **kwargs,
+) -> str:
+    """
+    LLM function for LightRAG (extraction, keywords, KG answers) → OpenRouter on the
+    shared per-loop async client, instead of a new OpenAI client per call.
+    """
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.extend(history_messages or [])
+    messages.append({"role": "user", "content": prompt})
+
+    params = {k: kwargs[k] for k in ("temperature", "max_tokens") if kwargs.get(k) is not None}
+    if keyword_extraction:
+        params["response_format"] = {"type": "json_object"}
+    response = await get_openrouter_service().achat_completion(
+        messages=messages, model=LIGHTRAG_LLM_MODEL, **params
+    )
+    return response["content"] or ""
 
 async def _global_embedding_func(texts: list[str]) -> np.ndarray:
     """
-    Embedding function for LightRAG → OpenRouter (async).
+    Embedding function for LightRAG → OpenRouter (async), or the in-process local
+    model when USE_LOCAL_EMBEDDINGS=True (embed_batch_async routes it).
     Gọi thẳng embed_batch_async() thay vì wrap qua asyncio.to_thread,
     vì đang chạy trong async context của LightRAG's event loop.
     """
@@ -31,7 +56,7 @@ async def _global_embedding_func(texts: list[str]) -> np.ndarray:
     openrouter = get_openrouter_service()
     if not texts:
         return np.array([])
-    logger.info(f"[LightRAG Embed] {len(texts)} texts → OpenRouter (async)")
+    logger.info(f"[LightRAG Embed] {len(texts)} texts → {openrouter.embedding_model} (async)")
     try:
         embeddings = await openrouter.embed_batch_async(texts)
         return np.array(embeddings)
@@ -67,7 +92,8 @@ class LightRAGService:
     """
     Wrapper for LightRAG Core.
     - Entity/relationship extraction → OpenRouter API (fast, cheap)
-    - Embeddings → OpenRouter (text-embedding-3-small, dim=1536)
+    - Embeddings → the configured embedding model (OpenRouter text-embedding-3-small,
+      dim=1536, or LOCAL_EMBEDDING_MODEL); its name + dim pick LightRAG's Qdrant collections
     """
 
     def __init__(self, bot_id: str = "default_bot"):
@@ -80,6 +106,10 @@ class LightRAGService:
             
         logger.info(f"Initializing LightRAG [{LIGHTRAG_LLM_MODEL} via OpenRouter] → {self.working_dir}")
 
+        openrouter = get_openrouter_service()
+        embedding_model = openrouter.embedding_model.split("/")[-1]  # "text-embedding-3-small" as before
+        embedding_dim = openrouter.embedding_dim_for()
+
         self.rag = LightRAG(
             working_dir=self.working_dir,
             workspace=bot_id,  # per-bot isolation trong Qdrant collection
@@ -94,12 +124,7 @@ class LightRAGService:
 
             # ── LLM: OpenRouter (entity extraction) ──────────────────────────
             llm_model_name=LIGHTRAG_LLM_MODEL,
-            llm_model_func=openai_complete,
-            llm_model_kwargs={
-                "base_url": LIGHTRAG_OPENROUTER_BASE_URL,
-                "api_key": settings.OPENROUTER_API_KEY,
-                "timeout": 120,
-            },
+            llm_model_func=_global_llm_func,  # timeouts: OPENROUTER_CONNECT/READ_TIMEOUT
 
             # ── Extraction tuning ─────────────────────────────────────────────
             entity_extract_max_gleaning=0,  # single-pass, saves ~50% calls
@@ -113,11 +138,11 @@ class LightRAGService:
             # ── Tokenizer for chunking (independent of inference model) ──────
             tokenizer=OmniRAGTokenizer("gpt-4"),
 
-            # ── Embeddings: keep OpenRouter for dim=1536 consistency ─────────
+            # ── Embeddings: same model as chunk retrieval, at its native dim ──
             embedding_func=EmbeddingFunc(
-                embedding_dim=1536,
+                embedding_dim=embedding_dim,
                 max_token_size=8192,
-                model_name="text-embedding-3-small",  # Required for proper Qdrant collection naming
+                model_name=embedding_model,  # Required for proper Qdrant collection naming
                 func=_global_embedding_func
             ),
         )
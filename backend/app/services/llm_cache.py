@@ -0,0 +1,103 @@
+"""
+Memoized internal LLM calls (INTERNAL_LLM_MODEL): query rewrite / plan, CRAG,
+session titles and contextual prefixes.
+
+These prompts run at low temperature and the same questions recur all day, so a
+repeated question skips one or two internal round-trips before the answer starts.
+
+Key: sha256 of (model, messages, call params), in one of two scopes:
+
+  - `rag:llm:{digest}` — global: rewrite, plan, titles, prefixes depend only on the prompt
+  - `rag:llm:{bot_id}:g{gen}:{digest}` — bot-scoped: a CRAG verdict judges the bot's
+    chunks, so it is retired with the bot's cache generation (see cache_generation)
+
+Two tiers, like the rerank cache: in-process LRU → Redis (LLM_CACHE_TTL). Only
+successful calls whose content the caller accepts are stored; failures and
+unusable answers go to the model again next time.
+"""
+import hashlib
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.db.redis import get_redis
+from app.services.cache_generation import bot_cache_generations
+from app.services.cache_service import LRUCache, decode_value, encode_value
+from app.services.openrouter_service import get_openrouter_service
+
+logger = logging.getLogger(__name__)
+
+
+class InternalLLMCache:
+    def __init__(self):
+        self.local = LRUCache(settings.LLM_CACHE_LOCAL_SIZE, settings.LLM_CACHE_LOCAL_TTL)
+
+    @staticmethod
+    def digest(model: str, messages: List[Dict[str, str]], params: Dict[str, Any]) -> str:
+        payload = json.dumps([model, messages, params], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    async def key(self, digest: str, bot_id: Optional[str] = None) -> str:
+        if bot_id is None:
+            return f"rag:llm:{digest}"
+        return bot_cache_generations.key("llm", bot_id, await bot_cache_generations.get(bot_id), digest)
+
+    async def _get(self, key: str) -> Optional[str]:
+        content = self.local.get(key)
+        if content is not None:
+            return content
+        try:
+            content = decode_value(await get_redis().get(key))
+        except Exception as e:
+            logger.warning(f"LLM cache read failed (treating as miss): {e}")
+            return None
+        if content is not None:
+            self.local.set(key, content)
+        return content
+
+    async def _set(self, key: str, content: str, ttl: int):
+        self.local.set(key, content)
+        try:
+            await get_redis().set(key, encode_value(content), ex=ttl)
+        except Exception as e:
+            logger.warning(f"LLM cache write failed (non-critical): {e}")
+
+    async def achat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        response_format: Optional[Dict[str, str]] = None,
+        bot_id: Optional[str] = None,
+        ttl: Optional[int] = None,
+        accept: Optional[Callable[[str], bool]] = None,
+    ) -> Dict[str, Any]:
+        """
+        OpenRouterService.achat_completion, memoized. A hit returns
+        {"content", "model", "cached": True}; a miss returns the live response.
+
+        bot_id: scope the entry to the bot's cache generation.
+        ttl: seconds (default LLM_CACHE_TTL, 0 disables).
+        accept: store only content this predicate approves (e.g. a valid verdict).
+        """
+        ttl = settings.LLM_CACHE_TTL if ttl is None else ttl
+        params = {"temperature": temperature, "max_tokens": max_tokens, "response_format": response_format}
+        openrouter = get_openrouter_service()
+        if not ttl:
+            return await openrouter.achat_completion(messages=messages, model=model, **params)
+
+        key = await self.key(self.digest(model, messages, params), bot_id)
+        content = await self._get(key)
+        if content is not None:
+            return {"content": content, "model": model, "cached": True}
+
+        response = await openrouter.achat_completion(messages=messages, model=model, **params)
+        content = response.get("content") or ""
+        if content.strip() and (accept is None or accept(content)):
+            await self._set(key, content, ttl)
+        return response
+
+
+internal_llm_cache = InternalLLMCache()
@@ -0,0 +1,184 @@
+"""
+Local CPU embedding provider (USE_LOCAL_EMBEDDINGS=True).
+
+Replaces the OpenRouter round-trip with in-process inference of
+LOCAL_EMBEDDING_MODEL (a sentence-transformers model):
+
+  LOCAL_EMBEDDING_ENGINE="torch" — sentence-transformers on the best device
+  LOCAL_EMBEDDING_ENGINE="onnx"  — the transformer exported once to ONNX and run on
+                                   onnxruntime (CPU), with the model's own pooling
+                                   (mean / CLS) re-applied in NumPy
+
+Texts are encoded in LOCAL_EMBEDDING_BATCH_SIZE batches (length-sorted, so padding
+stays small) and L2-normalized like the API embeddings. One encode runs at a time
+per process: the runtimes parallelise inside a batch, and LightRAG / Celery fan out
+many concurrent calls that would otherwise oversubscribe the CPU.
+"""
+import json
+import logging
+import os
+import threading
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Output size of common sentence-transformers models, so `dimension` is known without
+# loading the weights; other models are loaded to measure it
+KNOWN_DIMENSIONS = {
+    "sentence-transformers/all-MiniLM-L6-v2": 384,
+    "sentence-transformers/all-MiniLM-L12-v2": 384,
+    "sentence-transformers/all-mpnet-base-v2": 768,
+    "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2": 384,
+    "sentence-transformers/paraphrase-multilingual-mpnet-base-v2": 768,
+    "intfloat/multilingual-e5-small": 384,
+    "intfloat/multilingual-e5-base": 768,
+    "intfloat/multilingual-e5-large": 1024,
+    "BAAI/bge-m3": 1024,
+}
+
+
+class OnnxSentenceEncoder:
+    """onnxruntime build of a sentence-transformers model: transformer + pooling + normalize."""
+
+    MODEL_FILE = "model.onnx"
+
+    def __init__(self, model_dir: str):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_length = min(self.tokenizer.model_max_length, 512)
+        with open(os.path.join(model_dir, "pooling.json")) as f:
+            self.pooling = json.load(f)["mode"]
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, self.MODEL_FILE), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.dimension = self.session.get_outputs()[0].shape[-1]
+
+    def encode(self, texts: Sequence[str], batch_size: int = 64) -> np.ndarray:
+        order = np.argsort([len(t) for t in texts], kind="stable")
+        out = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start + batch_size]
+            encoded = self.tokenizer(
+                [texts[i] for i in idx], padding=True, truncation=True,
+                max_length=self.max_length, return_tensors="np",
+            )
+            feeds = {k: v.astype(np.int64) for k, v in encoded.items() if k in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            if self.pooling == "cls":
+                pooled = hidden[:, 0]
+            else:
+                mask = encoded["attention_mask"][..., None].astype(np.float32)
+                pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            out[idx] = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return out
+
+
+def export_sentence_onnx(model_name: str, out_dir: str) -> None:
+    """Export a sentence-transformers model's transformer to out_dir/model.onnx (+ tokenizer, pooling)."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st_model = SentenceTransformer(model_name, device="cpu", cache_folder=os.getenv("HF_HOME"))
+    transformer, pooling = st_model[0], st_model[1]
+    mode = "cls" if getattr(pooling, "pooling_mode_cls_token", False) else "mean"
+    hf_model, tokenizer = transformer.auto_model.eval(), transformer.tokenizer
+
+    os.makedirs(out_dir, exist_ok=True)
+    sample = tokenizer(["xin chào", "hello world, this is a sample"], padding=True, return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    dynamic_axes = {n: {0: "batch", 1: "sequence"} for n in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            hf_model,
+            ({n: sample[n] for n in input_names},),
+            os.path.join(out_dir, OnnxSentenceEncoder.MODEL_FILE),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            do_constant_folding=True,
+        )
+    tokenizer.save_pretrained(out_dir)
+    with open(os.path.join(out_dir, "pooling.json"), "w") as f:
+        json.dump({"model": model_name, "mode": mode}, f)
+    logger.info(f"Exported {model_name} to ONNX at {out_dir} (pooling={mode})")
+
+
+class LocalEmbeddingProvider:
+    """Lazily loaded local embedding model with a thread-safe batched encode."""
+
+    def __init__(self, model_name: Optional[str] = None, engine: Optional[str] = None):
+        self.model_name = model_name or settings.LOCAL_EMBEDDING_MODEL
+        self.engine = engine or settings.LOCAL_EMBEDDING_ENGINE
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self.engine == "onnx":
+            model_dir = os.path.join(settings.LOCAL_EMBEDDING_ONNX_DIR, self.model_name.replace("/", "__"))
+            try:
+                if not os.path.exists(os.path.join(model_dir, "pooling.json")):
+                    export_sentence_onnx(self.model_name, model_dir)
+                print(f"[Embeddings] Loading ONNX {self.model_name} on CPU...", flush=True)
+                return OnnxSentenceEncoder(model_dir)
+            except Exception as e:
+                logger.warning(f"ONNX embedding model unavailable ({e}); falling back to torch")
+
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        print(f"[Embeddings] Loading {self.model_name} on {device.upper()}...", flush=True)
+        return SentenceTransformer(self.model_name, device=device, cache_folder=os.getenv("HF_HOME"))
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load()
+        return self._model
+
+    @property
+    def dimension(self) -> int:
+        if self._model is None and self.model_name in KNOWN_DIMENSIONS:
+            return KNOWN_DIMENSIONS[self.model_name]
+        model = self.model
+        if isinstance(model, OnnxSentenceEncoder):
+            return model.dimension
+        return model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: Sequence[str], batch_size: Optional[int] = None) -> List[List[float]]:
+        if not texts:
+            return []
+        batch_size = batch_size or settings.LOCAL_EMBEDDING_BATCH_SIZE
+        model = self.model
+        with self._lock:
+            if isinstance(model, OnnxSentenceEncoder):
+                vectors = model.encode(list(texts), batch_size=batch_size)
+            else:
+                vectors = model.encode(
+                    list(texts), batch_size=batch_size, normalize_embeddings=True,
+                    convert_to_numpy=True, show_progress_bar=False,
+                )
+        return vectors.tolist()
+
+
+_local_embedding_provider: Optional[LocalEmbeddingProvider] = None
+
+
+def get_local_embedding_provider() -> LocalEmbeddingProvider:
+    global _local_embedding_provider
+    if _local_embedding_provider is None:
+        _local_embedding_provider = LocalEmbeddingProvider()
+    return _local_embedding_provider
@@ -32,6 +32,7 @@ class MemoryService:
     def __init__(self):
         self._mem0 = None
         self._enabled = False
+        self._embedding_model = None
         self._initialize()
 
     def _initialize(self):
@@ -78,6 +79,8 @@ class MemoryService:
             }
 
             self._mem0 = Memory.from_config(config)
+            self._embedding_model = settings.OPENROUTER_EMBEDDING_MODEL
+            self._cache_embeddings(self._embedding_model)
             self._enabled = True
             logger.info("✅ Mem0 MemoryService initialized successfully (Qdrant backend)")
 
@@ -86,6 +89,41 @@ class MemoryService:
         except Exception as e:
             logger.warning(f"⚠️ Mem0 init failed — memory disabled (bot still works): {e}")
 
+    def _cache_embeddings(self, model: str):
+        """Route Mem0's embedder through the shared query-embedding cache (see embedding_cache.py)."""
+        from app.services.embedding_cache import embedding_cache
+
+        embedder = self._mem0.embedding_model
+        embed = embedder.embed
+
+        def cached_embed(text, *args, **kwargs):
+            if not isinstance(text, str):
+                return embed(text, *args, **kwargs)
+            return embedding_cache.get_or_compute(model, None, text, lambda: embed(text, *args, **kwargs))
+
+        embedder.embed = cached_embed
+
+    async def _prefetch_embedding(self, text: str):
+        """
+        Embed `text` on the shared async OpenRouter client and put it in the embedding
+        cache, so Mem0's embedder (on a worker thread) finds it instead of making its
+        own HTTP call. The thread then only does the Qdrant search.
+        """
+        from app.core.config import settings
+        from app.services.embedding_cache import embedding_cache
+        from app.services.openrouter_service import get_openrouter_service
+
+        if not settings.EMBED_CACHE_ENABLED:
+            return
+        try:
+            # Mem0's OpenAI embedder flattens newlines before embedding
+            await embedding_cache.aget_or_compute(
+                self._embedding_model, None, text,
+                lambda: get_openrouter_service().aembed(text.replace("\n", " "), model=self._embedding_model),
+            )
+        except Exception as e:
+            logger.debug(f"[Memory] embedding prefetch failed, Mem0 will embed itself: {e}")
+
     @property
     def is_enabled(self) -> bool:
         return self._enabled and self._mem0 is not None
@@ -116,6 +154,7 @@ class MemoryService:
             return []
 
         try:
+            await self._prefetch_embedding(query)
             results = await asyncio.to_thread(
                 self._mem0.search,
                 query=query,
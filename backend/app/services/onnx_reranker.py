@@ -0,0 +1,216 @@
+"""
+ONNX Runtime Cross-Encoder for CPU-only nodes (RERANKER_ENGINE="onnx").
+
+On first use the configured RERANKER_MODEL is exported from transformers/torch to
+ONNX and (RERANKER_ONNX_QUANTIZE) its weights are dynamically quantized to int8.
+The export is checked against the torch CrossEncoder on PARITY_PAIRS. If the int8
+scores drift more than RERANKER_ONNX_PARITY_TOL, the fp32 ONNX graph is used instead.
+The outcome is recorded in parity.json next to the model, so later starts load it
+directly. Export needs torch; serving only needs onnxruntime + a tokenizer.
+
+OnnxCrossEncoder.predict matches CrossEncoder.predict: same tokenization (pair
+encoding, truncation) and the same activation. For single-label models that is the
+one named in the model config (Identity, i.e. raw logits, for the ms-marco
+cross-encoders), else sigmoid. It is a drop-in everywhere the torch model is used,
+including the reranker sidecar.
+
+Parity is measured on sigmoid(score), the scale the RAG pipeline thresholds on
+(_predict_scores), so RERANKER_ONNX_PARITY_TOL means the same for every model.
+"""
+import json
+import logging
+import os
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+PARITY_FILE = "parity.json"
+# Bump when predict()'s output or the parity metric changes: older parity.json are re-checked
+PARITY_VERSION = 2
+
+# Small mixed-language sample (Vietnamese + English, relevant + irrelevant) for the parity check
+PARITY_PAIRS: List[List[str]] = [
+    ["Giờ mở cửa của cửa hàng là mấy giờ?", "Cửa hàng mở cửa từ 8 giờ sáng đến 10 giờ tối, kể cả cuối tuần."],
+    ["Giờ mở cửa của cửa hàng là mấy giờ?", "Chúng tôi giao hàng miễn phí cho đơn trên 500.000đ trong nội thành."],
+    ["Chính sách đổi trả như thế nào?", "Khách hàng được đổi trả trong vòng 30 ngày nếu sản phẩm còn nguyên tem mác."],
+    ["Chính sách đổi trả như thế nào?", "Sản phẩm được bảo hành 12 tháng tại các trung tâm bảo hành chính hãng."],
+    ["học phí ngành công nghệ thông tin", "Học phí ngành Công nghệ thông tin năm 2024 là 32 triệu đồng mỗi năm học."],
+    ["học phí ngành công nghệ thông tin", "Ký túc xá có sức chứa 2.000 sinh viên, ưu tiên sinh viên năm nhất."],
+    ["thủ tục nhập viện cần giấy tờ gì", "Khi nhập viện, bệnh nhân cần mang CCCD, thẻ BHYT và giấy chuyển viện (nếu có)."],
+    ["thủ tục nhập viện cần giấy tờ gì", "Bệnh viện có bãi đỗ xe miễn phí cho người nhà bệnh nhân."],
+    ["What is the refund window?", "Refunds are accepted within 30 days of purchase with the original receipt."],
+    ["What is the refund window?", "Our headquarters is located in Ho Chi Minh City, District 1."],
+    ["How do I reset my password?", "Click 'Forgot password' on the login page and follow the link sent to your email."],
+    ["How do I reset my password?", "Premium plans include priority support and unlimited bots."],
+    ["Does the API support streaming?", "Yes, the chat endpoint streams tokens using Server-Sent Events (SSE)."],
+    ["Does the API support streaming?", "Documents are chunked into 1000-character segments with 200 overlap."],
+    ["gio mo cua", "Giờ mở cửa: 8:00 - 22:00 hằng ngày."],
+    ["gio mo cua", "Phí vận chuyển được tính theo khoảng cách và trọng lượng."],
+]
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1 / (1 + np.exp(-x))
+
+
+def _applies_sigmoid(config) -> bool:
+    """CrossEncoder's default activation for a 1-label model: the config's, else sigmoid."""
+    name = (
+        getattr(config, "sbert_ce_default_activation_function", None)  # sentence-transformers < 3
+        or (getattr(config, "sentence_transformers", None) or {}).get("activation_fn")
+    )
+    return not name or not name.endswith("Identity")
+
+
+class OnnxCrossEncoder:
+    """onnxruntime-backed Cross-Encoder exposing CrossEncoder.predict's interface."""
+
+    def __init__(self, model_dir: str, model_file: str = INT8_FILE, num_threads: int = 0):
+        import onnxruntime as ort
+        from transformers import AutoConfig, AutoTokenizer
+
+        self.model_dir = model_dir
+        self.model_file = model_file
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        config = AutoConfig.from_pretrained(model_dir)
+        self.num_labels = config.num_labels
+        self.sigmoid = self.num_labels == 1 and _applies_sigmoid(config)
+        self.max_length = min(self.tokenizer.model_max_length, 512)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def predict(self, pairs: Sequence[Sequence[str]], batch_size: int = 32, show_progress_bar: bool = False, **_):
+        if not pairs:
+            return np.zeros(0, dtype=np.float32)
+        # Length-sorted batches pad far less than arrival order
+        order = np.argsort([len(q) + len(p) for q, p in pairs], kind="stable")
+        logits = np.empty((len(pairs), self.num_labels), dtype=np.float32)
+        for start in range(0, len(pairs), batch_size):
+            idx = order[start:start + batch_size]
+            encoded = self.tokenizer(
+                [pairs[i][0] for i in idx],
+                [pairs[i][1] for i in idx],
+                padding=True,
+                truncation="longest_first",
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            feeds = {k: v.astype(np.int64) for k, v in encoded.items() if k in self.input_names}
+            logits[idx] = self.session.run(None, feeds)[0]
+        if self.num_labels == 1:
+            return _sigmoid(logits[:, 0]) if self.sigmoid else logits[:, 0]
+        return logits
+
+
+def export_onnx(model_name: str, out_dir: str, quantize: bool = True) -> None:
+    """Export `model_name` to out_dir/model.onnx (+ model.int8.onnx) with its tokenizer/config."""
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    cache_dir = os.getenv('HF_HOME', '/tmp/huggingface_cache')
+    tokenizer = AutoTokenizer.from_pretrained(model_name, cache_dir=cache_dir)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name, cache_dir=cache_dir).eval()
+
+    os.makedirs(out_dir, exist_ok=True)
+    sample = tokenizer(
+        [PARITY_PAIRS[0][0], PARITY_PAIRS[1][0]],
+        [PARITY_PAIRS[0][1], PARITY_PAIRS[1][1]],
+        padding=True,
+        truncation=True,
+        return_tensors="pt",
+    )
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    dynamic_axes = {n: {0: "batch", 1: "sequence"} for n in input_names}
+    dynamic_axes["logits"] = {0: "batch"}
+
+    fp32_path = os.path.join(out_dir, FP32_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            ({n: sample[n] for n in input_names},),
+            fp32_path,
+            input_names=input_names,
+            output_names=["logits"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            do_constant_folding=True,
+        )
+    tokenizer.save_pretrained(out_dir)
+    model.config.save_pretrained(out_dir)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, os.path.join(out_dir, INT8_FILE), weight_type=QuantType.QInt8)
+    logger.info(f"Exported {model_name} to ONNX at {out_dir} (int8={quantize})")
+
+
+def check_parity(candidate, reference, pairs: Sequence[Sequence[str]] = PARITY_PAIRS) -> Dict[str, float]:
+    """
+    Compare two rerankers' scores on `pairs`: absolute drift of the pipeline score
+    (sigmoid, see _predict_scores) and Spearman rank correlation.
+    """
+    a = np.asarray(candidate.predict(pairs), dtype=np.float64).reshape(len(pairs), -1)[:, 0]
+    b = np.asarray(reference.predict(pairs), dtype=np.float64).reshape(len(pairs), -1)[:, 0]
+    diff = np.abs(_sigmoid(a) - _sigmoid(b))
+    rank_a, rank_b = np.argsort(np.argsort(a)), np.argsort(np.argsort(b))
+    spearman = float(np.corrcoef(rank_a, rank_b)[0, 1]) if len(pairs) > 1 else 1.0
+    return {"max_abs_diff": float(diff.max()), "mean_abs_diff": float(diff.mean()), "spearman": spearman}
+
+
+def onnx_model_dir(model_name: str) -> str:
+    return os.path.join(settings.RERANKER_ONNX_DIR, model_name.replace("/", "__"))
+
+
+def _parity_version(parity_path: str) -> int:
+    """Version of a recorded parity check (0 if there is none)."""
+    try:
+        with open(parity_path) as f:
+            return json.load(f).get("version", 1)
+    except FileNotFoundError:
+        return 0
+
+
+def load_onnx_cross_encoder(model_name: str) -> OnnxCrossEncoder:
+    """Load (exporting + parity-checking on first use) the ONNX build of `model_name`."""
+    model_dir = onnx_model_dir(model_name)
+    parity_path = os.path.join(model_dir, PARITY_FILE)
+
+    if _parity_version(parity_path) != PARITY_VERSION:
+        from app.services.reranker_service import load_torch_cross_encoder
+
+        export_onnx(model_name, model_dir, quantize=settings.RERANKER_ONNX_QUANTIZE)
+        reference = load_torch_cross_encoder(model_name, device="cpu")
+        model_file = INT8_FILE if settings.RERANKER_ONNX_QUANTIZE else FP32_FILE
+        report = check_parity(OnnxCrossEncoder(model_dir, model_file), reference)
+        logger.info(f"[Reranker] ONNX parity ({model_file}) vs torch: {report}")
+
+        if model_file == INT8_FILE and report["max_abs_diff"] > settings.RERANKER_ONNX_PARITY_TOL:
+            logger.warning(
+                f"[Reranker] int8 drift {report['max_abs_diff']:.4f} > tol "
+                f"{settings.RERANKER_ONNX_PARITY_TOL}; serving the fp32 ONNX graph instead"
+            )
+            model_file = FP32_FILE
+            report = check_parity(OnnxCrossEncoder(model_dir, model_file), reference)
+
+        with open(parity_path, "w") as f:
+            json.dump(
+                {"model": model_name, "model_file": model_file, "version": PARITY_VERSION, **report}, f, indent=2
+            )
+
+    with open(parity_path) as f:
+        model_file = json.load(f)["model_file"]
+    print(f"[Reranker] Loading ONNX {model_name} ({model_file}) on CPU...", flush=True)
+    return OnnxCrossEncoder(model_dir, model_file)
@@ -45,7 +45,9 @@ except Exception as e:
 import time
 import uuid
 import asyncio
-from typing import List, Dict, Any, Optional, AsyncGenerator, Union
+import contextlib
+import weakref
+from typing import List, Dict, Any, Optional, AsyncGenerator, AsyncIterator, Awaitable, Tuple, Union
 from datetime import datetime
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 import httpx
@@ -54,7 +56,7 @@ from fastapi import UploadFile
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document as LangChainDocument
 from langchain_community.document_loaders import PyPDFLoader, TextLoader
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient, QdrantClient
 from qdrant_client.http import models as rest
 from qdrant_client.models import PointStruct, Filter, FieldCondition, MatchValue, MatchText
 
@@ -62,6 +64,21 @@ from app.core.config import settings
 from app.db.mongodb import get_mongodb
 from app.services.openrouter_service import get_openrouter_service
 from app.services.memory_service import memory_service
+from app.services.sparse_encoder import sparse_encoder
+from app.services.lexical_index import lexical_index_store
+from app.services.rerank_cache import RerankScoreCache, normalize_query
+from app.services.cache_generation import bot_cache_generations
+from app.db.redis import close_loop_redis, get_redis, get_sync_redis
+from app.services.cache_service import decode_value, encode_value
+from app.services import embedding_space
+from app.services.embedding_space import EmbeddingSpaceMismatch, fit_dimensions
+from app.services.embedding_cache import chunk_embedding_cache, embedding_cache
+from app.services.semantic_cache import SemanticResponseCache
+from app.services.single_flight import single_flight
+from app.services.query_planning import (
+    MAX_VARIANTS, QueryPlan, build_plan_messages, is_plan_response, parse_plan, plan_max_tokens,
+)
+from app.services.llm_cache import internal_llm_cache
 import tempfile
 import shutil
 import hashlib
@@ -70,9 +87,42 @@ import re
 
 logger = logging.getLogger(__name__)
 
+# bot_config keys that change what _prepare_chat_context retrieves
+_PREP_CONFIG_KEYS = (
+    "enable_knowledge_graph", "_lightrag_mode", "similarity_threshold", "lexical_backend",
+    "_rerank_pool_size", "_rerank_top_n", "_rerank_passage_tokens", "_vector_oversampling",
+    "enable_multi_query", "multi_query_variants", "enable_hyde", "domain",
+)
+
 # Fast model for internal pipeline calls (query rewriting, HyDE, CRAG, etc.)
 # User-facing answer generation uses the model configured per-bot in the UI.
 INTERNAL_LLM_MODEL = "openai/gpt-5.4-nano"
+_CRAG_VERDICTS = ("relevant", "ambiguous", "no_context")
+
+# Named sparse vector (BM25 term weights) stored next to the unnamed dense vector.
+SPARSE_VECTOR_NAME = "bm25"
+LEXICAL_BACKENDS = ("sparse", "bm25", "fts")
+
+# Dedicated per-bot storage: searches/ingest address the alias, which points at the
+# physical collection (see migrate_bot_to_dedicated).
+BOT_COLLECTION_ALIAS = "omnirag_bot_{bot_id}"
+BOT_COLLECTION_PHYSICAL = "omnirag_bot_{bot_id}_data"
+
+# Migration ↔ ingest coordination (see _ingest_guard): flag set while a bot's points move
+# between collections, and a counter of ingests currently writing the bot's points.
+MIGRATING_KEY = "rag:migrating:{bot_id}"
+INGESTING_KEY = "rag:ingesting:{bot_id}"
+MIGRATION_LOCK_TTL = 6 * 3600   # bounds a crashed migration's flag
+INGEST_GUARD_TTL = 3600         # bounds a crashed ingest's registration
+INGEST_DRAIN_TIMEOUT = 600      # migration gives up waiting for running ingests
+
+
+class BotMigrationInProgress(RuntimeError):
+    """The bot's points are being moved to another collection; retry the ingest later."""
+
+# Vectorless collection holding parent_child parent chunks once, keyed by parent id.
+# Child points carry only `parent_id`; parents are fetched for the final top-k.
+PARENT_COLLECTION_NAME = "omnirag_parent_chunks"
 
 
 def _sigmoid(x):
@@ -161,7 +211,7 @@ class OpenRouterAPIError(Exception):
 
 
 
-# from sentence_transformers import CrossEncoder # Moved to lazy loading in _get_reranker
+# from sentence_transformers import CrossEncoder # Moved to lazy loading in reranker_service
 
 class OpenRouterRAGService:
     """
@@ -173,28 +223,55 @@ class OpenRouterRAGService:
         """Initialize OpenRouter RAG service with all dependencies."""
         self.openrouter = get_openrouter_service()
         self.qdrant_client = QdrantClient(host=settings.QDRANT_HOST, port=settings.QDRANT_PORT)
-        self.collection_name = "omnirag_openrouter_collection"
+        # Retrieval runs on AsyncQdrantClient (see _get_async_qdrant); the sync client
+        # above stays for ingestion in Celery and for admin operations.
+        self._async_qdrant_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncQdrantClient]" = (
+            weakref.WeakKeyDictionary()
+        )
+        embedding_space.ensure_registry(self.qdrant_client)
+        spaces = embedding_space.list_spaces(self.qdrant_client)
+        # Dimension of the vectors we store: EMBEDDING_DIMENSIONS when truncating, else the
+        # model's native size (1536 for text-embedding-3-small; confirmed on first ingest).
+        # Each (model, dimension) gets its own shared collection, so switching
+        # USE_LOCAL_EMBEDDINGS / EMBEDDING_DIMENSIONS never touches other spaces' data.
+        native_dim = self._native_dim(spaces)
+        self.embedding_dim = (
+            settings.EMBEDDING_DIMENSIONS if 0 < settings.EMBEDDING_DIMENSIONS < native_dim else native_dim
+        )
+        self.collection_name = embedding_space.collection_name_for(
+            self.openrouter.embedding_model, self.embedding_dim, native=self.embedding_dim == native_dim
+        )
+        # alias name → physical collection for bots with dedicated storage (refreshed every
+        # QDRANT_ROUTE_CACHE_TTL seconds; see _collection_for)
+        self._alias_routes: Dict[str, str] = {}
+        self._alias_routes_expires = 0.0
+        # collection/alias → uses binary quantization (needs oversampling + rescore at query time)
+        self._binary_collections: Dict[str, bool] = {}
+        # collection/alias → has the BM25 sparse vector (collections created before it was added don't)
+        self._sparse_collections: Dict[str, bool] = {}
+        # Shared collections of every registered embedding space, the configured one first,
+        # and bot → the one holding its chunks (refreshed with the alias routes)
+        self._shared_collections: List[str] = [self.collection_name]
+        self._bot_homes: Dict[str, str] = {}
         
-        # Initialize Redis client for caching
-        try:
-            import redis
-            self.redis_client = redis.from_url(
-                settings.REDIS_URL,
-                decode_responses=True,
-                socket_connect_timeout=5,
-                socket_timeout=5
-            )
-            # Test connection
-            self.redis_client.ping()
-            logger.info("Redis connection established successfully")
-        except Exception as e:
-            logger.warning(f"Redis connection failed: {e}. Caching will be disabled.")
-            self.redis_client = None
+        # Caches share the async Redis pool of the running loop (app.db.redis.get_redis)
+        self.rerank_cache = RerankScoreCache()
+        self.semantic_cache = SemanticResponseCache(self.qdrant_client)
         
-        # Get embedding dimensions (typically 1536 for text-embedding-3-small)
-        self.embedding_dim = 1536  # Will be auto-detected on first embedding
+        # physical collection → registered embedding space (see embedding_space.py)
+        self._embedding_spaces: Dict[str, Dict] = {}
         
         self._ensure_collection()
+        self._set_shared_collections(spaces)
+        shared_space = self._collection_space(self.collection_name)
+        if shared_space["embedding_model"] == self.openrouter.embedding_model:
+            self.embedding_dim = shared_space["embedding_dim"]
+        else:
+            logger.error(
+                f"'{self.collection_name}' was built with {shared_space['embedding_model']}, "
+                f"configured model is {self.openrouter.embedding_model}; ingest will be refused"
+            )
+        self._ensure_parent_collection()
         
         # Deferred reranker initialization (lazy load)
         self.reranker = None
@@ -202,21 +279,141 @@ class OpenRouterRAGService:
 
         logger.info("OpenRouterRAGService initialized successfully (reranker loads on demand)")
     
+    def _get_async_qdrant(self) -> AsyncQdrantClient:
+        """Return the AsyncQdrantClient bound to the running event loop.
+
+        httpx connection pools cannot be shared across event loops, and Celery tasks
+        (Zalo webhooks) spin up a fresh loop per asyncio.run(), so one client with a
+        bounded pool is kept per loop; Celery tasks close it with the loop (run_closing_loop_clients).
+        """
+        loop = asyncio.get_running_loop()
+        client = self._async_qdrant_clients.get(loop)
+        if client is None:
+            client = AsyncQdrantClient(
+                host=settings.QDRANT_HOST,
+                port=settings.QDRANT_PORT,
+                timeout=settings.QDRANT_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=settings.QDRANT_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.QDRANT_MAX_CONNECTIONS,
+                ),
+            )
+            self._async_qdrant_clients[loop] = client
+        return client
+
+    async def aclose(self):
+        """Close the async Qdrant / OpenRouter clients owned by the running event loop (app shutdown)."""
+        client = self._async_qdrant_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+        await self.openrouter.aclose()
+
+    def _native_dim(self, spaces: List[Dict]) -> int:
+        """
+        Native size of the configured embedding model. A local model is only loaded to
+        measure it if no full-size space of it is registered yet, so processes that never
+        embed locally (API workers serving API-ingested bots) don't load it at import.
+        """
+        model = self.openrouter.embedding_model
+        if self.openrouter.is_local_model(model):
+            for space in spaces:
+                if space.get("embedding_model") == model and not space.get("truncated"):
+                    return space["embedding_dim"]
+        return self.openrouter.embedding_dim_for(model)
+
     def _ensure_collection(self):
         """Ensure Qdrant collection exists with proper configuration (Quantization + Indexing)."""
-        try:
-            self.qdrant_client.get_collection(self.collection_name)
+        if self.qdrant_client.collection_exists(self.collection_name):
             logger.info(f"Collection '{self.collection_name}' already exists")
-        except Exception:
-            logger.info(f"Creating collection '{self.collection_name}' with Scalar Quantization")
-            
+            # Older collections were created dense-only, and Qdrant cannot add a sparse vector
+            # to an existing collection. They keep working: "sparse" lexical search falls back
+            # to the bm25 backend for them (see _hybrid_search) and ingest writes dense-only
+            # points. Moving a bot to a dedicated collection (storage_tasks migrate) gives it one.
+            if not self._has_sparse(self.collection_name):
+                logger.warning(
+                    f"'{self.collection_name}' has no '{SPARSE_VECTOR_NAME}' sparse vector; "
+                    f"lexical search on it uses the bm25 backend"
+                )
+            return
+
+        self._create_collection(self.collection_name)
+
+    def _has_sparse(self, collection: str) -> bool:
+        """Whether a collection (or alias) carries the BM25 sparse vector; cached per name."""
+        has = self._sparse_collections.get(collection)
+        if has is None:
+            try:
+                info = self.qdrant_client.get_collection(collection)
+            except Exception as e:
+                # Only legacy shared collections lack it; don't cache a transient failure
+                logger.warning(f"Could not read config of '{collection}': {e}")
+                return True
+            has = SPARSE_VECTOR_NAME in (info.config.params.sparse_vectors or {})
+            self._sparse_collections[collection] = has
+        return has
+
+    def _ensure_parent_collection(self):
+        """Payload-only collection for parent chunks (no vectors; payload on disk)."""
+        if self.qdrant_client.collection_exists(PARENT_COLLECTION_NAME):
+            return
+        logger.info(f"Creating parent chunk store '{PARENT_COLLECTION_NAME}'")
+        self.qdrant_client.create_collection(
+            collection_name=PARENT_COLLECTION_NAME,
+            vectors_config={},
+            on_disk_payload=True,
+        )
+        for field in ("bot_id", "source"):
+            self.qdrant_client.create_payload_index(
+                collection_name=PARENT_COLLECTION_NAME,
+                field_name=field,
+                field_schema=rest.PayloadSchemaType.KEYWORD,
+            )
+
+    def _create_collection(self, collection_name: str, vector_storage: str = "int8", space: Optional[Dict] = None):
+        """
+        Create a chunk collection: dense + BM25 sparse vectors, quantization, payload indexes.
+        Its embedding space (model + dimension) is recorded in the registry; `space`
+        copies an existing collection's instead of this worker's (migrations).
+
+        vector_storage:
+          "int8"   — scalar INT8 quantization, everything in RAM (shared collection default)
+          "binary" — 1-bit binary quantization in RAM; original vectors, sparse index and
+                     payload on disk (mmap). ~32x smaller in-RAM vectors than float32, so
+                     big bots fit on one node; queries oversample + rescore from disk
+                     (see _search_params).
+        """
+        model = space["embedding_model"] if space else self.openrouter.embedding_model
+        dim = space["embedding_dim"] if space else self.embedding_dim
+        if vector_storage == "binary":
+            logger.info(f"Creating collection '{collection_name}' with Binary Quantization (on-disk vectors)")
+            self.qdrant_client.create_collection(
+                collection_name=collection_name,
+                vectors_config=rest.VectorParams(
+                    size=dim,
+                    distance=rest.Distance.COSINE,
+                    on_disk=True,
+                ),
+                sparse_vectors_config={
+                    SPARSE_VECTOR_NAME: rest.SparseVectorParams(
+                        modifier=rest.Modifier.IDF,
+                        index=rest.SparseIndexParams(on_disk=True),
+                    )
+                },
+                quantization_config=rest.BinaryQuantization(
+                    binary=rest.BinaryQuantizationConfig(always_ram=True)
+                ),
+                on_disk_payload=True,
+            )
+        else:
+            logger.info(f"Creating collection '{collection_name}' with Scalar Quantization")
             # Create collection with Scalar Quantization (like notebook step 3)
             self.qdrant_client.create_collection(
-                collection_name=self.collection_name,
+                collection_name=collection_name,
                 vectors_config=rest.VectorParams(
-                    size=self.embedding_dim,
+                    size=dim,
                     distance=rest.Distance.COSINE
                 ),
+                sparse_vectors_config={SPARSE_VECTOR_NAME: rest.SparseVectorParams(modifier=rest.Modifier.IDF)},
                 quantization_config=rest.ScalarQuantization(
                     scalar=rest.ScalarQuantizationConfig(
                         type=rest.ScalarType.INT8,
@@ -225,29 +422,466 @@ class OpenRouterRAGService:
                     )
                 )
             )
-            
-            # Create payload indexes for speed and keyword search
-            logger.info("Creating payload indexes...")
-            self.qdrant_client.create_payload_index(
-                collection_name=self.collection_name,
-                field_name="bot_id",
-                field_schema=rest.PayloadSchemaType.KEYWORD
+        self._binary_collections.pop(collection_name, None)
+        self._embedding_spaces[collection_name] = embedding_space.record_space(
+            self.qdrant_client, collection_name, model, dim
+        )
+
+        # Create payload indexes for speed and keyword search
+        logger.info("Creating payload indexes...")
+        self.qdrant_client.create_payload_index(
+            collection_name=collection_name,
+            field_name="bot_id",
+            field_schema=rest.PayloadSchemaType.KEYWORD
+        )
+
+        # Full Text Search index — used by the legacy "fts" lexical backend
+        self.qdrant_client.create_payload_index(
+            collection_name=collection_name,
+            field_name="text",
+            field_schema=rest.TextIndexParams(
+                type="text",
+                tokenizer=rest.TokenizerType.MULTILINGUAL,
+                lowercase=True,
+                min_token_len=2,
+                max_token_len=20
             )
-            
-            # Enable Full Text Search on the content field (Keyword search capability)
-            self.qdrant_client.create_payload_index(
-                collection_name=self.collection_name,
-                field_name="text",
-                field_schema=rest.TextIndexParams(
-                    type="text",
-                    tokenizer=rest.TokenizerType.MULTILINGUAL,
-                    lowercase=True,
-                    min_token_len=2,
-                    max_token_len=20
+        )
+        logger.info(f"Collection '{collection_name}' created successfully with indexes")
+
+    # ──────────────────────────────────────────────────────────────────────────
+    # Storage routing — shared collection vs dedicated per-bot collections
+    # ──────────────────────────────────────────────────────────────────────────
+
+    def _collection_space(self, collection: str) -> Dict:
+        """Registered embedding space of a physical collection (adopting pre-registry ones)."""
+        space = self._embedding_spaces.get(collection)
+        if space is None:
+            space = embedding_space.read_space(self.qdrant_client, collection)
+            if space is None:
+                # Collection predates the registry: its vector size is authoritative, and
+                # it can only have been written by the model configured at the time.
+                size = self.qdrant_client.get_collection(collection).config.params.vectors.size
+                logger.info(f"Registering legacy collection '{collection}' as {size}-d {self.openrouter.embedding_model}")
+                space = embedding_space.record_space(
+                    self.qdrant_client, collection, self.openrouter.embedding_model, size
                 )
+            self._embedding_spaces[collection] = space
+        return space
+
+    def _fit_to_collection(self, collection: str, embeddings: List[List[float]]) -> List[List[float]]:
+        """
+        Fit native chunk embeddings to the space of the collection they are written to.
+        A bot still in a collection of this model at another size (e.g. the full-size one
+        after EMBEDDING_DIMENSIONS was set) keeps getting vectors of that size, so it stays
+        ingestible without a re-ingest; otherwise EMBEDDING_DIMENSIONS applies.
+        """
+        if not embeddings:
+            return embeddings
+        space = self._collection_space(self._alias_routes.get(collection, collection))
+        if space["embedding_model"] == self.openrouter.embedding_model and space["embedding_dim"] <= len(embeddings[0]):
+            return fit_dimensions(embeddings, space["embedding_dim"])
+        return fit_dimensions(embeddings)
+
+    def _ensure_embedding_space(self, collection: str, dim: int) -> None:
+        """
+        Guard a write of `dim`-d vectors into `collection` (alias or physical name).
+        An EMPTY collection created with a guessed size is rebuilt to fit; one holding
+        data raises EmbeddingSpaceMismatch — data is never deleted to make vectors fit.
+        """
+        physical = self._alias_routes.get(collection, collection)
+        space = self._collection_space(physical)
+        try:
+            embedding_space.check_space(space, physical, self.openrouter.embedding_model, dim)
+        except EmbeddingSpaceMismatch:
+            if physical != collection or self.qdrant_client.count(collection_name=physical, exact=True).count:
+                raise
+            info = self.qdrant_client.get_collection(physical)
+            vector_storage = "binary" if isinstance(info.config.quantization_config, rest.BinaryQuantization) else "int8"
+            logger.warning(f"'{physical}' is empty; rebuilding it for {dim}-d {self.openrouter.embedding_model} vectors")
+            self.qdrant_client.delete_collection(physical)
+            self._create_collection(physical, vector_storage)
+
+    async def _query_space(self, bot_id: str) -> Tuple[str, Optional[int]]:
+        """
+        (model, dim) queries of `bot_id` are embedded with: the registered space of the
+        collection holding its chunks, so bots ingested with the API and with the local
+        model can be served by the same workers.
+        """
+        model, dim = None, None
+        try:
+            collection = await self._acollection_for(bot_id)
+            physical = self._alias_routes.get(collection, collection)
+            space = self._embedding_spaces.get(physical) or await asyncio.to_thread(self._collection_space, physical)
+            model, dim = space["embedding_model"], space["embedding_dim"]
+        except Exception as e:
+            logger.warning(f"Embedding space lookup failed for bot {bot_id}, using configured model: {e}")
+        return model or self.openrouter.embedding_model, dim or settings.EMBEDDING_DIMENSIONS or None
+
+    async def _embed_query(self, bot_id: str, text: str) -> List[float]:
+        """
+        Embed a query in `bot_id`'s embedding space (see _query_space). Repeated queries
+        are served from embedding_cache without calling the embedding model.
+        """
+        model, dim = await self._query_space(bot_id)
+        return await embedding_cache.aget_or_compute(
+            model, dim, text, lambda: self._embed_with_retry(text, model, dim),
+        )
+
+    async def _embed_query_with_generation(self, bot_id: str, text: str) -> Tuple[int, List[float]]:
+        """
+        (bot cache generation, query embedding) for a chat turn. Whatever the worker's
+        local tiers don't hold comes back in ONE Redis MGET.
+        """
+        model, dim = await self._query_space(bot_id)
+        emb_key = embedding_cache.key(model, dim, text) if settings.EMBED_CACHE_ENABLED else None
+        generation = bot_cache_generations.local.get(bot_id)
+        vector = embedding_cache.local.get(emb_key) if emb_key else None
+
+        keys = []
+        if generation is None:
+            keys.append(bot_cache_generations.counter(bot_id))
+        if emb_key and vector is None:
+            keys.append(emb_key)
+        if keys:
+            try:
+                values = dict(zip(keys, await get_redis().mget(keys)))
+            except Exception as e:
+                logger.warning(f"Turn cache prefetch failed (treating as miss): {e}")
+                values = {}
+            if generation is None:
+                generation = bot_cache_generations.remember(bot_id, values.get(keys[0]))
+            if emb_key and vector is None:
+                vector = embedding_cache.remember(emb_key, values.get(emb_key))
+
+        if vector is None:
+            vector = await self._embed_with_retry(text, model, dim)
+            if emb_key:
+                embedding_cache.computed += 1
+                await embedding_cache.aset(emb_key, vector)
+        return generation, vector
+
+    def _set_alias_routes(self, aliases) -> None:
+        self._alias_routes = {a.alias_name: a.collection_name for a in aliases}
+        self._alias_routes_expires = time.monotonic() + settings.QDRANT_ROUTE_CACHE_TTL
+        self._binary_collections.clear()  # aliases may now point at differently-configured collections
+
+    def _set_shared_collections(self, spaces: List[Dict]) -> None:
+        """Shared collections from the registry entries (per-bot collections are registered too)."""
+        dedicated = re.compile(BOT_COLLECTION_PHYSICAL.format(bot_id=".+"))
+        self._shared_collections = [self.collection_name] + [
+            s["collection"] for s in spaces
+            if s["collection"] != self.collection_name and not dedicated.fullmatch(s["collection"])
+        ]
+        self._bot_homes.clear()
+
+    async def _search_params(self, collection: str, oversampling: Optional[float] = None) -> Optional[rest.SearchParams]:
+        """
+        Dense-search params for `collection`: binary-quantized collections search the
+        1-bit index for oversampling × limit candidates, then rescore them with the
+        original (on-disk) vectors. INT8 collections use Qdrant defaults.
+        """
+        if collection in self._shared_collections:
+            return None
+        is_binary = self._binary_collections.get(collection)
+        if is_binary is None:
+            try:
+                info = await self._get_async_qdrant().get_collection(collection)
+                is_binary = isinstance(info.config.quantization_config, rest.BinaryQuantization)
+            except Exception as e:
+                logger.warning(f"Could not read quantization config of '{collection}': {e}")
+                return None
+            self._binary_collections[collection] = is_binary
+        if not is_binary:
+            return None
+        return rest.SearchParams(
+            quantization=rest.QuantizationSearchParams(
+                rescore=True,
+                oversampling=oversampling or settings.QDRANT_BINARY_OVERSAMPLING,
             )
-            logger.info(f"Collection '{self.collection_name}' created successfully with indexes")
-    
+        )
+
+    def _collection_for(self, bot_id: str) -> str:
+        """Collection that holds `bot_id`'s chunks: its dedicated alias, else its shared one."""
+        if time.monotonic() >= self._alias_routes_expires:
+            try:
+                self._set_alias_routes(self.qdrant_client.get_aliases().aliases)
+                self._set_shared_collections(embedding_space.list_spaces(self.qdrant_client))
+            except Exception as e:
+                logger.warning(f"Qdrant alias lookup failed, keeping cached routes: {e}")
+                self._alias_routes_expires = time.monotonic() + settings.QDRANT_ROUTE_CACHE_TTL
+        alias = BOT_COLLECTION_ALIAS.format(bot_id=bot_id)
+        return alias if alias in self._alias_routes else self._shared_collection_for(bot_id)
+
+    async def _acollection_for(self, bot_id: str) -> str:
+        """Async twin of _collection_for for the retrieval path."""
+        if time.monotonic() >= self._alias_routes_expires:
+            try:
+                client = self._get_async_qdrant()
+                self._set_alias_routes((await client.get_aliases()).aliases)
+                self._set_shared_collections(await embedding_space.alist_spaces(client))
+            except Exception as e:
+                logger.warning(f"Qdrant alias lookup failed, keeping cached routes: {e}")
+                self._alias_routes_expires = time.monotonic() + settings.QDRANT_ROUTE_CACHE_TTL
+        alias = BOT_COLLECTION_ALIAS.format(bot_id=bot_id)
+        return alias if alias in self._alias_routes else await self._ashared_collection_for(bot_id)
+
+    def _shared_collection_for(self, bot_id: str) -> str:
+        """
+        Shared collection holding `bot_id`'s chunks. Normally the configured space's, but a
+        bot ingested under another USE_LOCAL_EMBEDDINGS / EMBEDDING_DIMENSIONS setting keeps
+        being served from the collection its chunks are in (queried in that space, see
+        _query_space). Bots with no chunks anywhere yet belong to the configured one.
+        """
+        if len(self._shared_collections) == 1:
+            return self.collection_name
+        home = self._bot_homes.get(bot_id)
+        if home is None:
+            home = self.collection_name
+            for collection in self._shared_collections:
+                try:
+                    count = self.qdrant_client.count(
+                        collection_name=collection, count_filter=self._bot_filter(bot_id), exact=True
+                    ).count
+                except Exception as e:
+                    logger.warning(f"Could not count bot {bot_id} in '{collection}': {e}")
+                    continue
+                if count:
+                    home = collection
+                    break
+            self._bot_homes[bot_id] = home
+        return home
+
+    async def _ashared_collection_for(self, bot_id: str) -> str:
+        """Async twin of _shared_collection_for."""
+        if len(self._shared_collections) == 1:
+            return self.collection_name
+        home = self._bot_homes.get(bot_id)
+        if home is None:
+            home = self.collection_name
+            client = self._get_async_qdrant()
+            for collection in self._shared_collections:
+                try:
+                    count = (await client.count(
+                        collection_name=collection, count_filter=self._bot_filter(bot_id), exact=True
+                    )).count
+                except Exception as e:
+                    logger.warning(f"Could not count bot {bot_id} in '{collection}': {e}")
+                    continue
+                if count:
+                    home = collection
+                    break
+            self._bot_homes[bot_id] = home
+        return home
+
+    def _ingest_collection_for(self, bot_id: str, vector_storage: Optional[str] = None) -> str:
+        """
+        Route for writes. With QDRANT_STORAGE_LAYOUT="per_bot", a bot that has no chunks
+        in the shared collection yet is given its dedicated collection on first ingest
+        (created with the bot's vector_storage profile); bots with existing shared data
+        stay put until migrated.
+        """
+        collection = self._collection_for(bot_id)
+        if collection != self.collection_name or settings.QDRANT_STORAGE_LAYOUT != "per_bot":
+            return collection
+        shared_count = self.qdrant_client.count(
+            collection_name=self.collection_name,
+            count_filter=self._bot_filter(bot_id),
+            exact=False,
+        ).count
+        if shared_count:
+            logger.info(
+                f"Bot {bot_id} still has {shared_count} chunks in the shared collection; "
+                f"run `python -m app.tasks.storage_tasks migrate {bot_id}` to isolate it"
+            )
+            return collection
+        return self._provision_bot_collection(bot_id, vector_storage or "int8")
+
+    def _provision_bot_collection(self, bot_id: str, vector_storage: str = "int8") -> str:
+        """Create the bot's physical collection (if needed) and point its alias at it."""
+        alias = BOT_COLLECTION_ALIAS.format(bot_id=bot_id)
+        physical = BOT_COLLECTION_PHYSICAL.format(bot_id=bot_id)
+        if not self.qdrant_client.collection_exists(physical):
+            self._create_collection(physical, vector_storage)
+        self.qdrant_client.update_collection_aliases(change_aliases_operations=[
+            rest.CreateAliasOperation(create_alias=rest.CreateAlias(collection_name=physical, alias_name=alias))
+        ])
+        self._alias_routes[alias] = physical
+        logger.info(f"Bot {bot_id} now stored in dedicated collection '{physical}' (alias '{alias}')")
+        return alias
+
+    @staticmethod
+    def _bot_filter(bot_id: str, source: Optional[str] = None) -> Filter:
+        must = [FieldCondition(key="bot_id", match=MatchValue(value=bot_id))]
+        if source is not None:
+            must.append(FieldCondition(key="source", match=MatchValue(value=source)))
+        return Filter(must=must)
+
+    def delete_bot_points(self, bot_id: str, source: Optional[str] = None):
+        """
+        Delete a bot's chunks (optionally one source file) from every collection that may
+        hold them — shared and dedicated — so deletes issued mid-migration still land —
+        plus their parent chunks.
+        """
+        targets = list(self._shared_collections)
+        physical = BOT_COLLECTION_PHYSICAL.format(bot_id=bot_id)
+        if self.qdrant_client.collection_exists(physical):
+            targets.append(physical)
+        targets.append(PARENT_COLLECTION_NAME)
+        for collection in targets:
+            self.qdrant_client.delete(
+                collection_name=collection,
+                points_selector=rest.FilterSelector(filter=self._bot_filter(bot_id, source)),
+            )
+
+    @classmethod
+    def _copied_vector(cls, record) -> Dict[str, Any]:
+        """A scrolled point's vectors, with the BM25 sparse vector computed if the source lacks it."""
+        vector = dict(record.vector) if isinstance(record.vector, dict) else {"": record.vector}
+        if SPARSE_VECTOR_NAME not in vector:
+            vector[SPARSE_VECTOR_NAME] = sparse_encoder.encode_document(cls._enriched_text(record.payload))
+        return vector
+
+    def _copy_bot_points(self, bot_id: str, source_collection: str, target_collection: str, batch_size: int) -> int:
+        """Copy a bot's points (vectors + payload, same ids) between collections; idempotent."""
+        copied = 0
+        offset = None
+        while True:
+            records, offset = self.qdrant_client.scroll(
+                collection_name=source_collection,
+                scroll_filter=self._bot_filter(bot_id),
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
+            )
+            if records:
+                self.qdrant_client.upsert(
+                    collection_name=target_collection,
+                    points=[PointStruct(id=r.id, vector=self._copied_vector(r), payload=r.payload) for r in records],
+                    wait=True,
+                )
+                copied += len(records)
+            if offset is None:
+                return copied
+
+    @contextlib.contextmanager
+    def _ingest_guard(self, bot_id: str):
+        """
+        Wrap the writes of an ingest (collection routing + upserts). Raises
+        BotMigrationInProgress while the bot is being migrated, and registers the
+        ingest so a migration starting now waits for it: the ingest checks the flag
+        after registering and the migration reads the counter after setting the
+        flag, so one of them always sees the other. No coordination without Redis.
+        """
+        client = get_sync_redis()
+        migrating, ingesting = MIGRATING_KEY.format(bot_id=bot_id), INGESTING_KEY.format(bot_id=bot_id)
+        registered = False
+        if client is not None:
+            try:
+                client.incr(ingesting)
+                client.expire(ingesting, INGEST_GUARD_TTL)
+                registered = True
+            except Exception as e:
+                logger.warning(f"Ingest guard unavailable for bot {bot_id}: {e}")
+        try:
+            if registered and client.exists(migrating):
+                raise BotMigrationInProgress(f"Bot {bot_id} is being migrated; retry the ingest later")
+            yield
+        finally:
+            if registered:
+                try:
+                    client.decr(ingesting)
+                except Exception as e:
+                    logger.warning(f"Ingest guard release failed for bot {bot_id}: {e}")
+
+    @contextlib.asynccontextmanager
+    async def _aingest_guard(self, bot_id: str):
+        """_ingest_guard for async ingest paths."""
+        migrating, ingesting = MIGRATING_KEY.format(bot_id=bot_id), INGESTING_KEY.format(bot_id=bot_id)
+        redis = get_redis()
+        registered = False
+        try:
+            await redis.incr(ingesting)
+            await redis.expire(ingesting, INGEST_GUARD_TTL)
+            registered = True
+        except Exception as e:
+            logger.warning(f"Ingest guard unavailable for bot {bot_id}: {e}")
+        try:
+            if registered and await redis.exists(migrating):
+                raise BotMigrationInProgress(f"Bot {bot_id} is being migrated; retry the ingest later")
+            yield
+        finally:
+            if registered:
+                try:
+                    await redis.decr(ingesting)
+                except Exception as e:
+                    logger.warning(f"Ingest guard release failed for bot {bot_id}: {e}")
+
+    def migrate_bot_to_dedicated(
+        self, bot_id: str, batch_size: int = 256, vector_storage: str = "int8"
+    ) -> Dict[str, Any]:
+        """
+        Move a bot's points from the shared collection into a dedicated one, online.
+        vector_storage picks the new collection's profile ("int8" or "binary", see
+        _create_collection); it has no effect if the dedicated collection already exists.
+
+        0. flag the bot as migrating and wait for ingests already writing its points;
+           new ingests raise BotMigrationInProgress until the flag is cleared
+        1. copy points into omnirag_bot_{id}_data while the shared copy keeps serving
+        2. atomically create alias omnirag_bot_{id} → reads/writes switch to it
+        3. wait out other workers' route caches, copy anything written to shared meanwhile
+        4. delete the bot's points from the shared collection
+        Every step is idempotent, so an interrupted migration can simply be re-run.
+        """
+        client = get_sync_redis()
+        if client is None:
+            logger.warning(f"No Redis: ingests of bot {bot_id} are not blocked during the migration")
+            return self._migrate_bot_points(bot_id, batch_size, vector_storage)
+
+        migrating, ingesting = MIGRATING_KEY.format(bot_id=bot_id), INGESTING_KEY.format(bot_id=bot_id)
+        if not client.set(migrating, "1", nx=True, ex=MIGRATION_LOCK_TTL):
+            raise BotMigrationInProgress(f"Bot {bot_id} is already being migrated")
+        try:
+            deadline = time.time() + INGEST_DRAIN_TIMEOUT
+            while int(client.get(ingesting) or 0) > 0:
+                if time.time() > deadline:
+                    raise TimeoutError(f"Ingests of bot {bot_id} still running after {INGEST_DRAIN_TIMEOUT}s")
+                time.sleep(1.0)
+            return self._migrate_bot_points(bot_id, batch_size, vector_storage)
+        finally:
+            client.delete(migrating)
+
+    def _migrate_bot_points(self, bot_id: str, batch_size: int, vector_storage: str) -> Dict[str, Any]:
+        """Steps 1-4 of migrate_bot_to_dedicated."""
+        alias = BOT_COLLECTION_ALIAS.format(bot_id=bot_id)
+        physical = BOT_COLLECTION_PHYSICAL.format(bot_id=bot_id)
+        self._alias_routes_expires = 0.0
+        migrated = self._collection_for(bot_id) == alias
+        shared = self._shared_collection_for(bot_id)
+        if migrated:
+            moved_late = self._copy_bot_points(bot_id, shared, physical, batch_size)
+        else:
+            if not self.qdrant_client.collection_exists(physical):
+                self._create_collection(physical, vector_storage, space=self._collection_space(shared))
+            copied = self._copy_bot_points(bot_id, shared, physical, batch_size)
+            logger.info(f"Copied {copied} points of bot {bot_id} into '{physical}'")
+            self._provision_bot_collection(bot_id, vector_storage)
+
+            time.sleep(settings.QDRANT_ROUTE_CACHE_TTL + 5)
+            moved_late = self._copy_bot_points(bot_id, shared, physical, batch_size)
+
+        self.qdrant_client.delete(
+            collection_name=shared,
+            points_selector=rest.FilterSelector(filter=self._bot_filter(bot_id)),
+        )
+        total = self.qdrant_client.count(collection_name=physical, exact=True).count
+        logger.info(f"Bot {bot_id} migrated to '{physical}': {total} points ({moved_late} caught up late)")
+        return {
+            "bot_id": bot_id, "collection": physical, "alias": alias,
+            "points": total, "vector_storage": vector_storage,
+        }
+
     def _load_document(self, file_path: str, filename: str) -> List[LangChainDocument]:
         """Load document based on file type."""
         if filename.endswith(".pdf"):
@@ -342,7 +976,8 @@ class OpenRouterRAGService:
         if chunking_strategy == "parent_child":
             # Parent-Child Chunking:
             # Large parent chunks preserve context; small child chunks enable precise matching.
-            # Each child carries its parent text in metadata so retrieval returns the richer context.
+            # Children keep their parent text in (in-memory) metadata only; _build_points stores
+            # each parent once in the parent store and gives children a parent_id reference.
             parent_splitter = RecursiveCharacterTextSplitter(
                 chunk_size=chunk_size,
                 chunk_overlap=chunk_overlap,
@@ -397,108 +1032,227 @@ class OpenRouterRAGService:
         wait=wait_exponential(multiplier=1, min=2, max=10),
         reraise=True
     )
-    def _embed_with_retry(self, text: str) -> List[float]:
-        """Embed single text with retry logic"""
+    async def _embed_with_retry(self, text: str, model: Optional[str] = None, dim: Optional[int] = None) -> List[float]:
+        """Embed single text with retry logic (in `model`'s space, truncated to `dim`)"""
         try:
-            return self.openrouter.embed_single(text)
+            return fit_dimensions([await self.openrouter.aembed(text, model=model)], dim)[0]
         except Exception as e:
             logger.warning(f"Embedding attempt failed: {e}")
             raise OpenRouterAPIError(f"Embedding failed: {str(e)}")
     
+    async def _embed_chunks_cached(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed ingest chunks through the content-addressed chunk_embedding_cache: only
+        texts never embedded by this model (in any bot, any upload) go to the API.
+        Returns native-size vectors; callers apply fit_dimensions.
+        """
+        model = self.openrouter.embedding_model
+        vectors = await chunk_embedding_cache.get_many(model, texts)
+        hits = sum(v is not None for v in vectors)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if missing:
+            fresh = dict(zip(missing, await self.openrouter.embed_batch_async(missing, batch_size=100)))
+            vectors = [v if v is not None else fresh[t] for t, v in zip(texts, vectors)]
+            await chunk_embedding_cache.set_many(model, fresh)
+        logger.info(f"Chunk embeddings: {hits}/{len(texts)} from cache, {len(missing)} unique texts embedded")
+        return vectors
+    
     @retry(
         retry=retry_if_exception_type((httpx.HTTPError, OpenRouterAPIError, Exception)),
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=2, max=10),
         reraise=True
     )
-    def _chat_with_retry(self, messages: List[Dict], **kwargs) -> Dict:
+    async def _chat_with_retry(self, messages: List[Dict], **kwargs) -> Dict:
         """Chat completion with retry logic"""
         try:
-            return self.openrouter.chat_completion(messages=messages, **kwargs)
+            return await self.openrouter.achat_completion(messages=messages, **kwargs)
         except Exception as e:
             logger.warning(f"Chat completion attempt failed: {e}")
             raise OpenRouterAPIError(f"Chat completion failed: {str(e)}")
     
     def _get_reranker(self):
-        """Lazy loader for the reranker model to speed up startup.
+        """Lazy loader for the reranker to speed up startup.
 
-        Device priority: CUDA → MPS (Apple Silicon, native macOS only) → CPU.
-        Note: MPS is unavailable inside Docker on Mac (Linux VM has no Metal access).
-        To use MPS/GPU on M1/M2/M3, run backend natively: uvicorn app.main:app --port 8000
+        RERANKER_BACKEND="local" loads a CrossEncoder into this worker;
+        "sidecar" returns a client for the shared per-host reranker process
+        (see app/services/reranker_service.py).
         """
         if self._reranker_attempted:
             return self.reranker
 
         self._reranker_attempted = True
         try:
-            import torch
-            from sentence_transformers import CrossEncoder
-
-            model_cache_dir = os.getenv('HF_HOME', '/tmp/huggingface_cache')
-            os.makedirs(model_cache_dir, exist_ok=True)
-
-            reranker_model = getattr(settings, "RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
-
-            # Auto-detect best available device
-            if torch.cuda.is_available():
-                device = "cuda"
-            elif torch.backends.mps.is_available():
-                device = "mps"
-            else:
-                device = "cpu"
-
-            print(f"[Reranker] Loading {reranker_model} on {device.upper()}...", flush=True)
-            self.reranker = CrossEncoder(
-                reranker_model,
-                device=device,
-                automodel_args={'cache_dir': model_cache_dir},
-                tokenizer_args={'cache_dir': model_cache_dir}
-            )
-            print(f"[Reranker] Loaded on {device.upper()} ✓", flush=True)
+            from app.services.reranker_service import get_reranker
+            self.reranker = get_reranker()
         except Exception as e:
             logger.warning(f"Failed to load Reranker model on demand: {e}")
             self.reranker = None
 
         return self.reranker
 
-    def _hybrid_search(
+    async def _hybrid_search(
         self,
         bot_id: str,
         query: str,
         query_embedding: List[float],
         top_k: int = 5,
         rerank: bool = True,
+        lexical_backend: Optional[str] = None,
+        rerank_pool: Optional[int] = None,
+        rerank_keep: Optional[int] = None,
+        rerank_passage_tokens: Optional[int] = None,
+        oversampling: Optional[float] = None,
+        dense_text: Optional[str] = None,
     ) -> List[Dict]:
         """
-        True Hybrid retrieval: Vector (semantic) + Full-Text Search (Qdrant BM25-style)
-        merged via RRF (Reciprocal Rank Fusion), then re-ranked with Cross-Encoder.
+        True Hybrid retrieval: Vector (semantic) + lexical (BM25) merged via RRF
+        (Reciprocal Rank Fusion), then re-ranked with Cross-Encoder.
+
+        Lexical backend (lexical_backend arg, else LEXICAL_SEARCH_BACKEND):
+          "sparse" (default) — ONE query_points call: dense + BM25 sparse prefetches
+                               fused server-side with RRF, so lexical hits are ranked.
+          "bm25"             — per-bot in-process BM25 index ranks chunks locally; only
+                               the top point ids are fetched, concurrently with the
+                               vector query, then fused client-side.
+          "fts"              — legacy unranked MatchText scroll + vector query.
 
         rerank=False skips the Cross-Encoder pass (used for multi-query variants where
         the caller does one final rerank after merging all variant results).
+
+        Rerank cascade (values from the domain profile, see _rerank_cascade):
+          rerank_pool           — candidates retrieved and reranked (default top_k * 2)
+          rerank_keep           — survivors of the truncated first pass
+          rerank_passage_tokens — passage budget for the first pass
+
+        oversampling applies to binary-quantized dedicated collections (see _search_params).
+
+        dense_text: the text query_embedding was computed from, when it isn't `query`
+        (the HyDE leg embeds a passage but searches lexically with the question).
+
+        Results are cached per (bot generation, normalized query, dense text, knobs) for
+        RETRIEVAL_CACHE_TTL; any change to the bot's documents retires them.
         """
-        reranker = self._get_reranker() if rerank else None
-        initial_limit = top_k * 2
-        
-        bot_filter = Filter(
-            must=[FieldCondition(key="bot_id", match=MatchValue(value=bot_id))]
+        backend = lexical_backend or settings.LEXICAL_SEARCH_BACKEND
+        if backend not in LEXICAL_BACKENDS:
+            # configs saved before lexical_backend was validated may hold anything
+            logger.warning(f"Unknown lexical backend '{backend}' for bot {bot_id}, using 'sparse'")
+            backend = "sparse"
+        cache_key, cached = await self._cache_lookup(
+            "retrieval", bot_id, settings.RETRIEVAL_CACHE_TTL, json.dumps([
+                normalize_query(query), self.rerank_cache.model_tag, top_k, rerank, backend,
+                rerank_pool, rerank_keep, rerank_passage_tokens, oversampling,
+                normalize_query(dense_text) if dense_text is not None and dense_text != query else None,
+            ]),
         )
+        if cached is not None:
+            return cached
+
+        initial_limit = max(rerank_pool or top_k * 2, top_k)
+        client = self._get_async_qdrant()
+        collection = await self._acollection_for(bot_id)
+        bot_filter = self._bot_filter(bot_id)
+        search_params = await self._search_params(collection, oversampling)
+
+        if backend == "sparse":
+            has_sparse = self._sparse_collections.get(collection)
+            if has_sparse is None:
+                has_sparse = await asyncio.to_thread(self._has_sparse, collection)
+            if not has_sparse:
+                backend = "bm25"
+
+        if backend == "sparse":
+            sparse_query = sparse_encoder.encode_query(query)
+            prefetch = [
+                rest.Prefetch(query=query_embedding, filter=bot_filter, params=search_params, limit=initial_limit),
+            ]
+            if sparse_query.indices:
+                prefetch.append(rest.Prefetch(
+                    query=sparse_query, using=SPARSE_VECTOR_NAME,
+                    filter=bot_filter, limit=initial_limit,
+                ))
+            response = await client.query_points(
+                collection_name=collection,
+                prefetch=prefetch,
+                query=rest.FusionQuery(fusion=rest.Fusion.RRF),
+                limit=initial_limit,
+                with_payload=True,
+            )
+            candidates = []
+            for point in response.points:
+                c = self._candidate_from_point(point, point.score)
+                c["rrf_score"] = point.score
+                candidates.append(c)
+        elif backend == "bm25":
+            candidates = await self._hybrid_search_bm25(
+                client, collection, bot_filter, bot_id, query, query_embedding, initial_limit, search_params
+            )
+        else:
+            candidates = await self._hybrid_search_fts(
+                client, collection, bot_filter, bot_id, query, query_embedding, initial_limit, search_params
+            )
 
-        # 1. Vector search (Semantic)
-        vector_response = self.qdrant_client.query_points(
-            collection_name=self.collection_name,
-            query=query_embedding,
-            query_filter=bot_filter,
-            limit=initial_limit,
-            with_payload=True
+        if not candidates:
+            return []
+
+        # Re-ranking (Cross-Encoder) if requested and available
+        if rerank:
+            candidates = await self._rerank_candidates(
+                query, candidates, bot_id, max(rerank_keep or 0, top_k), rerank_passage_tokens,
+            )
+        else:
+            for c in candidates:
+                c["hybrid_score"] = c["rrf_score"]
+
+        results = candidates[:top_k]
+        if cache_key:
+            # Encoded now: callers mutate the results (parent attachment) after we return
+            asyncio.create_task(self._cache_set(cache_key, encode_value(results), settings.RETRIEVAL_CACHE_TTL))
+        return results
+
+    async def _cache_lookup(self, kind: str, bot_id: str, ttl: int, fingerprint: str):
+        """
+        (key, cached value or None) in the bot's current cache generation; key is None when
+        the cache is disabled. The generation is read BEFORE the caller computes, so a
+        value built while documents change is filed under the retired generation.
+        """
+        if not ttl:
+            return None, None
+        key = bot_cache_generations.key(
+            kind, bot_id, await bot_cache_generations.get(bot_id), hashlib.md5(fingerprint.encode()).hexdigest()
         )
-        vector_results = vector_response.points
+        try:
+            return key, decode_value(await get_redis().get(key))
+        except Exception as e:
+            logger.warning(f"{kind} cache read failed (treating as miss): {e}")
+            return key, None
+
+    async def _cache_set(self, key: str, data: bytes, ttl: int):
+        """Write a value already framed by encode_value (callers may mutate the original)."""
+        try:
+            await get_redis().set(key, data, ex=ttl)
+        except Exception as e:
+            logger.warning(f"Cache write failed for {key.split(':')[1]} (non-critical): {e}")
 
+    async def _hybrid_search_fts(
+        self,
+        client: AsyncQdrantClient,
+        collection: str,
+        bot_filter: Filter,
+        bot_id: str,
+        query: str,
+        query_embedding: List[float],
+        initial_limit: int,
+        search_params: Optional[rest.SearchParams] = None,
+    ) -> List[Dict]:
+        """Legacy lexical path: vector query + MatchText scroll, concurrently, fused client-side."""
         # 2. Full-Text Search (uses the text index created during collection setup)
-        fts_results = []
-        if query.strip():
+        async def _fts_leg() -> list:
+            if not query.strip():
+                return []
             try:
-                fts_scroll, _ = self.qdrant_client.scroll(
-                    collection_name=self.collection_name,
+                fts_scroll, _ = await client.scroll(
+                    collection_name=collection,
                     scroll_filter=Filter(
                         must=[
                             FieldCondition(key="bot_id", match=MatchValue(value=bot_id)),
@@ -509,78 +1263,325 @@ class OpenRouterRAGService:
                     with_payload=True,
                     with_vectors=False,
                 )
-                fts_results = fts_scroll
-                logger.debug(f"FTS found {len(fts_results)} results for query: {query[:50]}")
+                logger.debug(f"FTS found {len(fts_scroll)} results for query: {query[:50]}")
+                return fts_scroll
             except Exception as e:
                 logger.warning(f"FTS search failed, using vector-only: {e}")
+                return []
+
+        vector_results, fts_results = await asyncio.gather(
+            self._vector_leg(client, collection, bot_filter, query_embedding, initial_limit, search_params), _fts_leg()
+        )
 
         # 3. Merge via Reciprocal Rank Fusion (RRF)
-        rrf_k = 60  # standard RRF constant
+        return self._fuse_rrf(vector_results, fts_results)
+
+    async def _hybrid_search_bm25(
+        self,
+        client: AsyncQdrantClient,
+        collection: str,
+        bot_filter: Filter,
+        bot_id: str,
+        query: str,
+        query_embedding: List[float],
+        initial_limit: int,
+        search_params: Optional[rest.SearchParams] = None,
+    ) -> List[Dict]:
+        """In-process BM25 lexical path: rank locally, fetch top ids + vector query concurrently."""
+        # (Re)loading the .npz decompresses arrays and rebuilds postings — keep it off the loop
+        index = await asyncio.to_thread(lexical_index_store.get, bot_id)
+        if index is None:
+            # First query for a bot without an index yet — backfill from Qdrant payloads once.
+            index = await asyncio.to_thread(self._build_lexical_index, bot_id)
+
+        hits = index.search(query, initial_limit) if (index is not None and query.strip()) else []
+        bm25_scores = dict(hits)
+
+        async def _lexical_leg() -> list:
+            if not hits:
+                return []
+            records = await client.retrieve(
+                collection_name=collection,
+                ids=[pid for pid, _ in hits],
+                with_payload=True,
+                with_vectors=False,
+            )
+            by_id = {str(r.id): r for r in records}
+            return [by_id[pid] for pid, _ in hits if pid in by_id]  # keep BM25 rank order
+
+        vector_results, lexical_results = await asyncio.gather(
+            self._vector_leg(client, collection, bot_filter, query_embedding, initial_limit, search_params), _lexical_leg()
+        )
+        candidates = self._fuse_rrf(vector_results, lexical_results)
+
+        lexical_by_key = {r.payload.get("text", "")[:200]: bm25_scores[str(r.id)] for r in lexical_results}
+        for c in candidates:
+            c["bm25_score"] = lexical_by_key.get(c["text"][:200], 0.0)
+        return candidates
+
+    async def _vector_leg(
+        self,
+        client: AsyncQdrantClient,
+        collection: str,
+        bot_filter: Filter,
+        query_embedding: List[float],
+        limit: int,
+        search_params: Optional[rest.SearchParams] = None,
+    ) -> list:
+        """Dense vector search (semantic) restricted to one bot."""
+        response = await client.query_points(
+            collection_name=collection,
+            query=query_embedding,
+            query_filter=bot_filter,
+            search_params=search_params,
+            limit=limit,
+            with_payload=True
+        )
+        return response.points
+
+    @staticmethod
+    def _enriched_text(payload: Dict) -> str:
+        """Reconstruct the contextual-retrieval text that was embedded for a chunk payload."""
+        prefix = payload.get("context_prefix")
+        text = payload.get("text", "")
+        return f"{prefix}\n\n{text}" if prefix else text
+
+    def _build_lexical_index(self, bot_id: str):
+        """One-off backfill of a bot's BM25 index from the chunk payloads already in Qdrant."""
+        point_ids, sources, texts = [], [], []
+        offset = None
+        while True:
+            records, offset = self.qdrant_client.scroll(
+                collection_name=self._collection_for(bot_id),
+                scroll_filter=self._bot_filter(bot_id),
+                limit=1000,
+                offset=offset,
+                with_payload=["text", "context_prefix", "source"],
+                with_vectors=False,
+            )
+            for record in records:
+                point_ids.append(str(record.id))
+                sources.append(record.payload.get("source", "unknown"))
+                texts.append(self._enriched_text(record.payload))
+            if offset is None:
+                break
+        logger.info(f"Building BM25 index for bot {bot_id} from {len(point_ids)} Qdrant chunks")
+        lexical_index_store.add_documents(bot_id, point_ids, sources, texts, create=True)
+        return lexical_index_store.get(bot_id)
+
+    def _index_lexical(self, bot_id: str, filename: str, points: List[PointStruct], enriched_texts: List[str]):
+        """Keep the bot's BM25 index (when it has one) in step with newly upserted chunks."""
+        create = settings.LEXICAL_SEARCH_BACKEND == "bm25"
+        if not (create or lexical_index_store.exists(bot_id)):
+            return
+        try:
+            lexical_index_store.add_documents(
+                bot_id,
+                [str(uuid.UUID(p.id)) for p in points],  # Qdrant reports hex ids in UUID form
+                [filename] * len(points),
+                enriched_texts[:len(points)],
+                create=create,
+            )
+        except Exception as e:
+            logger.warning(f"BM25 index update failed for bot {bot_id} (non-critical): {e}")
+
+    @staticmethod
+    def _candidate_from_point(point, initial_score: float) -> Dict:
+        """Flatten a Qdrant point into the candidate dict used through the pipeline."""
+        return {
+            "text": point.payload["text"],
+            "parent_text": point.payload.get("parent_text"),  # legacy points only
+            "parent_id": point.payload.get("parent_id"),
+            "id": str(point.id),
+            "source": point.payload.get("source", "unknown"),
+            "initial_score": initial_score,
+            "metadata": point.payload.get("metadata", {})
+        }
+
+    @classmethod
+    def _fuse_rrf(cls, vector_results: list, fts_results: list, rrf_k: int = 60) -> List[Dict]:
+        """Merge ranked vector and FTS point lists via Reciprocal Rank Fusion."""
         scores: Dict[str, float] = {}
         payloads: Dict[str, dict] = {}
 
         for rank, point in enumerate(vector_results):
             key = point.payload.get("text", "")[:200]  # content fingerprint
             scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
-            payloads[key] = {
-                "text": point.payload["text"],
-                "parent_text": point.payload.get("parent_text"),
-                "source": point.payload.get("source", "unknown"),
-                "initial_score": point.score,
-                "metadata": point.payload.get("metadata", {})
-            }
+            payloads[key] = cls._candidate_from_point(point, point.score)
 
         for rank, point in enumerate(fts_results):
             key = point.payload.get("text", "")[:200]
             scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
             if key not in payloads:
-                payloads[key] = {
-                    "text": point.payload["text"],
-                    "parent_text": point.payload.get("parent_text"),
-                    "source": point.payload.get("source", "unknown"),
-                    "initial_score": 0.5,  # FTS hit, no cosine score
-                    "metadata": point.payload.get("metadata", {})
-                }
+                payloads[key] = cls._candidate_from_point(point, 0.5)  # FTS hit, no cosine score
 
         candidates = []
         for key, rrf_score in sorted(scores.items(), key=lambda x: x[1], reverse=True):
             c = payloads[key].copy()
             c["rrf_score"] = rrf_score
             candidates.append(c)
+        return candidates
 
-        if not candidates:
-            return []
-
-        # 4. Re-ranking (Cross-Encoder) if available
+    def _predict_scores(
+        self,
+        query: str,
+        texts: List[str],
+        point_ids: Optional[List[Optional[str]]] = None,
+        cached: Optional[Dict[str, float]] = None,
+        fresh: Optional[Dict[str, float]] = None,
+    ):
+        """
+        Cross-Encoder scores for (query, text) pairs as a sigmoid-normalized array,
+        plus the raw scores. Returns (None, None) when no reranker is available.
+        Pairs whose point id is in `cached` (raw scores prefetched from the rerank cache)
+        skip predict; newly computed scores are recorded in `fresh` for write-back.
+        CPU-bound — call via asyncio.to_thread from async code.
+        """
         import numpy as np
         reranker = self._get_reranker()
-        if reranker:
-            try:
-                pairs = [[query, c["text"]] for c in candidates]
-                rerank_scores = reranker.predict(pairs)
+        if not reranker:
+            return None, None
+
+        cached = cached or {}
+        point_ids = point_ids or [None] * len(texts)
+        raw_scores = np.empty(len(texts), dtype=np.float64)
+        missing = []
+        for i, pid in enumerate(point_ids):
+            if pid in cached:
+                raw_scores[i] = cached[pid]
+            else:
+                missing.append(i)
+
+        if missing:
+            predicted = reranker.predict([[query, texts[i]] for i in missing], show_progress_bar=False)
+            if isinstance(predicted, float):
+                predicted = [predicted]
+            for i, score in zip(missing, predicted):
+                raw_scores[i] = float(score)
+            if fresh is not None:
+                fresh.update({point_ids[i]: float(raw_scores[i]) for i in missing if point_ids[i]})
+        if len(missing) < len(texts):
+            logger.info(f"Rerank cache: {len(texts) - len(missing)}/{len(texts)} pairs reused")
+        return _sigmoid(raw_scores), raw_scores
 
-                if isinstance(rerank_scores, float):
-                    rerank_scores = [rerank_scores]
+    @staticmethod
+    def _truncate_passage(text: str, max_tokens: int) -> str:
+        """First max_tokens whitespace tokens of a passage (cheap proxy for model tokens)."""
+        words = text.split()
+        return text if len(words) <= max_tokens else " ".join(words[:max_tokens])
 
-                norm_scores = _sigmoid(np.array(rerank_scores))
+    @staticmethod
+    def _stage1_id(point_id: Optional[str], passage_tokens: int) -> Optional[str]:
+        # Truncated scores are cached apart from full-length ones
+        return f"{point_id}:t{passage_tokens}" if point_id else None
 
-                for i, c in enumerate(candidates):
-                    c["hybrid_score"] = float(norm_scores[i])
-                    c["rerank_raw"] = float(rerank_scores[i])
+    def _rerank_cascade(
+        self,
+        query: str,
+        texts: List[str],
+        point_ids: List[Optional[str]],
+        keep: Optional[int] = None,
+        passage_tokens: Optional[int] = None,
+        cached: Optional[Dict[str, float]] = None,
+        fresh: Optional[Dict[str, float]] = None,
+    ):
+        """
+        Two-stage Cross-Encoder scoring. Stage 1 scores every passage truncated to
+        passage_tokens and keeps the best `keep`; stage 2 scores only those survivors at
+        full length. Attention cost grows with sequence length, so most of the pool is
+        scored on short inputs. Skipped (single full pass) when the pool is no larger
+        than `keep` or no passage exceeds the budget.
+
+        Returns (survivor indices ordered by stage-1 score, norm_scores, raw_scores)
+        for the survivors, or (None, None, None) when no reranker is available.
+        """
+        import numpy as np
+        survivors = list(range(len(texts)))
+        if (
+            keep and passage_tokens and len(texts) > keep
+            and any(len(t.split()) > passage_tokens for t in texts)
+        ):
+            truncated = [self._truncate_passage(t, passage_tokens) for t in texts]
+            stage1_ids = [self._stage1_id(pid, passage_tokens) for pid in point_ids]
+            first_pass, _ = self._predict_scores(query, truncated, stage1_ids, cached, fresh)
+            if first_pass is None:
+                return None, None, None
+            survivors = [int(i) for i in np.argsort(-first_pass, kind="stable")[:keep]]
+
+        norm_scores, raw_scores = self._predict_scores(
+            query, [texts[i] for i in survivors], [point_ids[i] for i in survivors], cached, fresh
+        )
+        if norm_scores is None:
+            return None, None, None
+        return survivors, norm_scores, raw_scores
 
-                candidates.sort(key=lambda x: x["hybrid_score"], reverse=True)
-                logger.info(f"Hybrid reranked {len(candidates)} items (vec+fts+ce). Top: {candidates[0]['hybrid_score']:.4f}")
+    async def _arerank_cascade(
+        self,
+        query: str,
+        texts: List[str],
+        point_ids: List[Optional[str]],
+        bot_id: Optional[str] = None,
+        keep: Optional[int] = None,
+        passage_tokens: Optional[int] = None,
+    ):
+        """
+        _rerank_cascade on a worker thread, with the rerank cache handled on the event
+        loop: the scores of both stages come from ONE HMGET before predict, and new
+        scores are written back without blocking the caller.
+        """
+        use_cache = bool(settings.RERANK_CACHE_ENABLED and bot_id)
+        cached: Dict[str, float] = {}
+        fresh: Dict[str, float] = {}
+        if use_cache:
+            generation = await bot_cache_generations.get(bot_id)
+            lookup_ids = [pid for pid in point_ids if pid]
+            if passage_tokens:
+                lookup_ids += [self._stage1_id(pid, passage_tokens) for pid in point_ids if pid]
+            cached = await self.rerank_cache.get_many(bot_id, query, lookup_ids, generation)
+        result = await asyncio.to_thread(
+            self._rerank_cascade, query, texts, point_ids, keep, passage_tokens, cached, fresh
+        )
+        if use_cache and fresh:
+            asyncio.create_task(self.rerank_cache.set_many(bot_id, query, fresh, generation))
+        return result
 
-            except Exception as e:
-                logger.warning(f"Reranking failed: {e}. Falling back to RRF order.")
+    async def _rerank_candidates(
+        self,
+        query: str,
+        candidates: List[Dict],
+        bot_id: Optional[str] = None,
+        keep: Optional[int] = None,
+        passage_tokens: Optional[int] = None,
+    ) -> List[Dict]:
+        """Cross-Encoder cascade over RRF candidates; falls back to RRF order on failure."""
+        try:
+            survivors, norm_scores, raw_scores = await self._arerank_cascade(
+                query, [c["text"] for c in candidates], [c.get("id") for c in candidates],
+                bot_id, keep, passage_tokens,
+            )
+            if survivors is None:
                 for c in candidates:
                     c["hybrid_score"] = c["rrf_score"]
-        else:
+                return candidates
+
+            reranked = []
+            for j, i in enumerate(survivors):
+                c = candidates[i]
+                c["hybrid_score"] = float(norm_scores[j])
+                c["rerank_raw"] = float(raw_scores[j])
+                reranked.append(c)
+
+            reranked.sort(key=lambda x: x["hybrid_score"], reverse=True)
+            logger.info(
+                f"Hybrid reranked {len(reranked)}/{len(candidates)} items (vec+fts+ce). "
+                f"Top: {reranked[0]['hybrid_score']:.4f}"
+            )
+            candidates = reranked
+        except Exception as e:
+            logger.warning(f"Reranking failed: {e}. Falling back to RRF order.")
             for c in candidates:
                 c["hybrid_score"] = c["rrf_score"]
-            candidates.sort(key=lambda x: x["hybrid_score"], reverse=True)
-
-        return candidates[:top_k]
+        return candidates
 
     async def _generate_hyde_query(self, query: str) -> str:
         """
@@ -604,7 +1605,7 @@ Answer:"""
         ]
 
         try:
-            response = self._chat_with_retry(
+            response = await self._chat_with_retry(
                 messages=hyde_prompt,
                 temperature=0.3,
                 max_tokens=200
@@ -622,7 +1623,8 @@ Answer:"""
         bot_id: str,
         chunking_strategy: str = "recursive",
         chunk_size: int = 1000,
-        chunk_overlap: int = 200
+        chunk_overlap: int = 200,
+        vector_storage: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         Ingest file into vector database using OpenRouter embeddings.
@@ -633,6 +1635,7 @@ Answer:"""
             chunking_strategy: Chunking strategy to use
             chunk_size: Size of each chunk
             chunk_overlap: Overlap between chunks
+            vector_storage: "int8" | "binary" profile if a dedicated collection gets created
             
         Returns:
             Dict with ingestion stats
@@ -677,55 +1680,27 @@ Answer:"""
 
             # Generate embeddings for all chunks (using enriched text for better semantic match)
             logger.info(f"Generating embeddings for {len(chunks)} chunks using OpenRouter")
-            embeddings = self.openrouter.embed_batch(enriched_texts, batch_size=100)
-            
-            # Auto-detect embedding dimensions
-            if embeddings:
-                detected_dim = len(embeddings[0])
-                if detected_dim != self.embedding_dim:
-                    logger.warning(
-                        f"Embedding dimension mismatch. Expected {self.embedding_dim}, "
-                        f"got {detected_dim}. Recreating collection..."
-                    )
-                    self.embedding_dim = detected_dim
-                    # Recreate collection with correct dimensions
-                    try:
-                        await asyncio.to_thread(
-                            self.qdrant_client.delete_collection,
-                            self.collection_name
-                        )
-                    except Exception as del_err:
-                        logger.warning(f"Could not delete Qdrant collection during dimension reset: {del_err}")
-                    await asyncio.to_thread(self._ensure_collection)
+            native_embeddings = await self._embed_chunks_cached(enriched_texts)
             
             # Insert into Qdrant
             logger.info(f"Inserting {len(chunks)} vectors into Qdrant")
-            points = []
-            for idx, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-                point_id = hashlib.md5(
-                    f"{bot_id}_{file.filename}_{idx}_{chunk.page_content[:100]}".encode()
-                ).hexdigest()
-
-                points.append(
-                    PointStruct(
-                        id=point_id,
-                        vector=embedding,
-                        payload={
-                            "bot_id": bot_id,
-                            "source": file.filename,
-                            "text": chunk.page_content,
-                            "parent_text": chunk.metadata.get("parent_text"),
-                            "context_prefix": context_prefixes[idx] if idx < len(context_prefixes) else None,
-                            "metadata": chunk.metadata,
-                        }
-                    )
+            async with self._aingest_guard(bot_id):
+                collection = await asyncio.to_thread(self._ingest_collection_for, bot_id, vector_storage)
+                embeddings = await asyncio.to_thread(self._fit_to_collection, collection, native_embeddings)
+                dim = len(embeddings[0]) if embeddings else self.embedding_dim
+                points = self._build_points(
+                    bot_id, file.filename, chunks, embeddings, context_prefixes, enriched_texts,
+                    sparse=await asyncio.to_thread(self._has_sparse, collection),
                 )
-            
-            await asyncio.to_thread(
-                self.qdrant_client.upsert,
-                collection_name=self.collection_name,
-                points=points
-            )
+
+                await asyncio.to_thread(self._ensure_embedding_space, collection, dim)
+                await asyncio.to_thread(self._store_parents, bot_id, file.filename, chunks)
+                await asyncio.to_thread(
+                    self.qdrant_client.upsert,
+                    collection_name=collection,
+                    points=points
+                )
+                await asyncio.to_thread(self._index_lexical, bot_id, file.filename, points, enriched_texts)
             
             elapsed_time = time.time() - start_time
             
@@ -733,7 +1708,7 @@ Answer:"""
                 "filename": file.filename,
                 "chunks_created": len(chunks),
                 "vectors_inserted": len(points),
-                "embedding_dim": self.embedding_dim,
+                "embedding_dim": dim,
                 "processing_time": round(elapsed_time, 2)
             }
             
@@ -749,6 +1724,106 @@ Answer:"""
             if os.path.exists(tmp_path):
                 os.remove(tmp_path)
 
+    @classmethod
+    def _build_points(
+        cls,
+        bot_id: str,
+        filename: str,
+        chunks: List[LangChainDocument],
+        embeddings: List[List[float]],
+        context_prefixes: List[str],
+        enriched_texts: List[str],
+        sparse: bool = True,
+    ) -> List[PointStruct]:
+        """
+        Build Qdrant points carrying the dense embedding (default vector) and a BM25
+        sparse vector computed locally from the same enriched text that was embedded
+        (dense only when the target collection predates the sparse vector).
+        parent_child chunks reference their parent by id instead of embedding its text.
+        """
+        points = []
+        for idx, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
+            # Full chunk content in the id: an edited chunk never inherits cached rerank scores.
+            # 128 bits of the sha256, hex — Qdrant accepts it as a UUID.
+            point_id = hashlib.sha256(
+                f"{bot_id}_{filename}_{idx}_{chunk.page_content}".encode()
+            ).hexdigest()[:32]
+            parent_text = chunk.metadata.get("parent_text")
+            metadata = {k: v for k, v in chunk.metadata.items() if k != "parent_text"}
+
+            points.append(
+                PointStruct(
+                    id=point_id,
+                    vector={
+                        "": embedding,
+                        SPARSE_VECTOR_NAME: sparse_encoder.encode_document(enriched_texts[idx]),
+                    } if sparse else {"": embedding},
+                    payload={
+                        "bot_id": bot_id,
+                        "source": filename,
+                        "text": chunk.page_content,
+                        "parent_id": cls._parent_id(bot_id, filename, parent_text) if parent_text else None,
+                        "context_prefix": context_prefixes[idx] if idx < len(context_prefixes) else None,
+                        "metadata": metadata,
+                    }
+                )
+            )
+        return points
+
+    @staticmethod
+    def _parent_id(bot_id: str, filename: str, parent_text: str) -> str:
+        """Deterministic parent point id (UUID form, as Qdrant reports it back)."""
+        return str(uuid.UUID(hashlib.md5(f"{bot_id}_{filename}_{parent_text}".encode()).hexdigest()))
+
+    def _store_parents(self, bot_id: str, filename: str, chunks: List[LangChainDocument]):
+        """Upsert each distinct parent chunk of a parent_child document once."""
+        parents: Dict[str, str] = {}
+        for chunk in chunks:
+            parent_text = chunk.metadata.get("parent_text")
+            if parent_text:
+                parents.setdefault(self._parent_id(bot_id, filename, parent_text), parent_text)
+        if not parents:
+            return
+        points = [
+            PointStruct(id=pid, vector={}, payload={"bot_id": bot_id, "source": filename, "text": text})
+            for pid, text in parents.items()
+        ]
+        for i in range(0, len(points), 200):
+            self.qdrant_client.upsert(collection_name=PARENT_COLLECTION_NAME, points=points[i:i + 200])
+        logger.info(f"Stored {len(points)} parent chunks for {len(chunks)} children of {filename}")
+
+    async def _attach_parents(self, results: List[Dict]) -> List[Dict]:
+        """
+        Resolve parent text for the final top-k with ONE batched retrieve, and drop
+        siblings whose parent is already in context (the LLM would see it twice).
+        Returns copies: CRAG reads the same result dicts concurrently.
+        """
+        results = [dict(r) for r in results]
+        parent_ids = list(dict.fromkeys(r["parent_id"] for r in results if r.get("parent_id") and not r.get("parent_text")))
+        if parent_ids:
+            try:
+                records = await self._get_async_qdrant().retrieve(
+                    collection_name=PARENT_COLLECTION_NAME,
+                    ids=parent_ids,
+                    with_payload=["text"],
+                    with_vectors=False,
+                )
+                texts = {str(r.id): r.payload.get("text") for r in records}
+                for r in results:
+                    if r.get("parent_id") in texts:
+                        r["parent_text"] = texts[r["parent_id"]]
+            except Exception as e:
+                logger.warning(f"Parent chunk fetch failed, answering from child chunks: {e}")
+
+        deduped, seen = [], set()
+        for r in results:
+            key = r.get("parent_id") if r.get("parent_text") else None
+            if key and key in seen:
+                continue
+            seen.add(key)
+            deduped.append(r)
+        return deduped
+
     def process_file_sync(
         self,
         file_path: str,
@@ -758,6 +1833,7 @@ Answer:"""
         chunk_size: int = 1000,
         chunk_overlap: int = 200,
         preloaded_documents=None,
+        vector_storage: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         Synchronous file ingestion for Celery worker.
@@ -799,55 +1875,34 @@ Answer:"""
             enriched = [
                 f"{p}\n\n{t}" if p else t for p, t in zip(prefixes, chunk_texts)
             ]
-            embeddings = await self.openrouter.embed_batch_async(enriched, batch_size=100)
-            return prefixes, embeddings
+            embeddings = await self._embed_chunks_cached(enriched)
+            return prefixes, enriched, embeddings
 
         logger.info(f"Generating embeddings for {len(chunks)} chunks using OpenRouter (async)")
-        context_prefixes, embeddings = asyncio.run(_contextual_ingest_async())
+        context_prefixes, enriched_texts, embeddings = asyncio.run(
+            run_closing_loop_clients(_contextual_ingest_async())
+        )
         # ─────────────────────────────────────────────────────────────────────
 
-        if embeddings:
-            detected_dim = len(embeddings[0])
-            if detected_dim != self.embedding_dim:
-                logger.warning(
-                    f"Embedding dimension mismatch. Expected {self.embedding_dim}, "
-                    f"got {detected_dim}. Recreating collection..."
-                )
-                self.embedding_dim = detected_dim
-                try:
-                    self.qdrant_client.delete_collection(self.collection_name)
-                except Exception:
-                    pass
-                self._ensure_collection()
-
-        points = []
-        for idx, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-            point_id = hashlib.md5(
-                f"{bot_id}_{filename}_{idx}_{chunk.page_content[:100]}".encode()
-            ).hexdigest()
-
-            points.append(
-                PointStruct(
-                    id=point_id,
-                    vector=embedding,
-                    payload={
-                        "bot_id": bot_id,
-                        "source": filename,
-                        "text": chunk.page_content,
-                        "parent_text": chunk.metadata.get("parent_text"),
-                        "context_prefix": context_prefixes[idx] if idx < len(context_prefixes) else None,
-                        "metadata": chunk.metadata,
-                    }
-                )
-            )
-
         UPSERT_BATCH_SIZE = 200
-        logger.info(f"Inserting {len(points)} vectors into Qdrant (batches of {UPSERT_BATCH_SIZE})")
-        for i in range(0, len(points), UPSERT_BATCH_SIZE):
-            self.qdrant_client.upsert(
-                collection_name=self.collection_name,
-                points=points[i:i + UPSERT_BATCH_SIZE]
+        # Embeddings and prefixes are cached, so an ingest refused mid-migration retries cheaply
+        with self._ingest_guard(bot_id):
+            collection = self._ingest_collection_for(bot_id, vector_storage)
+            embeddings = self._fit_to_collection(collection, embeddings)
+            dim = len(embeddings[0]) if embeddings else self.embedding_dim
+            points = self._build_points(
+                bot_id, filename, chunks, embeddings, context_prefixes, enriched_texts,
+                sparse=self._has_sparse(collection),
             )
+            self._ensure_embedding_space(collection, dim)
+            self._store_parents(bot_id, filename, chunks)
+            logger.info(f"Inserting {len(points)} vectors into '{collection}' (batches of {UPSERT_BATCH_SIZE})")
+            for i in range(0, len(points), UPSERT_BATCH_SIZE):
+                self.qdrant_client.upsert(
+                    collection_name=collection,
+                    points=points[i:i + UPSERT_BATCH_SIZE]
+                )
+            self._index_lexical(bot_id, filename, points, enriched_texts)
 
         elapsed_time = time.time() - start_time
 
@@ -855,7 +1910,7 @@ Answer:"""
             "filename": filename,
             "chunks_created": len(chunks),
             "vectors_inserted": len(points),
-            "embedding_dim": self.embedding_dim,
+            "embedding_dim": dim,
             "processing_time": round(elapsed_time, 2),
             "preview": chunks[0].page_content[:500] if chunks else "No content extracted",
             "model_used": self.openrouter.embedding_model
@@ -891,9 +1946,7 @@ Answer:"""
                 {"role": "user", "content": query}
             ]
             
-            # Use asyncio.to_thread for synchronous generic call
-            response = await asyncio.to_thread(
-                self.openrouter.chat_completion,
+            response = await internal_llm_cache.achat_completion(
                 messages=messages,
                 model=INTERNAL_LLM_MODEL,
                 temperature=0.1
@@ -907,71 +1960,7 @@ Answer:"""
             logger.warning(f"Query rewriting failed: {e}. Using original query.")
             return query
 
-    async def _generate_hyde_hypothesis(self, query: str, domain: str = "general") -> str:
-        """
-        HyDE (Hypothetical Document Embedding):
-        Generate a hypothetical document passage that *would* answer the query,
-        then embed that passage instead of the raw query.
-
-        Doc-to-doc similarity >> query-to-doc similarity in embedding space,
-        so this significantly improves semantic retrieval precision.
-        Falls back to original query if LLM call fails.
-        """
-        domain_hints = {
-            "legal": (
-                "Viết một đoạn văn pháp lý ngắn (4-6 câu) như thể trích từ một văn bản "
-                "quy phạm pháp luật, hợp đồng hoặc hướng dẫn pháp lý có thể trả lời câu hỏi sau. "
-                "Dùng ngôn ngữ pháp lý chính thức, trích dẫn điều khoản nếu phù hợp."
-            ),
-            "education": (
-                "Viết một đoạn giải thích học thuật ngắn (4-6 câu) như thể trích từ sách giáo khoa "
-                "hoặc tài liệu giảng dạy có thể trả lời câu hỏi sau. "
-                "Dùng ngôn ngữ rõ ràng, có ví dụ minh họa nếu phù hợp."
-            ),
-            "sales": (
-                "Viết một đoạn mô tả sản phẩm/dịch vụ ngắn (4-6 câu) như thể trích từ tài liệu "
-                "kinh doanh, brochure hoặc catalog có thể trả lời câu hỏi sau. "
-                "Nhấn mạnh vào lợi ích và đặc điểm nổi bật."
-            ),
-            "general": (
-                "Viết một đoạn văn ngắn (4-6 câu) như thể trích từ tài liệu tham khảo "
-                "có thể trả lời câu hỏi sau."
-            ),
-        }
-
-        hint = domain_hints.get(domain, domain_hints["general"])
-        messages = [
-            {
-                "role": "system",
-                "content": (
-                    "Bạn là trợ lý tạo đoạn văn giả định để cải thiện tìm kiếm ngữ nghĩa (HyDE). "
-                    "Chỉ trả về đoạn văn thuần túy, không thêm giải thích, không thêm tiêu đề."
-                ),
-            },
-            {
-                "role": "user",
-                "content": f"{hint}\n\nCâu hỏi: {query}",
-            },
-        ]
-
-        try:
-            response = await asyncio.to_thread(
-                self.openrouter.chat_completion,
-                messages=messages,
-                model=INTERNAL_LLM_MODEL,
-                temperature=0.5,
-                max_tokens=250,
-            )
-            hypothesis = response.get("content", "").strip()
-            if hypothesis:
-                logger.info(f"HyDE hypothesis ({domain}): {hypothesis[:120]}...")
-                return hypothesis
-        except Exception as e:
-            logger.warning(f"HyDE generation failed, falling back to original query: {e}")
-
-        return query
-
-    async def _crag_classify(self, query: str, chunks: list) -> str:
+    async def _crag_classify(self, query: str, chunks: list, bot_id: Optional[str] = None) -> str:
         """
         CRAG (Corrective RAG) relevance classifier.
 
@@ -984,6 +1973,7 @@ Answer:"""
           "no_context" — KB lacks relevant info; LLM should admit it doesn't know
 
         Falls back to "relevant" on any failure so CRAG never silently breaks RAG.
+        Verdicts are memoized per bot cache generation (bot_id), so they retire with the chunks.
         """
         if not chunks:
             return "no_context"
@@ -1015,15 +2005,16 @@ Answer:"""
         ]
 
         try:
-            response = await asyncio.to_thread(
-                self.openrouter.chat_completion,
+            response = await internal_llm_cache.achat_completion(
                 messages=messages,
                 model=INTERNAL_LLM_MODEL,
                 temperature=0.0,
                 max_tokens=16,
+                bot_id=bot_id,
+                accept=lambda c: c.strip().lower() in _CRAG_VERDICTS,
             )
             verdict = response.get("content", "").strip().lower()
-            if verdict in ("relevant", "ambiguous", "no_context"):
+            if verdict in _CRAG_VERDICTS:
                 logger.info(f"CRAG verdict: {verdict}")
                 return verdict
         except Exception as e:
@@ -1035,65 +2026,77 @@ Answer:"""
     # Multi-Query Fusion
     # ──────────────────────────────────────────────────────────────────────────
 
-    async def _generate_query_variants(self, query: str, n: int = 2) -> List[str]:
+    async def _plan_query(
+        self, query: str, n_variants: int = 0, hyde: bool = False, domain: str = "general"
+    ) -> QueryPlan:
         """
-        Multi-Query Fusion — step 1:
-        Generate N diverse reformulations of the query via LLM.
-        Different phrasings hit different embedding regions → broader recall.
-        Always includes the original query; returns [original, v1, v2, ...].
-        Falls back to [query] on failure.
+        Rewrite + Multi-Query step 1 + HyDE in ONE structured-output call
+        (see app/services/query_planning.py). Never raises: a failed call or an
+        invalid response plans plain retrieval with the original query.
         """
-        messages = [
-            {
-                "role": "system",
-                "content": (
-                    f"Generate {n} diverse reformulations of the user's query to improve document retrieval. "
-                    "Each reformulation should approach the topic from a different angle or use different keywords. "
-                    f"Return exactly {n} queries, one per line, numbered 1. 2. etc. "
-                    "No explanations — only the queries."
-                ),
-            },
-            {"role": "user", "content": query},
-        ]
+        n_variants = max(0, min(n_variants, MAX_VARIANTS))
         try:
-            response = await asyncio.to_thread(
-                self.openrouter.chat_completion,
-                messages=messages,
+            response = await internal_llm_cache.achat_completion(
+                messages=build_plan_messages(query, n_variants, hyde, domain),
                 model=INTERNAL_LLM_MODEL,
-                temperature=0.7,
-                max_tokens=150,
+                temperature=0.3 if (n_variants or hyde) else 0.1,
+                max_tokens=plan_max_tokens(n_variants, hyde),
+                response_format={"type": "json_object"},
+                accept=is_plan_response,
             )
-            content = response.get("content", "").strip()
-            variants = []
-            for line in content.split("\n"):
-                line = re.sub(r"^\d+\.\s*", "", line.strip())
-                if line:
-                    variants.append(line)
-            return [query] + variants[:n]
+            plan = parse_plan(response.get("content", ""), query, n_variants, hyde)
         except Exception as e:
-            logger.warning(f"Query variant generation failed: {e}")
-            return [query]
+            logger.warning(f"Query planning failed: {e}. Using original query.")
+            return QueryPlan(rewritten_query=query)
+        logger.info(
+            f"Query plan: '{query}' -> '{plan.rewritten_query}' | "
+            f"{len(plan.variants)} variant(s) | HyDE={'yes' if plan.hypothetical_passage else 'no'}"
+        )
+        return plan
 
     async def _multi_query_search(
-        self, bot_id: str, queries: List[str], top_k: int
+        self,
+        bot_id: str,
+        queries: List[str],
+        top_k: int,
+        lexical_backend: Optional[str] = None,
+        rerank_pool: Optional[int] = None,
+        rerank_keep: Optional[int] = None,
+        rerank_passage_tokens: Optional[int] = None,
+        oversampling: Optional[float] = None,
+        query_embedding: Optional[List[float]] = None,
+        hyde_passage: Optional[str] = None,
     ) -> List[Dict]:
         """
         Multi-Query Fusion — step 2:
-        Embed each query variant independently (HyDE already applied to first),
-        run _hybrid_search (rerank=False) for each, merge via RRF, then do ONE
-        final Cross-Encoder rerank pass on the merged pool.
+        Embed each query variant independently, run _hybrid_search (rerank=False)
+        for each, merge via RRF, then do ONE final Cross-Encoder rerank pass on
+        the merged pool against queries[0].
+
+        query_embedding: already-computed embedding of queries[0] (saves one embed).
+        hyde_passage: adds one more search whose dense leg uses the passage embedding
+        while the lexical leg keeps queries[0] — keywords come from the question.
 
         Skipping per-variant reranking saves ~(n_variants - 1) expensive CrossEncoder
         calls (e.g., 3 calls → 1 call) while preserving quality via final rerank.
         """
-        async def _search_one(q: str) -> List[Dict]:
-            embedding = await asyncio.to_thread(self._embed_with_retry, q)
-            return await asyncio.to_thread(
-                self._hybrid_search, bot_id, q, embedding, top_k, False  # rerank=False
+        searches = [(q, q, i == 0) for i, q in enumerate(queries)]  # (lexical text, embed text, is primary)
+        if hyde_passage:
+            searches.append((queries[0], hyde_passage, False))
+
+        async def _search_one(q: str, embed_text: str, primary: bool) -> List[Dict]:
+            if primary and query_embedding is not None:
+                embedding = query_embedding
+            else:
+                embedding = await self._embed_query(bot_id, embed_text)
+            return await self._hybrid_search(
+                bot_id, q, embedding, top_k, rerank=False,
+                lexical_backend=lexical_backend, rerank_pool=rerank_pool,
+                oversampling=oversampling, dense_text=embed_text,
             )
 
         results_per_query = await asyncio.gather(
-            *[_search_one(q) for q in queries], return_exceptions=True
+            *[_search_one(*search) for search in searches], return_exceptions=True
         )
 
         k = 60  # standard RRF constant
@@ -1119,26 +2122,29 @@ Answer:"""
             merged.append(item)
 
         # ONE final rerank on the merged pool (replaces 3× per-variant reranks)
-        reranker = self._get_reranker()
-        if reranker and merged:
-            import numpy as np
+        if merged:
             try:
                 primary_query = queries[0]
-                pool = merged[: top_k * 2]
-                pairs = [[primary_query, item["text"]] for item in pool]
-                scores = reranker.predict(pairs, show_progress_bar=False)
-                if isinstance(scores, float):
-                    scores = [scores]
-                norm_scores = _sigmoid(np.array(scores))
-                for i, item in enumerate(pool):
-                    rrf_base = item.get("hybrid_score", 0.0)
-                    item["hybrid_score"] = 0.7 * float(norm_scores[i]) + 0.3 * rrf_base
-                merged = sorted(pool, key=lambda x: x["hybrid_score"], reverse=True)
+                pool = merged[: max(rerank_pool or top_k * 2, top_k)]
+                survivors, norm_scores, _ = await self._arerank_cascade(
+                    primary_query,
+                    [item["text"] for item in pool],
+                    [item.get("id") for item in pool],
+                    bot_id,
+                    max(rerank_keep or 0, top_k),
+                    rerank_passage_tokens,
+                )
+                if survivors is not None:
+                    pool = [pool[i] for i in survivors]
+                    for j, item in enumerate(pool):
+                        rrf_base = item.get("hybrid_score", 0.0)
+                        item["hybrid_score"] = 0.7 * float(norm_scores[j]) + 0.3 * rrf_base
+                    merged = sorted(pool, key=lambda x: x["hybrid_score"], reverse=True)
+                else:
+                    merged.sort(key=lambda x: x["hybrid_score"], reverse=True)
             except Exception as e:
                 logger.warning(f"Multi-query final rerank failed: {e}")
                 merged.sort(key=lambda x: x["hybrid_score"], reverse=True)
-        else:
-            merged.sort(key=lambda x: x["hybrid_score"], reverse=True)
 
         return merged[: top_k * 2]
 
@@ -1175,12 +2181,13 @@ Answer:"""
                 }
             ]
             try:
-                response = await asyncio.to_thread(
-                    self.openrouter.chat_completion,
+                # re-ingesting an unchanged document reuses its prefixes (same lifetime as chunk embeddings)
+                response = await internal_llm_cache.achat_completion(
                     messages=messages,
                     model=INTERNAL_LLM_MODEL,
                     temperature=0.1,
                     max_tokens=80,
+                    ttl=settings.LLM_CACHE_TTL and settings.CHUNK_EMBED_CACHE_TTL,
                 )
                 return response.get("content", "").strip()
             except Exception:
@@ -1222,6 +2229,12 @@ Answer:"""
             effective_top_k = bot_config.get("top_k", profile.retrieval_k)
             # Propagate lightrag mode so _prepare_chat_context can use it
             bot_config.setdefault("_lightrag_mode", profile.lightrag_mode)
+            bot_config.setdefault("_rerank_pool_size", profile.rerank_pool_size)
+            bot_config.setdefault("_rerank_top_n", profile.rerank_top_n)
+            bot_config.setdefault("_rerank_passage_tokens", profile.rerank_passage_tokens)
+            bot_config.setdefault(
+                "_vector_oversampling", bot_config.get("vector_oversampling") or profile.vector_oversampling
+            )
             # If KG is enabled but domain says don't use lightrag, honour the domain default
             # (bot_config.enable_knowledge_graph remains the final gate)
             domain_prompt_suffix = profile.system_prompt_suffix
@@ -1229,23 +2242,25 @@ Answer:"""
             effective_top_k = top_k
             domain_prompt_suffix = ""
 
-        # 1. Check Redis cache
-        if use_cache and self.redis_client:
-            cache_key = f"rag:chat:{bot_id}:{hashlib.md5(query.encode()).hexdigest()}"
-            try:
-                cached_str = await asyncio.to_thread(self.redis_client.get, cache_key)
-                if cached_str:
-                    logger.info(f"Cache HIT for query: {query[:50]}...")
-                    result = json.loads(cached_str)
-                    result["from_cache"] = True
-                    # Recalculate response time
-                    result["response_time"] = round(time.time() - start_time, 3)
-                    return result
-            except Exception as e:
-                logger.warning(f"Redis error: {e}")
+        # 1. Semantic answer cache — a hit skips retrieval, CRAG and generation
+        use_semantic_cache = self._semantic_cache_applies(bot_config, conversation_history, use_cache)
+        if use_semantic_cache:
+            cached, cache_embedding, cache_generation = await self._semantic_cache_lookup(bot_id, query, bot_config)
+            if cached:
+                result = {
+                    **cached,
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                    "response_time": round(time.time() - start_time, 3),
+                    "session_id": session_id,
+                    "from_cache": True,
+                    "message_id": str(uuid.uuid4()),
+                    "memories_used": [],
+                }
+                await self._log_cached_answer(bot_id, session_id, query, bot_config, result)
+                return result
         
         # Prepare context (retrieval, reranking, agent logs)
-        prep = await self._prepare_chat_context(bot_id, query, bot_config, effective_top_k)
+        prep = await self._prepare_chat_context_shared(bot_id, query, bot_config, effective_top_k)
         search_query = prep["search_query"]
         filtered_results = prep["filtered_results"]
         agent_logs = prep["agent_logs"]
@@ -1331,12 +2346,15 @@ Answer:"""
             if conversation_history:
                 messages[1:1] = conversation_history[-5:]
 
-            llm_response = await asyncio.to_thread(
-                self._chat_with_retry,
-                messages=messages,
-                model=model,
-                temperature=temperature,
-                max_tokens=max_tokens
+            # Identical prompts in flight at the same time share one completion
+            llm_response = await single_flight.do(
+                self._flight_key("answer", bot_id, messages, model, temperature, max_tokens),
+                lambda: self._chat_with_retry(
+                    messages=messages,
+                    model=model,
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                ),
             )
             
             response_text = llm_response["content"]
@@ -1382,25 +2400,11 @@ Answer:"""
                 ))
             # ─────────────────────────────────────────────────────────────
 
-            # 9. Cache response
-            if use_cache and self.redis_client:
-                try:
-                    # Remove session-specific or dynamic fields before caching if desired
-                    # But for simple full-response caching we can cache mostly everything.
-                    # Ideally we don't cache session_id or message_id if they are unique per request.
-                    cache_payload = result.copy()
-                    cache_payload.pop("session_id", None)
-                    cache_payload.pop("message_id", None)
-                    cache_payload["from_cache"] = True
-                    
-                    await asyncio.to_thread(
-                        self.redis_client.setex,
-                        cache_key,
-                        3600, # 1 hour TTL
-                        json.dumps(cache_payload)
-                    )
-                except Exception as e:
-                    logger.warning(f"Failed to write to Redis cache: {e}")
+            # 9. Cache response (never answers personalised with user memories)
+            if use_semantic_cache and not user_memories:
+                asyncio.create_task(asyncio.to_thread(
+                    self.semantic_cache.store, bot_id, bot_config, query, cache_embedding, result, cache_generation
+                ))
 
             # 10. Log conversation
             try:
@@ -1428,6 +2432,54 @@ Answer:"""
             logger.error(f"Error in chat: {str(e)}")
             raise
     
+    @staticmethod
+    def _semantic_cache_applies(
+        bot_config: Dict[str, Any], conversation_history: Optional[List[Dict[str, str]]], use_cache: bool = True
+    ) -> bool:
+        """Follow-up turns depend on the history, so only standalone questions are cached."""
+        return bool(
+            use_cache and settings.SEMANTIC_CACHE_ENABLED
+            and bot_config.get("semantic_cache", True) and not conversation_history
+        )
+
+    async def _semantic_cache_lookup(self, bot_id: str, query: str, bot_config: Dict[str, Any]):
+        """
+        (cached result or None, query embedding, bot generation). The embedding lands in
+        embedding_cache, so a miss's retrieval re-uses it instead of embedding twice.
+        """
+        generation, embedding = await self._embed_query_with_generation(bot_id, query)
+        cached = await self.semantic_cache.lookup(
+            self._get_async_qdrant(), bot_id, bot_config, embedding, generation
+        )
+        if cached:
+            logger.info(
+                f"Semantic cache HIT ({cached['cache_similarity']}) for '{query[:50]}' "
+                f"≈ '{(cached.get('cached_query') or '')[:50]}'"
+            )
+        return cached, embedding, generation
+
+    async def _log_cached_answer(
+        self, bot_id: str, session_id: str, query: str, bot_config: Dict[str, Any], result: Dict[str, Any]
+    ):
+        try:
+            await self._log_conversation(
+                bot_id=bot_id,
+                session_id=session_id,
+                user_id=bot_config.get("user_id"),
+                user_message=query,
+                response=result.get("response", ""),
+                sources=result.get("sources", []),
+                response_time=result.get("response_time", 0),
+                model=result.get("model"),
+                usage={"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                retrieved_chunks=result.get("retrieved_chunks", []),
+                reasoning=result.get("reasoning", ""),
+                search_query=result.get("search_query", query),
+                agent_logs=result.get("agent_logs", []),
+            )
+        except Exception as e:
+            logger.error(f"Failed to log cached answer: {e}")
+
     async def _prepare_chat_context(
         self,
         bot_id: str,
@@ -1446,6 +2498,11 @@ Answer:"""
           t=1.5: rewrite done (overlaps with search)
           t=2.8: CRAG + lightrag both done            ← concurrent with each other
           t=2.8: → LLM streaming begins
+
+        Multi-query (enable_multi_query) / HyDE (enable_hyde): the rewrite is replaced by
+        ONE query-planning call returning rewrite + variants + hypothetical passage.
+        Search waits for the plan (lightrag does not), then fuses one search per
+        query/passage via _multi_query_search.
         """
         import time as _time
         _t0 = _time.time()
@@ -1453,6 +2510,12 @@ Answer:"""
         use_kg = bot_config.get("enable_knowledge_graph", False)
         lightrag_mode = bot_config.get("_lightrag_mode", "hybrid")
         similarity_threshold = bot_config.get("similarity_threshold", 0.15)
+        n_variants = (
+            bot_config.get("multi_query_variants") or settings.QUERY_PLAN_VARIANTS
+            if bot_config.get("enable_multi_query") else 0
+        )
+        use_hyde = bool(bot_config.get("enable_hyde"))
+        planned = n_variants > 0 or use_hyde
 
         agent_logs = [{
             "step": "Analyzing Query",
@@ -1463,8 +2526,11 @@ Answer:"""
         # ── Step 1: embed(query) + rewrite(query) — CONCURRENT ─────────────
         # Embed does NOT need the rewritten query — fire both immediately.
         print(f"[PERF] embed+rewrite concurrent", flush=True)
-        embed_task = asyncio.ensure_future(asyncio.to_thread(self._embed_with_retry, query))
-        rewrite_task = asyncio.ensure_future(self._rewrite_query(query))
+        embed_task = asyncio.ensure_future(self._embed_query(bot_id, query))
+        rewrite_task = asyncio.ensure_future(
+            self._plan_query(query, n_variants, use_hyde, bot_config.get("domain", "general")) if planned
+            else self._rewrite_query(query)
+        )
 
         # ── Step 2: search + lightrag — start as soon as embed is ready ────
         # DO NOT await rewrite_task here — search uses original-query embedding.
@@ -1479,9 +2545,16 @@ Answer:"""
 
         async def _run_lightrag(bid: str, q: str, mode: str = "hybrid") -> str:
             try:
+                cache_key, cached = await self._cache_lookup(
+                    "kg", bid, settings.KG_CACHE_TTL, f"{mode}|{normalize_query(q)}"
+                )
+                if cached is not None:
+                    return cached
                 from app.services.lightrag_service import get_lightrag_service
                 svc = get_lightrag_service(bot_id=bid)
                 result = await asyncio.wait_for(svc.query(q, mode=mode), timeout=10.0)
+                if result and cache_key and not result.startswith("Error querying Knowledge Graph"):
+                    asyncio.create_task(self._cache_set(cache_key, encode_value(result), settings.KG_CACHE_TTL))
                 return result or ""
             except asyncio.TimeoutError:
                 logger.warning(f"[PERF] LightRAG timed out (10s) for bot={bid}")
@@ -1491,15 +2564,48 @@ Answer:"""
                 return ""
 
         _t1 = _time.time()
-        # search uses original query embedding (not HyDE — saves 1 LLM call)
-        search_task = asyncio.ensure_future(asyncio.to_thread(
-            self._hybrid_search, bot_id, query, query_embedding, top_k
-        ))
         # lightrag uses original query (rewrite not ready yet)
         lightrag_task = asyncio.ensure_future(
             _run_lightrag(bot_id, query, lightrag_mode) if use_kg
             else asyncio.sleep(0, result="")
         )
+        search_kwargs = dict(
+            lexical_backend=bot_config.get("lexical_backend"),
+            rerank_pool=bot_config.get("_rerank_pool_size"),
+            rerank_keep=bot_config.get("_rerank_top_n"),
+            rerank_passage_tokens=bot_config.get("_rerank_passage_tokens"),
+            oversampling=bot_config.get("_vector_oversampling"),
+        )
+        query_plan: Optional[QueryPlan] = None
+        if planned:
+            # variants / HyDE passage come from the plan — the only step that waits for it
+            query_plan = await rewrite_task
+            queries = [query] + [
+                q for q in [query_plan.rewritten_query, *query_plan.variants] if q != query
+            ]
+            logger.info(
+                f"[PERF] plan done in {_time.time()-_t0:.2f}s → {len(queries)} queries"
+                f"{' + HyDE' if query_plan.hypothetical_passage else ''}"
+            )
+            agent_logs.append({
+                "step": "Query Planning",
+                "description": (
+                    f"One planning call: rewrite + {len(query_plan.variants)} variant(s)"
+                    + (" + hypothetical passage (HyDE)." if query_plan.hypothetical_passage else ".")
+                ),
+                "timestamp": datetime.utcnow().isoformat()
+            })
+            search_task = asyncio.ensure_future(
+                self._multi_query_search(
+                    bot_id, queries, top_k, query_embedding=query_embedding,
+                    hyde_passage=query_plan.hypothetical_passage, **search_kwargs,
+                )
+            )
+        else:
+            # search uses original query embedding (not HyDE — saves 1 LLM call)
+            search_task = asyncio.ensure_future(
+                self._hybrid_search(bot_id, query, query_embedding, top_k, **search_kwargs)
+            )
 
         # ── Step 3: CRAG starts as soon as search is done ──────────────────
         # lightrag keeps running concurrently — we don't block on it here.
@@ -1527,12 +2633,18 @@ Answer:"""
             })
 
         # Rewrite should be done by now (started at t=0, takes ~1.5s; search took ~1.3s from t=0.4)
-        search_query = await rewrite_task
+        search_query = query_plan.rewritten_query if query_plan else await rewrite_task
 
         # CRAG + wait for lightrag — run concurrently
         _t2 = _time.time()
-        crag_task = asyncio.ensure_future(self._crag_classify(search_query, filtered_results))
-        crag_status, lightrag_raw = await asyncio.gather(crag_task, lightrag_task, return_exceptions=True)
+        # CRAG judges the child chunks as retrieved; _attach_parents works on copies
+        crag_task = asyncio.ensure_future(self._crag_classify(search_query, list(filtered_results), bot_id))
+        parents_task = asyncio.ensure_future(self._attach_parents(filtered_results))
+        crag_status, lightrag_raw, with_parents = await asyncio.gather(
+            crag_task, lightrag_task, parents_task, return_exceptions=True
+        )
+        if not isinstance(with_parents, BaseException):
+            filtered_results = with_parents
 
         if isinstance(crag_status, BaseException):
             logger.warning(f"CRAG failed: {crag_status}")
@@ -1602,8 +2714,8 @@ Answer:"""
             "reasoning": reasoning,
             "lightrag_entities": lightrag_entities,
             "crag_status": crag_status,
-            "hyde_hypothesis": "",
-            "multi_query_variants": [],
+            "hyde_hypothesis": (query_plan.hypothetical_passage or "") if query_plan else "",
+            "multi_query_variants": query_plan.variants if query_plan else [],
         }
 
     def _extract_smart_highlights(self, query: str, text: str) -> List[str]:
@@ -1637,6 +2749,36 @@ Answer:"""
         # Unique and sorted by length
         return sorted(list(set(highlights)), key=len, reverse=True)[:10]
 
+    @staticmethod
+    def _flight_key(kind: str, bot_id: str, *parts: Any) -> str:
+        """Single-flight key: identical parts (prompt, model params, ...) → same flight."""
+        digest = hashlib.md5(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+        return f"{kind}:{bot_id}:{digest}"
+
+    async def _prepare_chat_context_shared(
+        self, bot_id: str, query: str, bot_config: Dict[str, Any], top_k: int
+    ) -> Dict[str, Any]:
+        """_prepare_chat_context, run once for concurrent identical questions to the same bot."""
+        key = self._flight_key(
+            "prep", bot_id, normalize_query(query), top_k,
+            [bot_config.get(k) for k in _PREP_CONFIG_KEYS],
+        )
+        return await single_flight.do(
+            key, lambda: self._prepare_chat_context(bot_id, query, bot_config, top_k)
+        )
+
+    def _stream_completion(
+        self, messages: List[Dict[str, str]], model: str, temperature: float, max_tokens: int
+    ) -> AsyncIterator[str]:
+        """
+        Content deltas of a streamed completion, read natively on the event loop.
+        Closing or cancelling the consumer closes the HTTP response, so OpenRouter stops
+        generating and the connection goes back to the pool.
+        """
+        return self.openrouter.astream(
+            messages=messages, model=model, temperature=temperature, max_tokens=max_tokens
+        )
+
     async def chat_stream(
         self,
         bot_id: str,
@@ -1659,11 +2801,44 @@ Answer:"""
             profile = get_domain_profile(domain)
             effective_top_k = bot_config.get("top_k", profile.retrieval_k)
             bot_config.setdefault("_lightrag_mode", profile.lightrag_mode)
+            bot_config.setdefault("_rerank_pool_size", profile.rerank_pool_size)
+            bot_config.setdefault("_rerank_top_n", profile.rerank_top_n)
+            bot_config.setdefault("_rerank_passage_tokens", profile.rerank_passage_tokens)
+            bot_config.setdefault(
+                "_vector_oversampling", bot_config.get("vector_oversampling") or profile.vector_oversampling
+            )
             domain_prompt_suffix = profile.system_prompt_suffix
         except Exception:
             effective_top_k = top_k
             domain_prompt_suffix = ""
 
+        # ── Semantic answer cache: replay a hit immediately ──────────────
+        use_semantic_cache = self._semantic_cache_applies(bot_config, conversation_history)
+        if use_semantic_cache:
+            cached, cache_embedding, cache_generation = await self._semantic_cache_lookup(bot_id, query, bot_config)
+            if cached:
+                yield {
+                    "type": "metadata",
+                    "sources": cached.get("sources", []),
+                    "retrieved_chunks": cached.get("retrieved_chunks", []),
+                    "agent_logs": cached.get("agent_logs", []),
+                    "reasoning": cached.get("reasoning", ""),
+                    "search_query": cached.get("search_query", query),
+                    "session_id": session_id,
+                    "lightrag_entities": cached.get("lightrag_entities", []),
+                    "from_cache": True,
+                }
+                response_text = cached.get("response", "")
+                for i in range(0, len(response_text), 200):
+                    yield {"type": "content", "content": response_text[i:i + 200]}
+                await self._log_cached_answer(
+                    bot_id, session_id, query, bot_config,
+                    {**cached, "response_time": time.time() - start_time},
+                )
+                yield {"type": "done"}
+                return
+        # ─────────────────────────────────────────────────────────────────
+
         # ── Memory search + RAG prep — run concurrently ──────────────────
         user_id = bot_config.get("user_id")
         enable_memory = bot_config.get("enable_memory", True)
@@ -1677,7 +2852,7 @@ Answer:"""
             )
 
         prep, user_memories = await asyncio.gather(
-            self._prepare_chat_context(bot_id, query, bot_config, effective_top_k),
+            self._prepare_chat_context_shared(bot_id, query, bot_config, effective_top_k),
             _fetch_memories(),
         )
         # ─────────────────────────────────────────────────────────────────
@@ -1762,65 +2937,21 @@ Answer:"""
         if conversation_history:
             messages[1:1] = conversation_history[-5:]
 
-        # Streaming from OpenRouter
+        # Streaming from OpenRouter — identical prompts in flight share one token stream
         full_response = ""
+        chunk_count = 0
         try:
-            import queue
-            q = queue.Queue()
-
-            def stream_worker():
-                try:
-                    logger.info(f"[STREAM_WORKER] Starting OpenRouter stream request")
-                    stream_obj = self.openrouter.chat_completion(
-                        messages=messages,
-                        model=model,
-                        temperature=temperature,
-                        max_tokens=max_tokens,
-                        stream=True
-                    )
-
-                    stream_chunk_count = 0
-                    for chk in stream_obj:
-                        stream_chunk_count += 1
-                        q.put(("chunk", chk))
-                    logger.info(f"[STREAM_WORKER] Finished receiving {stream_chunk_count} chunks from OpenRouter")
-                    q.put(("done", None))
-                except Exception as e:
-                    logger.error(f"[STREAM_WORKER] Stream worker error: {e}", exc_info=True)
-                    q.put(("error", e))
-
-            # Start worker thread
-            logger.info(f"[CHAT_STREAM] Starting worker thread for OpenRouter streaming")
-            worker_thread = asyncio.get_running_loop().run_in_executor(None, stream_worker)
-
-            chunk_count = 0
-            while True:
-                # Poll queue safely
-                try:
-                    logger.debug(f"[CHAT_STREAM] Polling queue... (chunk_count={chunk_count})")
-                    item_type, item_data = await asyncio.to_thread(q.get)
-                    logger.debug(f"[CHAT_STREAM] Got item from queue: type={item_type}")
-                except Exception as e:
-                    logger.error(f"[CHAT_STREAM] Error polling queue: {e}")
-                    break
-
-                if item_type == "done":
-                    logger.info(f"[CHAT_STREAM] Stream completed (done signal)")
-                    break
-                elif item_type == "error":
-                    logger.error(f"[CHAT_STREAM] Stream error received: {item_data}")
-                    break
-                elif item_type == "chunk":
+            # aclosing: a disconnected client (generator closed / task cancelled) releases
+            # the flight at once, and the last reader to leave stops the upstream stream
+            async with contextlib.aclosing(single_flight.stream(
+                self._flight_key("stream", bot_id, messages, model, temperature, max_tokens),
+                lambda: self._stream_completion(messages, model, temperature, max_tokens),
+            )) as contents:
+                async for content in contents:
                     chunk_count += 1
-                    logger.debug(f"[CHAT_STREAM] Processing chunk #{chunk_count}")
-                    if getattr(item_data, "choices", None) and len(item_data.choices) > 0:
-                        delta = getattr(item_data.choices[0], "delta", None)
-                        if delta and getattr(delta, "content", None):
-                            content = delta.content
-                            full_response += content
-                            logger.debug(f"[CHAT_STREAM] Yielding content chunk: {len(content)} chars")
-                            yield {"type": "content", "content": content}
-                            
+                    full_response += content
+                    yield {"type": "content", "content": content}
+
             logger.info(f"Finished streaming {chunk_count} chunks. Full response length: {len(full_response)}")
             if len(full_response) == 0:
                 logger.warning("Warning: Generated response is empty!")
@@ -1849,6 +2980,17 @@ Answer:"""
             except Exception as log_err:
                 logger.error(f"[STREAM] Failed to log conversation: {log_err}", exc_info=True)
 
+            if use_semantic_cache and full_response and not user_memories:
+                asyncio.create_task(asyncio.to_thread(
+                    self.semantic_cache.store, bot_id, bot_config, query, cache_embedding,
+                    {
+                        "response": full_response, "sources": sources, "retrieved_chunks": filtered_results,
+                        "agent_logs": agent_logs, "reasoning": reasoning, "model": model,
+                        "search_query": search_query, "lightrag_entities": lightrag_entities,
+                    },
+                    cache_generation,
+                ))
+
             # Memory saving (non-blocking)
             if enable_memory and user_id and full_response:
                 asyncio.create_task(memory_service.add(
@@ -1862,6 +3004,9 @@ Answer:"""
 
             yield {"type": "done"}
             
+        except (asyncio.CancelledError, GeneratorExit):
+            logger.info(f"[CHAT_STREAM] Client disconnected after {chunk_count} chunks (bot={bot_id})")
+            raise
         except Exception as e:
             logger.error(f"Error in chat_stream: {e}")
             yield {"type": "error", "message": str(e)}
@@ -1946,8 +3091,7 @@ Answer:"""
                 {"role": "system", "content": "You are a helpful assistant. Create a very short title (max 5 words) for a chat conversation starting with the user message below. Output ONLY the title, no quotes or prefix. The title MUST be in Vietnamese (Tiếng Việt)."},
                 {"role": "user", "content": first_message}
             ]
-            response = await asyncio.to_thread(
-                self.openrouter.chat_completion,
+            response = await internal_llm_cache.achat_completion(
                 messages=prompt,
                 model=INTERNAL_LLM_MODEL,
                 temperature=0.3,
@@ -2097,36 +3241,24 @@ Answer:"""
             return False
     
     def invalidate_bot_cache(self, bot_id: str):
-        """Invalidate all cached queries for a specific bot."""
-        if not self.redis_client:
-            return
-        
+        """
+        Retire every cached answer, retrieval result, rerank score and KG context of a bot:
+        one INCR of its cache generation (see cache_generation). Old entries are never read
+        again and expire by TTL. Blocking — for Celery tasks and sync endpoints.
+        """
+        self.rerank_cache.clear_local(bot_id)  # frees memory only
         try:
-            pattern = f"rag:chat:{bot_id}:*"
-            cursor = 0
-            deleted_count = 0
-            
-            while True:
-                cursor, keys = self.redis_client.scan(
-                    cursor=cursor,
-                    match=pattern,
-                    count=100
-                )
-                if keys:
-                    self.redis_client.delete(*keys)
-                    deleted_count += len(keys)
-                if cursor == 0:
-                    break
-            
-            logger.info(f"Invalidated {deleted_count} cached queries for bot {bot_id}")
+            if bot_cache_generations.bump_sync(bot_id) is None:
+                # No Redis: generations are stuck at 0, so the answers have to go explicitly
+                self.semantic_cache.purge_bot(bot_id)
         except Exception as e:
             logger.error(f"Cache invalidation failed for bot {bot_id}: {e}")
 
     async def invalidate_bot_cache_async(self, bot_id: str):
-        """Async wrapper to avoid blocking event loop."""
-        if not self.redis_client:
-            return
-        await asyncio.to_thread(self.invalidate_bot_cache, bot_id)
+        """invalidate_bot_cache on the shared async Redis pool."""
+        self.rerank_cache.clear_local(bot_id)
+        if await bot_cache_generations.bump(bot_id) is None:
+            await asyncio.to_thread(self.semantic_cache.purge_bot, bot_id)
 
 
 # Singleton instance
@@ -2139,3 +3271,23 @@ def get_openrouter_rag_service() -> OpenRouterRAGService:
     if _openrouter_rag_service is None:
         _openrouter_rag_service = OpenRouterRAGService()
     return _openrouter_rag_service
+
+
+async def run_closing_loop_clients(awaitable: Awaitable[Any]) -> Any:
+    """
+    Await `awaitable`, then close the clients cached for the running event loop
+    (async Qdrant, OpenRouter, Redis). Celery tasks wrap their asyncio.run() coroutine
+    in it: each task gets a fresh loop, and those clients would otherwise keep the
+    closed loop and its sockets alive for the life of the worker.
+    """
+    try:
+        return await awaitable
+    finally:
+        try:
+            if _openrouter_rag_service is not None:
+                await _openrouter_rag_service.aclose()
+            else:
+                await get_openrouter_service().aclose()
+            await close_loop_redis()
+        except Exception as e:
+            logger.warning(f"Closing event-loop clients failed (non-critical): {e}")
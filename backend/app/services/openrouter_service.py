@@ -6,13 +6,17 @@ Supports:
 - Embeddings generation  
 - Provider routing and fallbacks
 - Caching and error handling
+- Native async calls (achat_completion / astream / aembed) on a long-lived
+  AsyncOpenAI client per event loop: keep-alive + HTTP/2 pool, explicit timeouts
 """
 
 import asyncio
 import logging
 import hashlib
+import weakref
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Dict, Any, Optional, Union
+from typing import AsyncIterator, List, Dict, Any, Optional, Union
+import httpx
 from openai import AsyncOpenAI, OpenAI, OpenAIError
 from app.core.config import settings
 import time
@@ -20,6 +24,43 @@ import json
 
 logger = logging.getLogger(__name__)
 
+# Native output size of the API embedding models we know (others assumed 1536)
+NATIVE_EMBEDDING_DIMS = {
+    "openai/text-embedding-3-small": 1536,
+    "openai/text-embedding-3-large": 3072,
+    "openai/text-embedding-ada-002": 1536,
+}
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+
+def _http_timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        connect=settings.OPENROUTER_CONNECT_TIMEOUT,
+        read=settings.OPENROUTER_READ_TIMEOUT,
+        write=settings.OPENROUTER_CONNECT_TIMEOUT,
+        pool=settings.OPENROUTER_CONNECT_TIMEOUT,
+    )
+
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.OPENROUTER_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.OPENROUTER_MAX_KEEPALIVE,
+        keepalive_expiry=settings.OPENROUTER_KEEPALIVE_EXPIRY,
+    )
+
+
+def _http2_available() -> bool:
+    if not settings.OPENROUTER_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401  (httpx[http2])
+        return True
+    except ImportError:
+        logger.warning("OPENROUTER_HTTP2 is set but h2 is not installed; using HTTP/1.1 keep-alive")
+        return False
+
 
 class OpenRouterService:
     """
@@ -49,7 +90,12 @@ class OpenRouterService:
         """
         self.api_key = api_key or settings.OPENROUTER_API_KEY
         self.chat_model = chat_model or settings.OPENROUTER_CHAT_MODEL
-        self.embedding_model = embedding_model or settings.OPENROUTER_EMBEDDING_MODEL
+        # USE_LOCAL_EMBEDDINGS switches the default embedding model to the in-process
+        # LOCAL_EMBEDDING_MODEL (see local_embedding_service.py); either kind can still
+        # be requested explicitly through `model=`.
+        self.embedding_model = embedding_model or (
+            settings.LOCAL_EMBEDDING_MODEL if settings.USE_LOCAL_EMBEDDINGS else settings.OPENROUTER_EMBEDDING_MODEL
+        )
         self.enable_fallbacks = enable_fallbacks
         
         # Prepare headers
@@ -59,14 +105,22 @@ class OpenRouterService:
         if site_name:
             headers["X-Title"] = site_name
 
-        # Stored for AsyncOpenAI client reconstruction inside embed_batch_async
+        # Shared by the sync client and every per-loop async client
         self._default_headers = headers if len(headers) > 1 else None
+        self._http2 = _http2_available()
 
         # Initialize OpenAI client with OpenRouter base URL
         self.client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
+            base_url=OPENROUTER_BASE_URL,
             api_key=self.api_key,
-            default_headers=self._default_headers
+            default_headers=self._default_headers,
+            max_retries=settings.OPENROUTER_MAX_RETRIES,
+            http_client=httpx.Client(http2=self._http2, limits=_http_limits(), timeout=_http_timeout()),
+        )
+        # Async clients, one per event loop: httpx pools are bound to the loop that
+        # created them, and Celery tasks run each job in a fresh asyncio.run() loop.
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = (
+            weakref.WeakKeyDictionary()
         )
         
         logger.info(
@@ -103,68 +157,20 @@ class OpenRouterService:
         Returns:
             Response dict with 'content', 'usage', 'model' etc.
         """
-        model = model or self.chat_model
-        
         try:
             start_time = time.time()
-            
-            # Build request parameters
+            params = self._chat_params(
+                messages, model, stream, temperature, max_tokens,
+                response_format, tools, provider_preferences, **kwargs
+            )
 
-            # Build request parameters
-            params = {
-                "model": model,
-                "messages": messages,
-                "stream": stream,
-                "temperature": temperature,
-                **kwargs
-            }
-            
-            # Additional params go either directly or into extra_body for OpenAI client compatibility
-            extra_body = {}
-            if max_tokens:
-                params["max_tokens"] = max_tokens
-            if response_format:
-                params["response_format"] = response_format
-            if tools:
-                params["tools"] = tools
-                
-            # Handle provider routing via extra_body
-            if provider_preferences:
-                extra_body["provider"] = provider_preferences
-            elif self.enable_fallbacks:
-                # Enable automatic fallbacks by default
-                extra_body["provider"] = {"allow_fallbacks": True}
-            
-            if extra_body:
-                params["extra_body"] = extra_body
-            
             # Make API call
             response = self.client.chat.completions.create(**params)
             
-            elapsed_time = time.time() - start_time
-            
             # Parse response
             if stream:
                 return response  # Return generator for streaming
-            else:
-                result = {
-                    "content": response.choices[0].message.content,
-                    "model": response.model,
-                    "finish_reason": response.choices[0].finish_reason,
-                    "usage": {
-                        "prompt_tokens": response.usage.prompt_tokens,
-                        "completion_tokens": response.usage.completion_tokens,
-                        "total_tokens": response.usage.total_tokens,
-                    },
-                    "response_time": round(elapsed_time, 2)
-                }
-                
-                # Add tool calls if present
-                if hasattr(response.choices[0].message, 'tool_calls') and response.choices[0].message.tool_calls:
-                    result["tool_calls"] = response.choices[0].message.tool_calls
-                
-                logger.info(f"Chat completion successful: model={response.model}, tokens={response.usage.total_tokens}, time={elapsed_time:.2f}s")
-                return result
+            return self._completion_result(response, time.time() - start_time)
                 
         except OpenAIError as e:
             logger.error(f"OpenRouter API error: {str(e)}")
@@ -173,6 +179,180 @@ class OpenRouterService:
             logger.error(f"Unexpected error in chat_completion: {str(e)}")
             raise
     
+    def _chat_params(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str],
+        stream: bool,
+        temperature: float,
+        max_tokens: Optional[int],
+        response_format: Optional[Dict[str, str]],
+        tools: Optional[List[Dict[str, Any]]],
+        provider_preferences: Optional[Dict[str, Any]],
+        **kwargs
+    ) -> Dict[str, Any]:
+        """Request parameters shared by the sync and async chat calls."""
+        params = {
+            "model": model or self.chat_model,
+            "messages": messages,
+            "stream": stream,
+            "temperature": temperature,
+            **kwargs
+        }
+        
+        # Additional params go either directly or into extra_body for OpenAI client compatibility
+        extra_body = {}
+        if max_tokens:
+            params["max_tokens"] = max_tokens
+        if response_format:
+            params["response_format"] = response_format
+        if tools:
+            params["tools"] = tools
+            
+        # Handle provider routing via extra_body
+        if provider_preferences:
+            extra_body["provider"] = provider_preferences
+        elif self.enable_fallbacks:
+            # Enable automatic fallbacks by default
+            extra_body["provider"] = {"allow_fallbacks": True}
+        
+        if extra_body:
+            params["extra_body"] = extra_body
+        return params
+
+    @staticmethod
+    def _completion_result(response, elapsed_time: float) -> Dict[str, Any]:
+        result = {
+            "content": response.choices[0].message.content,
+            "model": response.model,
+            "finish_reason": response.choices[0].finish_reason,
+            "usage": {
+                "prompt_tokens": response.usage.prompt_tokens,
+                "completion_tokens": response.usage.completion_tokens,
+                "total_tokens": response.usage.total_tokens,
+            },
+            "response_time": round(elapsed_time, 2)
+        }
+        
+        # Add tool calls if present
+        if hasattr(response.choices[0].message, 'tool_calls') and response.choices[0].message.tool_calls:
+            result["tool_calls"] = response.choices[0].message.tool_calls
+        
+        logger.info(f"Chat completion successful: model={response.model}, tokens={response.usage.total_tokens}, time={elapsed_time:.2f}s")
+        return result
+
+    # ─── Async API (no thread hops) ───────────────────────────────────────
+
+    def async_client(self) -> AsyncOpenAI:
+        """The AsyncOpenAI client bound to the running event loop (created on first use)."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = AsyncOpenAI(
+                base_url=OPENROUTER_BASE_URL,
+                api_key=self.api_key,
+                default_headers=self._default_headers,
+                max_retries=settings.OPENROUTER_MAX_RETRIES,
+                http_client=httpx.AsyncClient(http2=self._http2, limits=_http_limits(), timeout=_http_timeout()),
+            )
+        return client
+
+    async def achat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        response_format: Optional[Dict[str, str]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        provider_preferences: Optional[Dict[str, Any]] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """chat_completion (non-streaming) awaited on the event loop's pooled client."""
+        try:
+            start_time = time.time()
+            params = self._chat_params(
+                messages, model, False, temperature, max_tokens,
+                response_format, tools, provider_preferences, **kwargs
+            )
+            response = await self.async_client().chat.completions.create(**params)
+            return self._completion_result(response, time.time() - start_time)
+        except OpenAIError as e:
+            logger.error(f"OpenRouter API error: {str(e)}")
+            raise
+
+    async def astream(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        provider_preferences: Optional[Dict[str, Any]] = None,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """
+        Content deltas of a streamed completion. Closing the iterator (or cancelling
+        the task consuming it) closes the HTTP response, which stops the generation
+        upstream and returns the connection to the pool.
+        """
+        params = self._chat_params(
+            messages, model, True, temperature, max_tokens, None, None, provider_preferences, **kwargs
+        )
+        stream = await self.async_client().chat.completions.create(**params)
+        try:
+            async for chunk in stream:
+                if chunk.choices:
+                    delta = chunk.choices[0].delta
+                    if delta and delta.content:
+                        yield delta.content
+        finally:
+            await stream.close()
+
+    async def aembed(
+        self,
+        texts: Union[str, List[str]],
+        model: Optional[str] = None,
+        provider_preferences: Optional[Dict[str, Any]] = None
+    ) -> Union[List[float], List[List[float]]]:
+        """generate_embeddings awaited on the event loop's pooled client."""
+        model = model or self.embedding_model
+        if self.is_local_model(model):
+            # In-process model inference is CPU work; keep it off the loop
+            return await asyncio.to_thread(self.generate_embeddings, texts, model)
+
+        single_input = isinstance(texts, str)
+        params = {"model": model, "input": [texts] if single_input else texts}
+        if provider_preferences:
+            params["extra_body"] = {"provider": provider_preferences}
+        elif self.enable_fallbacks:
+            params["extra_body"] = {"provider": {"allow_fallbacks": True}}
+
+        try:
+            response = await self.async_client().embeddings.create(**params)
+        except OpenAIError as e:
+            logger.error(f"OpenRouter embeddings API error: {str(e)}")
+            raise
+        embeddings = [item.embedding for item in response.data]
+        return embeddings[0] if single_input else embeddings
+
+    async def aclose(self):
+        """Close the running loop's async client (app shutdown)."""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+    @staticmethod
+    def is_local_model(model: str) -> bool:
+        return model == settings.LOCAL_EMBEDDING_MODEL
+
+    def embedding_dim_for(self, model: Optional[str] = None) -> int:
+        """Native dimension of `model` (default: the configured embedding model)."""
+        model = model or self.embedding_model
+        if self.is_local_model(model):
+            from app.services.local_embedding_service import get_local_embedding_provider
+            return get_local_embedding_provider().dimension
+        return NATIVE_EMBEDDING_DIMS.get(model, 1536)
+
     def generate_embeddings(
         self,
         texts: Union[str, List[str]],
@@ -198,6 +378,11 @@ class OpenRouterService:
             single_input = True
         else:
             single_input = False
+
+        if self.is_local_model(model):
+            from app.services.local_embedding_service import get_local_embedding_provider
+            embeddings = get_local_embedding_provider().embed(texts)
+            return embeddings[0] if single_input else embeddings
         
         try:
             start_time = time.time()
@@ -290,6 +475,10 @@ class OpenRouterService:
         max_workers=3 by default to avoid hitting OpenRouter rate limits when
         multiple Celery workers run simultaneously (4 workers × 3 threads = 12 calls).
         """
+        if self.is_local_model(model or self.embedding_model):
+            # Local inference batches internally; parallel threads would only contend for the CPU
+            return self.generate_embeddings(texts, model=model)
+
         batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
         all_embeddings: List[List[float]] = [None] * len(batches)
 
@@ -319,25 +508,24 @@ class OpenRouterService:
         Tất cả batches được fired gần như cùng lúc. Semaphore giới hạn số batch
         đang active → thời gian tổng ≈ thời gian của batch chậm nhất (+ overhead nhỏ).
 
-        NOTE: AsyncOpenAI client được tạo bên trong function (không phải __init__)
-        vì mỗi asyncio.run() tạo event loop mới — client phải cùng loop với caller.
+        Dùng client async của event loop hiện tại (async_client()) — không tạo client
+        mới, nên không phải bắt tay TLS lại mỗi lần gọi.
         """
         from openai import RateLimitError as AsyncRateLimitError
 
+        if self.is_local_model(model or self.embedding_model):
+            return await asyncio.to_thread(self.generate_embeddings, texts, model)
+
         batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
         all_embeddings: List[Optional[List[List[float]]]] = [None] * len(batches)
         sem = asyncio.Semaphore(concurrency)
         embed_model = model or self.embedding_model
 
-        async def _fetch_one(idx: int, batch: List[str], client: AsyncOpenAI) -> None:
+        async def _fetch_one(idx: int, batch: List[str]) -> None:
             async with sem:
                 for attempt in range(max_retries):
                     try:
-                        response = await client.embeddings.create(
-                            model=embed_model,
-                            input=batch
-                        )
-                        all_embeddings[idx] = [item.embedding for item in response.data]
+                        all_embeddings[idx] = await self.aembed(batch, model=embed_model)
                         logger.debug(f"Async embedding batch {idx + 1}/{len(batches)} done")
                         return
                     except AsyncRateLimitError:
@@ -350,16 +538,10 @@ class OpenRouterService:
                         )
                         await asyncio.sleep(wait)
 
-        # AsyncOpenAI tạo ở đây — cùng event loop với asyncio.gather()
-        async with AsyncOpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=self.api_key,
-            default_headers=self._default_headers
-        ) as async_client:
-            await asyncio.gather(*[
-                _fetch_one(idx, batch, async_client)
-                for idx, batch in enumerate(batches)
-            ])
+        await asyncio.gather(*[
+            _fetch_one(idx, batch)
+            for idx, batch in enumerate(batches)
+        ])
 
         return [emb for batch_result in all_embeddings for emb in batch_result]
 
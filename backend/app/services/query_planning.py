@@ -0,0 +1,138 @@
+"""
+Query planning: one structured-output call for every pre-retrieval rewrite.
+
+Rewriting, multi-query variants and HyDE used to be three INTERNAL_LLM_MODEL
+round-trips over the same input. A plan asks for all of them in one JSON response
+(`_rewrite_query` remains for turns that need only the rewrite):
+
+    {"rewritten_query": "...", "variants": ["...", "..."], "hypothetical_passage": "..."}
+
+The response is validated field by field: a malformed variant list or passage is
+dropped on its own, and anything unusable falls back to the original query, so a
+bad plan degrades to plain single-query retrieval instead of failing the turn.
+"""
+import json
+import logging
+import re
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field, ValidationError
+
+logger = logging.getLogger(__name__)
+
+MAX_VARIANTS = 5
+_MAX_QUERY_CHARS = 500
+_MAX_PASSAGE_CHARS = 2000
+
+# Same register as the HyDE prompts: the passage should read like the bot's documents
+HYPOTHESIS_HINTS = {
+    "legal": (
+        "một đoạn văn pháp lý ngắn (4-6 câu) như thể trích từ văn bản quy phạm pháp luật, "
+        "hợp đồng hoặc hướng dẫn pháp lý; dùng ngôn ngữ pháp lý chính thức, trích dẫn điều khoản nếu phù hợp"
+    ),
+    "education": (
+        "một đoạn giải thích học thuật ngắn (4-6 câu) như thể trích từ sách giáo khoa "
+        "hoặc tài liệu giảng dạy; dùng ngôn ngữ rõ ràng, có ví dụ minh họa nếu phù hợp"
+    ),
+    "sales": (
+        "một đoạn mô tả sản phẩm/dịch vụ ngắn (4-6 câu) như thể trích từ tài liệu kinh doanh, "
+        "brochure hoặc catalog; nhấn mạnh lợi ích và đặc điểm nổi bật"
+    ),
+    "general": "một đoạn văn ngắn (4-6 câu) như thể trích từ tài liệu tham khảo",
+}
+
+
+class QueryPlan(BaseModel):
+    rewritten_query: str = Field(min_length=1)
+    variants: List[str] = Field(default_factory=list)
+    hypothetical_passage: Optional[str] = None
+
+
+def build_plan_messages(query: str, n_variants: int, hyde: bool, domain: str = "general") -> List[Dict[str, str]]:
+    fields = ['"rewritten_query": câu truy vấn tìm kiếm ngắn gọn, súc tích, chứa nhiều từ khóa quan trọng, giữ nguyên ý nghĩa']
+    if n_variants:
+        fields.append(
+            f'"variants": mảng đúng {n_variants} cách diễn đạt khác của câu hỏi, mỗi cách tiếp cận '
+            "từ một góc độ hoặc dùng từ khóa khác nhau để mở rộng phạm vi tìm kiếm"
+        )
+    if hyde:
+        hint = HYPOTHESIS_HINTS.get(domain, HYPOTHESIS_HINTS["general"])
+        fields.append(
+            f'"hypothetical_passage": {hint}, có thể trả lời câu hỏi; chỉ đoạn văn thuần túy, không tiêu đề'
+        )
+    system_prompt = (
+        "Bạn là chuyên gia tối ưu hóa tìm kiếm cho hệ thống RAG. "
+        "KHÔNG TRẢ LỜI CÂU HỎI. Chỉ trả về một JSON object với các trường:\n- "
+        + "\n- ".join(fields)
+        + "\n\nVí dụ rewritten_query:\n"
+        '- User: "cái app này đăng nhập không được, nó báo lỗi tùm lum tà la" → '
+        '"lỗi không đăng nhập được ứng dụng mobile báo lỗi hệ thống"\n'
+        '- User: "figure 2 là cái gì" → "chi tiết mô tả nội dung Figure 2 hình ảnh 2 trong tài liệu"'
+    )
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": query},
+    ]
+
+
+def plan_max_tokens(n_variants: int, hyde: bool) -> int:
+    return 80 + 60 * n_variants + (300 if hyde else 0)
+
+
+def _json_object(content: str) -> Optional[Dict[str, Any]]:
+    """The JSON object in a model response, tolerating code fences and surrounding prose."""
+    content = re.sub(r"^```(?:json)?\s*|\s*```$", "", content.strip())
+    start, end = content.find("{"), content.rfind("}")
+    if start < 0 or end <= start:
+        return None
+    try:
+        data = json.loads(content[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def is_plan_response(content: str) -> bool:
+    """Worth memoizing: the response holds a JSON object (field validation happens in parse_plan)."""
+    return _json_object(content or "") is not None
+
+
+def _clean(text: Any, limit: int) -> str:
+    return " ".join(text.split())[:limit] if isinstance(text, str) else ""
+
+
+def parse_plan(content: str, query: str, n_variants: int, hyde: bool) -> QueryPlan:
+    """
+    Validated plan from a model response; never raises. Fields that fail validation
+    fall back individually: the original query, no variants, no passage.
+    """
+    data = _json_object(content or "")
+    if data is None:
+        logger.warning("Query plan is not a JSON object, using the original query")
+        return QueryPlan(rewritten_query=query)
+    try:
+        plan = QueryPlan.model_validate(data)
+    except ValidationError as e:
+        logger.warning(f"Query plan failed validation, salvaging fields: {e.error_count()} error(s)")
+        plan = QueryPlan(
+            rewritten_query=_clean(data.get("rewritten_query"), _MAX_QUERY_CHARS) or query,
+            variants=[v for v in data.get("variants") or [] if isinstance(v, str)]
+            if isinstance(data.get("variants"), list) else [],
+            hypothetical_passage=data.get("hypothetical_passage")
+            if isinstance(data.get("hypothetical_passage"), str) else None,
+        )
+
+    rewritten = _clean(plan.rewritten_query, _MAX_QUERY_CHARS) or query
+    seen = {query.casefold(), rewritten.casefold()}
+    variants = []
+    for variant in plan.variants:
+        variant = _clean(re.sub(r"^\d+\.\s*", "", variant), _MAX_QUERY_CHARS)
+        if variant and variant.casefold() not in seen:
+            seen.add(variant.casefold())
+            variants.append(variant)
+    passage = _clean(plan.hypothetical_passage, _MAX_PASSAGE_CHARS) if hyde else ""
+    return QueryPlan(
+        rewritten_query=rewritten,
+        variants=variants[:min(n_variants, MAX_VARIANTS)],
+        hypothetical_passage=passage or None,
+    )
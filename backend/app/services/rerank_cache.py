@@ -0,0 +1,99 @@
+"""
+Two-tier cache of Cross-Encoder scores: in-process LRU → Redis.
+
+Key: (bot_id, bot cache generation, reranker model, normalized query hash, Qdrant
+point id) → raw score. Point ids are derived from chunk content at ingest, so a
+changed chunk gets a new id and never hits a stale score; a document change also
+bumps the bot's generation (see cache_generation), which retires every entry of
+the bot in both tiers at once.
+
+Redis layout: one hash per (bot, generation, model, query) —
+`rag:rerank:{bot_id}:g{gen}:{model}:{query}` with point ids as fields — so a whole
+candidate pool is one HMGET / one HSET.
+"""
+import hashlib
+import logging
+import re
+import unicodedata
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.db.redis import get_redis
+from app.services.cache_generation import bot_cache_generations
+from app.services.cache_service import LRUCache
+
+logger = logging.getLogger(__name__)
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """NFC + lowercase + collapsed whitespace, so trivially different phrasings share entries."""
+    return _WS_RE.sub(" ", unicodedata.normalize("NFC", query or "").lower()).strip()
+
+
+class RerankScoreCache:
+    """(query, point id) → Cross-Encoder raw score, per bot and reranker model."""
+
+    def __init__(self):
+        self.local = LRUCache(settings.RERANK_CACHE_LOCAL_SIZE, settings.RERANK_CACHE_LOCAL_TTL)
+        # ONNX int8 scores differ slightly from torch — keep engines apart. The ONNX tag
+        # carries PARITY_VERSION so scores from an older predict() are never reused.
+        engine = settings.RERANKER_ENGINE
+        if engine == "onnx":
+            from app.services.onnx_reranker import PARITY_VERSION
+            engine = f"onnx{PARITY_VERSION}"
+        self.model_tag = hashlib.md5(f"{settings.RERANKER_MODEL}|{engine}".encode()).hexdigest()[:8]
+
+    def _query_hash(self, query: str) -> str:
+        return hashlib.md5(normalize_query(query).encode()).hexdigest()
+
+    def _redis_key(self, bot_id: str, generation: int, query_hash: str) -> str:
+        return bot_cache_generations.key("rerank", bot_id, generation, self.model_tag, query_hash)
+
+    async def get_many(
+        self, bot_id: str, query: str, point_ids: List[Optional[str]], generation: int = 0
+    ) -> Dict[str, float]:
+        """Cached raw scores for whichever of `point_ids` have one (one HMGET for the rest)."""
+        qhash = self._query_hash(query)
+        found: Dict[str, float] = {}
+        remote = []
+        for pid in point_ids:
+            if pid is None:
+                continue
+            score = self.local.get((bot_id, generation, self.model_tag, qhash, pid))
+            if score is None:
+                remote.append(pid)
+            else:
+                found[pid] = score
+
+        if remote:
+            try:
+                values = await get_redis().hmget(self._redis_key(bot_id, generation, qhash), remote)
+                for pid, value in zip(remote, values):
+                    if value is not None:
+                        found[pid] = float(value)
+                        self.local.set((bot_id, generation, self.model_tag, qhash, pid), found[pid])
+            except Exception as e:
+                logger.warning(f"Rerank cache read failed (treating as miss): {e}")
+        return found
+
+    async def set_many(self, bot_id: str, query: str, scores: Dict[str, float], generation: int = 0):
+        if not scores:
+            return
+        qhash = self._query_hash(query)
+        for pid, score in scores.items():
+            self.local.set((bot_id, generation, self.model_tag, qhash, pid), score)
+        try:
+            key = self._redis_key(bot_id, generation, qhash)
+            pipe = get_redis().pipeline(transaction=False)
+            # str(float()): repr of a NumPy 2 scalar is "np.float64(1.5)", which float() can't parse
+            pipe.hset(key, mapping={pid: str(float(score)) for pid, score in scores.items()})
+            pipe.expire(key, settings.RERANK_CACHE_TTL)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Rerank cache write failed (non-critical): {e}")
+
+    def clear_local(self, bot_id: str) -> int:
+        """Free this worker's LRU entries for a bot (older generations are unreachable anyway)."""
+        return self.local.discard_where(lambda key: key[0] == bot_id)
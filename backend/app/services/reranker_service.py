@@ -0,0 +1,253 @@
+"""
+Cross-Encoder reranker: model loading, shared sidecar server and its client.
+
+RERANKER_ENGINE picks the model runtime: "torch" (sentence-transformers) or
+"onnx" (onnxruntime, optionally int8 — see onnx_reranker.py).
+
+RERANKER_BACKEND="local"   — every API worker loads its own model (original behaviour).
+RERANKER_BACKEND="sidecar" — one reranker process per host owns the model and serves
+all workers over a unix socket:
+
+    python -m app.services.reranker_service
+
+Concurrent requests' (query, passage) pairs are merged into micro-batches: the
+batcher takes the first waiting request, then keeps collecting for at most
+RERANKER_MAX_WAIT_MS or until RERANKER_MAX_BATCH_PAIRS pairs, and runs a single
+predict. Under load this turns many small forward passes into few large ones;
+at low load the added latency is bounded by the wait window.
+
+Wire protocol: 4-byte big-endian length + UTF-8 JSON, both directions.
+  request  {"pairs": [[query, passage], ...]}
+  response {"scores": [float, ...]}  or  {"error": "..."}
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Sequence
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct(">I")
+
+
+def load_cross_encoder():
+    """Load settings.RERANKER_MODEL with the configured RERANKER_ENGINE.
+
+    "onnx" falls back to torch if onnxruntime/export is unavailable, so a
+    misconfigured node still reranks rather than silently skipping it.
+    """
+    reranker_model = getattr(settings, "RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+    if settings.RERANKER_ENGINE == "onnx":
+        try:
+            from app.services.onnx_reranker import load_onnx_cross_encoder
+            return load_onnx_cross_encoder(reranker_model)
+        except Exception as e:
+            logger.warning(f"ONNX reranker unavailable ({e}); falling back to torch")
+    return load_torch_cross_encoder(reranker_model)
+
+
+def load_torch_cross_encoder(reranker_model: str, device: str = None):
+    """Load a sentence-transformers CrossEncoder on the best available device.
+
+    Device priority: CUDA → MPS (Apple Silicon, native macOS only) → CPU.
+    Note: MPS is unavailable inside Docker on Mac (Linux VM has no Metal access).
+    To use MPS/GPU on M1/M2/M3, run backend natively: uvicorn app.main:app --port 8000
+    """
+    import torch
+    from sentence_transformers import CrossEncoder
+
+    model_cache_dir = os.getenv('HF_HOME', '/tmp/huggingface_cache')
+    os.makedirs(model_cache_dir, exist_ok=True)
+
+    # Auto-detect best available device unless pinned by the caller
+    if device is None:
+        if torch.cuda.is_available():
+            device = "cuda"
+        elif torch.backends.mps.is_available():
+            device = "mps"
+        else:
+            device = "cpu"
+
+    print(f"[Reranker] Loading {reranker_model} on {device.upper()}...", flush=True)
+    model = CrossEncoder(
+        reranker_model,
+        device=device,
+        automodel_args={'cache_dir': model_cache_dir},
+        tokenizer_args={'cache_dir': model_cache_dir}
+    )
+    print(f"[Reranker] Loaded on {device.upper()} ✓", flush=True)
+    return model
+
+
+# ─── Framing ──────────────────────────────────────────────────────────────────
+
+def _encode(message: dict) -> bytes:
+    body = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    return _HEADER.pack(len(body)) + body
+
+
+def _recv_exactly(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("Reranker sidecar closed the connection")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+# ─── Client (used by API workers) ─────────────────────────────────────────────
+
+class RerankerClient:
+    """
+    Drop-in for CrossEncoder.predict backed by the sidecar.
+
+    Blocking by design: callers already run predict via asyncio.to_thread, and the
+    thread only waits on the socket (GIL released) while the sidecar computes.
+    One short-lived connection per call — unix socket connects cost microseconds
+    and this keeps the client safe to share across threads.
+    """
+
+    def __init__(self, socket_path: str = None, timeout: float = None):
+        self.socket_path = socket_path or settings.RERANKER_SOCKET_PATH
+        self.timeout = timeout or settings.RERANKER_TIMEOUT
+
+    def predict(self, pairs: Sequence[Sequence[str]], **_: object) -> List[float]:
+        if not pairs:
+            return []
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            sock.sendall(_encode({"pairs": [list(p) for p in pairs]}))
+            (length,) = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+            response = json.loads(_recv_exactly(sock, length))
+        if "error" in response:
+            raise RuntimeError(f"Reranker sidecar error: {response['error']}")
+        return response["scores"]
+
+
+# ─── Server (one process per host) ────────────────────────────────────────────
+
+class RerankerServer:
+    """Unix-socket reranker with dynamic micro-batching over a single model copy."""
+
+    def __init__(
+        self,
+        model,
+        socket_path: str = None,
+        max_batch_pairs: int = None,
+        max_wait_ms: float = None,
+    ):
+        self.model = model
+        self.socket_path = socket_path or settings.RERANKER_SOCKET_PATH
+        self.max_batch_pairs = max_batch_pairs or settings.RERANKER_MAX_BATCH_PAIRS
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else settings.RERANKER_MAX_WAIT_MS) / 1000
+        self._queue: asyncio.Queue = asyncio.Queue()
+        # predict runs on ONE dedicated thread: torch parallelises inside a batch,
+        # and serialising batches keeps the event loop free to accept new requests.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker")
+
+    async def serve_forever(self):
+        os.makedirs(os.path.dirname(self.socket_path) or ".", exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # stale socket from a previous run
+        server = await asyncio.start_unix_server(self._handle_connection, path=self.socket_path)
+        os.chmod(self.socket_path, 0o666)  # API containers may run as a different uid
+        logger.info(
+            f"Reranker sidecar listening on {self.socket_path} "
+            f"(max_batch_pairs={self.max_batch_pairs}, max_wait={self.max_wait * 1000:.1f}ms)"
+        )
+        batcher = asyncio.create_task(self._batch_loop())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self._executor.shutdown(wait=False)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(_HEADER.size)
+                except asyncio.IncompleteReadError:
+                    break  # client closed
+                (length,) = _HEADER.unpack(header)
+                request = json.loads(await reader.readexactly(length))
+                pairs = request.get("pairs") or []
+
+                if pairs:
+                    future = loop.create_future()
+                    await self._queue.put((pairs, future))
+                    try:
+                        response = {"scores": await future}
+                    except Exception as e:
+                        response = {"error": str(e)}
+                else:
+                    response = {"scores": []}
+
+                writer.write(_encode(response))
+                await writer.drain()
+        except Exception as e:
+            logger.warning(f"Reranker connection error: {e}")
+        finally:
+            writer.close()
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            n_pairs = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+
+            while n_pairs < self.max_batch_pairs:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                n_pairs += len(item[0])
+
+            all_pairs = [pair for pairs, _ in batch for pair in pairs]
+            try:
+                scores = await loop.run_in_executor(self._executor, self._predict, all_pairs)
+            except Exception as e:
+                logger.warning(f"Reranker batch of {len(all_pairs)} pairs failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            offset = 0
+            for pairs, future in batch:
+                if not future.done():  # requester may have disconnected
+                    future.set_result(scores[offset:offset + len(pairs)])
+                offset += len(pairs)
+
+    def _predict(self, pairs: List[List[str]]) -> List[float]:
+        scores = self.model.predict(pairs, batch_size=self.max_batch_pairs, show_progress_bar=False)
+        if isinstance(scores, float):
+            scores = [scores]
+        return [float(s) for s in scores]
+
+
+def get_reranker():
+    """Reranker for this process according to RERANKER_BACKEND (None if unavailable)."""
+    if settings.RERANKER_BACKEND == "sidecar":
+        return RerankerClient()
+    return load_cross_encoder()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(RerankerServer(load_cross_encoder()).serve_forever())
@@ -0,0 +1,188 @@
+"""
+Per-bot semantic answer cache for chat() and chat_stream().
+
+The old exact-match cache (md5 of the raw query) missed every paraphrase, such as
+"giờ mở cửa?" vs "mấy giờ mở cửa", and chat_stream had no cache at all. Answered
+queries are now stored as points in a small Qdrant collection per embedding
+dimension (`omnirag_semantic_cache_d{dim}`). The vector is the query embedding;
+the payload carries the answer and its sources. A lookup is one filtered
+nearest-neighbour query, restricted to:
+
+  - the same bot, at its current cache generation (see cache_generation; bumped
+    whenever the bot's documents or knowledge graph change)
+  - the same answer-shaping config (prompt, model, temperature, retrieval knobs)
+  - entries younger than SEMANTIC_CACHE_TTL
+  - cosine similarity >= SEMANTIC_CACHE_THRESHOLD (bot_config.semantic_cache_threshold)
+
+Callers bypass the cache for turns with conversation history, and never store
+answers that used per-user memories.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Set
+
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http import models as rest
+
+from app.core.config import settings
+from app.services.rerank_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_COLLECTION = "omnirag_semantic_cache_d{dim}"
+
+# bot_config keys that change the answer for the same question
+_ANSWER_CONFIG_KEYS = (
+    "system_prompt", "model", "temperature", "max_tokens", "domain", "top_k",
+    "similarity_threshold", "enable_knowledge_graph", "lexical_backend",
+    "enable_multi_query", "multi_query_variants", "enable_hyde",
+)
+
+# Fields of a chat() result worth replaying
+CACHED_FIELDS = (
+    "response", "sources", "retrieved_chunks", "agent_logs", "reasoning", "model",
+    "search_query", "lightrag_entities",
+)
+
+
+def config_hash(bot_config: Dict[str, Any]) -> str:
+    relevant = {k: bot_config.get(k) for k in _ANSWER_CONFIG_KEYS}
+    return hashlib.md5(json.dumps(relevant, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+
+class SemanticResponseCache:
+    def __init__(self, qdrant_client: QdrantClient):
+        self.qdrant = qdrant_client  # sync: collection management and writes (off the event loop)
+        self._collections: Set[str] = set()
+
+    def _collection(self, dim: int) -> str:
+        name = SEMANTIC_CACHE_COLLECTION.format(dim=dim)
+        if name not in self._collections:
+            if not self.qdrant.collection_exists(name):
+                logger.info(f"Creating semantic answer cache '{name}'")
+                self.qdrant.create_collection(
+                    collection_name=name,
+                    vectors_config=rest.VectorParams(size=dim, distance=rest.Distance.COSINE),
+                    on_disk_payload=True,
+                )
+                for field, schema in (
+                    ("bot_id", rest.PayloadSchemaType.KEYWORD),
+                    ("config", rest.PayloadSchemaType.KEYWORD),
+                    ("generation", rest.PayloadSchemaType.INTEGER),
+                    ("created_at", rest.PayloadSchemaType.FLOAT),
+                ):
+                    self.qdrant.create_payload_index(collection_name=name, field_name=field, field_schema=schema)
+            self._collections.add(name)
+        return name
+
+    @staticmethod
+    def _filter(bot_id: str, config: str, generation: int) -> rest.Filter:
+        return rest.Filter(must=[
+            rest.FieldCondition(key="bot_id", match=rest.MatchValue(value=bot_id)),
+            rest.FieldCondition(key="config", match=rest.MatchValue(value=config)),
+            rest.FieldCondition(key="generation", match=rest.MatchValue(value=generation)),
+            rest.FieldCondition(key="created_at", range=rest.Range(gte=time.time() - settings.SEMANTIC_CACHE_TTL)),
+        ])
+
+    async def lookup(
+        self,
+        client: AsyncQdrantClient,
+        bot_id: str,
+        bot_config: Dict[str, Any],
+        embedding: List[float],
+        generation: int,
+    ) -> Optional[Dict[str, Any]]:
+        """Cached answer for the nearest earlier question above the threshold, else None."""
+        threshold = bot_config.get("semantic_cache_threshold") or settings.SEMANTIC_CACHE_THRESHOLD
+        try:
+            collection = await asyncio.to_thread(self._collection, len(embedding))
+            response = await client.query_points(
+                collection_name=collection,
+                query=embedding,
+                query_filter=self._filter(bot_id, config_hash(bot_config), generation),
+                limit=1,
+                score_threshold=threshold,
+                with_payload=True,
+            )
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed (treating as miss): {e}")
+            return None
+        if not response.points:
+            return None
+        hit = response.points[0]
+        result = json.loads(hit.payload["result"])
+        result["cache_similarity"] = round(hit.score, 4)
+        result["cached_query"] = hit.payload.get("query")
+        return result
+
+    def store(
+        self,
+        bot_id: str,
+        bot_config: Dict[str, Any],
+        query: str,
+        embedding: List[float],
+        result: Dict[str, Any],
+        generation: int,
+    ):
+        """
+        Store an answer (blocking; run off the event loop) and drop this bot's expired
+        entries. `generation` is the one read BEFORE retrieval, so an answer built while
+        documents changed is filed under the old generation and never served.
+        """
+        try:
+            collection = self._collection(len(embedding))
+            now = time.time()
+            config = config_hash(bot_config)
+            # Deterministic id: coalesced requests (single_flight) store the same answer once
+            point_id = str(uuid.UUID(hashlib.md5(
+                f"{bot_id}|{config}|{generation}|{normalize_query(query)}".encode()
+            ).hexdigest()))
+            payload = {
+                "bot_id": bot_id,
+                "config": config,
+                "generation": generation,
+                "created_at": now,
+                "query": query,
+                "result": json.dumps({k: result.get(k) for k in CACHED_FIELDS}, default=str),
+            }
+            self.qdrant.upsert(
+                collection_name=collection,
+                points=[rest.PointStruct(id=point_id, vector=embedding, payload=payload)],
+                wait=False,
+            )
+            self.qdrant.delete(
+                collection_name=collection,
+                points_selector=rest.FilterSelector(filter=rest.Filter(must=[
+                    rest.FieldCondition(key="bot_id", match=rest.MatchValue(value=bot_id)),
+                    rest.FieldCondition(key="created_at", range=rest.Range(lt=now - settings.SEMANTIC_CACHE_TTL)),
+                ])),
+                wait=False,
+            )
+        except Exception as e:
+            logger.warning(f"Semantic cache write failed (non-critical): {e}")
+
+    def purge_bot(self, bot_id: str):
+        """
+        Delete a bot's entries from every semantic cache collection (all dimensions).
+        Only needed without Redis, where the generation is stuck at 0.
+        """
+        bot_filter = rest.Filter(must=[rest.FieldCondition(key="bot_id", match=rest.MatchValue(value=bot_id))])
+        prefix = SEMANTIC_CACHE_COLLECTION.split("{")[0]
+        try:
+            collections = [c.name for c in self.qdrant.get_collections().collections if c.name.startswith(prefix)]
+        except Exception as e:
+            logger.warning(f"Semantic cache purge skipped: {e}")
+            return
+        for collection in collections:
+            try:
+                self.qdrant.delete(
+                    collection_name=collection,
+                    points_selector=rest.FilterSelector(filter=bot_filter),
+                    wait=False,
+                )
+            except Exception as e:
+                logger.warning(f"Semantic cache purge of '{collection}' failed: {e}")
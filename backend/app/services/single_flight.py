@@ -0,0 +1,258 @@
+"""
+Single-flight coalescing of identical concurrent work (retrieval prep, LLM answers).
+
+After a broadcast, hundreds of users ask the same question within seconds, and the
+semantic cache is only written once the first answer completes. Meanwhile every
+request would run its own embed → search → rerank → CRAG → LLM. A flight makes
+concurrent identical requests share one computation:
+
+  - In-process: the first request for a key starts the flight as a detached task
+    that buffers its events. Every request for the key, including the first, reads
+    from that buffer. A client that disconnects doesn't cancel the work the others
+    are waiting on, but once the last reader is gone the flight is cancelled, which
+    closes an upstream LLM stream instead of generating tokens nobody reads. A flight
+    that other workers are replaying from Redis keeps running for them.
+  - Across workers: the flight that wins `SET NX rag:flight:{key}` in Redis runs the
+    computation and mirrors its events to the Redis stream
+    `rag:flight:{key}:{token}` (the first event and the end at once, tokens in one
+    pipelined batch per SINGLE_FLIGHT_MIRROR_INTERVAL). Flights on other workers replay that stream (XREAD)
+    instead of computing. If the leader goes quiet for SINGLE_FLIGHT_WAIT before
+    its first event, the follower computes on its own.
+
+`do()` shares one awaited result (each caller gets its own copy); `stream()` shares
+a sequence of events, such as LLM tokens. Events must be JSON-serializable.
+"""
+import asyncio
+import copy
+import json
+import logging
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.db.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+_END = "end"
+_EVENT = "event"
+_ERROR = "error"
+
+
+class FlightError(RuntimeError):
+    """The leading worker's computation failed (or went silent mid-flight)."""
+
+
+class _Flight:
+    """Buffered events of one in-process flight, replayable by any number of readers."""
+
+    def __init__(self):
+        self.events: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.task: Optional[asyncio.Task] = None
+        self.readers = 0
+        self.stream_key: Optional[str] = None  # set while mirroring to Redis
+        self.on_abandoned: Optional[Callable[[], None]] = None
+        self._changed = asyncio.Event()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def push(self, event: Any):
+        self.events.append(event)
+        self._wake()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done = True
+        self.error = error
+        self._wake()
+
+    async def follow(self) -> AsyncIterator[Any]:
+        i = 0
+        self.readers += 1
+        try:
+            while True:
+                changed = self._changed
+                while i < len(self.events):
+                    yield self.events[i]
+                    i += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                if i == len(self.events):
+                    await changed.wait()
+        finally:
+            # Runs on completion, on aclose() and on cancellation of the reader
+            self.readers -= 1
+            if self.readers == 0 and not self.done and self.on_abandoned is not None:
+                self.on_abandoned()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+
+    async def do(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Result of `compute()`, shared with every concurrent call for the same key."""
+        if not settings.SINGLE_FLIGHT_ENABLED:
+            return await compute()
+
+        async def produce():
+            yield await compute()
+
+        results = []
+        # Read to the end (not just the first event) so the flight isn't abandoned before it finishes
+        async for result in self.stream(key, produce):
+            results.append(result)
+        if not results:
+            raise FlightError(f"Flight {key} finished without a result")
+        return copy.deepcopy(results[0])
+
+    def stream(self, key: str, produce: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Events of `produce()`, shared with every concurrent call for the same key."""
+        if not settings.SINGLE_FLIGHT_ENABLED:
+            return produce()
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            flight.on_abandoned = lambda: asyncio.create_task(self._abandon(key, flight))
+            flight.task = asyncio.create_task(self._run(key, flight, produce))
+        else:
+            logger.info(f"Single-flight: joined in-process flight {key}")
+        return flight.follow()
+
+    async def _run(self, key: str, flight: _Flight, produce: Callable[[], AsyncIterator[Any]]):
+        redis = get_redis()
+        lock_key = f"rag:flight:{key}"
+        token = uuid.uuid4().hex
+        try:
+            if redis is not None:
+                try:
+                    if not await redis.set(lock_key, token, nx=True, ex=settings.SINGLE_FLIGHT_LOCK_TTL):
+                        leader_token = await redis.get(lock_key)
+                        if leader_token and await self._follow_remote(
+                            redis, f"{lock_key}:{leader_token.decode()}", flight
+                        ):
+                            return
+                        # Leader vanished before producing anything: compute here, unlocked
+                        redis = None
+                except Exception as e:
+                    logger.warning(f"Single-flight: Redis unavailable, coalescing in-process only ({e})")
+                    redis = None
+            await self._lead(redis, lock_key, token, flight, produce)
+        except asyncio.CancelledError:
+            flight.finish(FlightError(f"Flight {key} was cancelled"))
+            raise
+        except Exception as e:
+            flight.finish(e)
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    async def _abandon(self, key: str, flight: _Flight):
+        """Cancel a flight nobody reads any more, unless another worker is replaying it."""
+        if flight.stream_key is not None:
+            try:
+                if int(await get_redis().get(f"{flight.stream_key}:readers") or 0) > 0:
+                    return
+            except Exception:
+                pass
+        # A request may have joined while Redis answered
+        if flight.readers == 0 and not flight.done and flight.task is not None:
+            logger.info(f"Single-flight: no readers left, cancelling flight {key}")
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.task.cancel()
+
+    async def _lead(self, redis, lock_key: str, token: str, flight: _Flight, produce):
+        stream_key = f"{lock_key}:{token}"
+        if redis is not None:
+            flight.stream_key = stream_key
+
+        pending: List[Dict[str, str]] = []
+        created = False
+        last_flush = 0.0
+
+        async def mirror(kind: str, value: Any = None):
+            nonlocal created, last_flush
+            if redis is None:
+                return
+            pending.append({"t": kind, "v": json.dumps(value, default=str)})
+            now = time.monotonic()
+            # Tokens arrive every few ms: hold them for one round-trip per interval
+            if kind == _EVENT and created and now - last_flush < settings.SINGLE_FLIGHT_MIRROR_INTERVAL:
+                return
+            last_flush = now
+            batch = pending[:]
+            pending.clear()
+            try:
+                pipe = redis.pipeline(transaction=False)
+                for fields in batch:
+                    pipe.xadd(stream_key, fields)
+                if not created:
+                    pipe.expire(stream_key, settings.SINGLE_FLIGHT_LOCK_TTL)
+                await pipe.execute()
+                created = True
+            except Exception as e:
+                logger.warning(f"Single-flight: mirroring to Redis failed: {e}")
+
+        events = produce()
+        try:
+            async for event in events:
+                flight.push(event)
+                await mirror(_EVENT, event)
+        except asyncio.CancelledError:
+            await mirror(_ERROR, "cancelled: no readers left")
+            raise
+        except Exception as e:
+            await mirror(_ERROR, str(e))
+            flight.finish(e)
+            raise
+        else:
+            await mirror(_END)
+            flight.finish()
+        finally:
+            await events.aclose()  # closes e.g. the upstream HTTP stream
+            if redis is not None:
+                try:
+                    if await redis.get(lock_key) == token.encode():
+                        await redis.delete(lock_key)
+                except Exception:
+                    pass  # expires on its own
+
+    async def _follow_remote(self, redis, stream_key: str, flight: _Flight) -> bool:
+        """Replay another worker's flight. False if it produced nothing within SINGLE_FLIGHT_WAIT."""
+        logger.info(f"Single-flight: following remote flight {stream_key}")
+        readers_key = f"{stream_key}:readers"  # keeps the leader running while we replay
+        await redis.incr(readers_key)
+        await redis.expire(readers_key, settings.SINGLE_FLIGHT_LOCK_TTL)
+        try:
+            last_id = "0"
+            while True:
+                response = await redis.xread({stream_key: last_id}, block=int(settings.SINGLE_FLIGHT_WAIT * 1000))
+                if not response:
+                    if not flight.events:
+                        return False
+                    raise FlightError(f"Remote flight {stream_key} stalled mid-stream")
+                for entry_id, fields in response[0][1]:
+                    last_id = entry_id
+                    kind = fields[b"t"].decode()
+                    if kind == _EVENT:
+                        flight.push(json.loads(fields[b"v"]))
+                    elif kind == _ERROR:
+                        raise FlightError(json.loads(fields[b"v"]))
+                    else:
+                        flight.finish()
+                        return True
+        finally:
+            try:
+                await redis.decr(readers_key)
+            except Exception:
+                pass
+
+
+single_flight = SingleFlight()
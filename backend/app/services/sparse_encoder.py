@@ -0,0 +1,58 @@
+"""
+BM25-style sparse encoder for Qdrant hybrid search.
+
+Documents are encoded as BM25-saturated term frequencies; the IDF half of BM25 is
+applied server-side by Qdrant (SparseVectorParams(modifier=IDF)), so the encoder
+needs no corpus statistics and ingest/query vectors stay consistent as the
+collection grows. Term ids are CRC32 hashes — stable across processes, unlike hash().
+"""
+import re
+import unicodedata
+import zlib
+from collections import Counter
+from typing import List
+
+from qdrant_client.http import models as rest
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class SparseBM25Encoder:
+    """Local, dependency-free BM25 term weighting for Qdrant sparse vectors."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, avg_doc_len: float = 256.0):
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_len = avg_doc_len
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        """Lowercase + NFC-normalize, then split on word characters (keeps Vietnamese syllables whole)."""
+        text = unicodedata.normalize("NFC", (text or "").lower())
+        return [t for t in _TOKEN_RE.findall(text) if len(t) > 1 or t.isdigit()]
+
+    @staticmethod
+    def _term_id(token: str) -> int:
+        return zlib.crc32(token.encode("utf-8"))
+
+    def encode_document(self, text: str) -> rest.SparseVector:
+        """Encode a chunk as saturated TF weights: tf·(k1+1) / (tf + k1·(1 − b + b·len/avg_len))."""
+        tokens = self.tokenize(text)
+        if not tokens:
+            return rest.SparseVector(indices=[], values=[])
+        doc_len = len(tokens)
+        norm = self.k1 * (1 - self.b + self.b * doc_len / self.avg_doc_len)
+        weights: Counter = Counter()
+        for token, tf in Counter(tokens).items():
+            # CRC32 collisions are rare; merging their weights is harmless for ranking
+            weights[self._term_id(token)] += tf * (self.k1 + 1) / (tf + norm)
+        indices = sorted(weights)
+        return rest.SparseVector(indices=indices, values=[float(weights[i]) for i in indices])
+
+    def encode_query(self, text: str) -> rest.SparseVector:
+        """Encode a query as unit weights over its unique terms (IDF comes from Qdrant)."""
+        indices = sorted({self._term_id(t) for t in self.tokenize(text)})
+        return rest.SparseVector(indices=indices, values=[1.0] * len(indices))
+
+
+sparse_encoder = SparseBM25Encoder()
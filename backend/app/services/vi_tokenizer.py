@@ -0,0 +1,96 @@
+"""
+Vietnamese-aware tokenizer for lexical (BM25) retrieval.
+
+Vietnamese words are built from space-separated syllables, and the same syllable
+can be written several ways: NFC vs NFD (common in PDF extraction), old vs new
+tone placement ("hoà" / "hòa", "thuý" / "thúy"), or with no diacritics at all
+when users type quickly ("gio mo cua"). For each syllable we emit:
+
+  - a canonical form: base letters (with vowel marks ơ, ư, â, ă, ê, ô, đ) and the
+    tone detached as a suffix, so tone placement no longer matters: "hòa" → "hoa#2"
+  - a folded form (prefix "~"): all diacritics stripped, đ → d: "hòa" → "~hoa"
+  - bigrams of adjacent syllables in both forms ("mở cửa" → "mơ#4_cưa#4", "~mo_cua"),
+    which approximate multi-syllable words without a segmentation model.
+
+Queries pick ONE form per syllable: canonical when the user typed diacritics,
+folded otherwise, so unaccented queries still match accented documents.
+"""
+import re
+import unicodedata
+from typing import List
+
+# Combining tone marks → tone number (ngang = 0 carries no suffix)
+_TONE_MARKS = {
+    "\u0300": 2,  # huyền  (grave)
+    "\u0301": 1,  # sắc    (acute)
+    "\u0303": 3,  # ngã    (tilde)
+    "\u0309": 4,  # hỏi    (hook above)
+    "\u0323": 5,  # nặng   (dot below)
+}
+
+# Segments never span punctuation, so bigrams stay inside a phrase
+_SEGMENT_RE = re.compile(r"[^\W_]+(?:\s+[^\W_]+)*", re.UNICODE)
+_WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def _split_syllable(syllable: str) -> tuple[str, int]:
+    """Return (syllable without tone mark, tone number)."""
+    tone = 0
+    kept = []
+    for ch in unicodedata.normalize("NFD", syllable):
+        if ch in _TONE_MARKS:
+            tone = _TONE_MARKS[ch]
+        else:
+            kept.append(ch)
+    return unicodedata.normalize("NFC", "".join(kept)), tone
+
+
+def canonical_syllable(syllable: str) -> str:
+    base, tone = _split_syllable(syllable)
+    return f"{base}#{tone}" if tone else base
+
+
+def fold_syllable(syllable: str) -> str:
+    """Strip every diacritic (tones and vowel marks); đ → d."""
+    decomposed = unicodedata.normalize("NFD", syllable.replace("đ", "d"))
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def _segments(text: str) -> List[List[str]]:
+    text = unicodedata.normalize("NFC", (text or "").lower())
+    return [_WORD_RE.findall(seg) for seg in _SEGMENT_RE.findall(text)]
+
+
+def tokenize_document(text: str) -> List[str]:
+    """All index terms for a document: canonical + folded unigrams and bigrams."""
+    tokens: List[str] = []
+    for syllables in _segments(text):
+        canon = [canonical_syllable(s) for s in syllables]
+        folded = ["~" + fold_syllable(s) for s in syllables]
+        tokens.extend(canon)
+        tokens.extend(folded)
+        for i in range(len(syllables) - 1):
+            tokens.append(f"{canon[i]}_{canon[i + 1]}")
+            tokens.append(f"{folded[i]}_{folded[i + 1][1:]}")
+    return tokens
+
+
+def tokenize_query(text: str) -> List[str]:
+    """Query terms: canonical form for accented syllables, folded form for bare ones."""
+    tokens: List[str] = []
+    for syllables in _segments(text):
+        forms = []
+        for s in syllables:
+            folded = fold_syllable(s)
+            forms.append(canonical_syllable(s) if folded != s else "~" + folded)
+        tokens.extend(forms)
+        for i in range(len(forms) - 1):
+            left, right = forms[i], forms[i + 1]
+            if left.startswith("~") and right.startswith("~"):
+                tokens.append(f"{left}_{right[1:]}")
+            elif not left.startswith("~") and not right.startswith("~"):
+                tokens.append(f"{left}_{right}")
+            else:
+                # Mixed accent styles — fall back to the folded bigram, which every document emits
+                tokens.append(f"~{fold_syllable(syllables[i])}_{fold_syllable(syllables[i + 1])}")
+    return tokens
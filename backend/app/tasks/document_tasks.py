@@ -7,8 +7,11 @@ import logging
 from app.worker import celery_app
 
 logger = logging.getLogger(__name__)
-from app.services.openrouter_rag_service import get_openrouter_rag_service
+from app.services.openrouter_rag_service import (
+    BotMigrationInProgress, get_openrouter_rag_service, run_closing_loop_clients,
+)
 from app.services.storage_service import storage_service
+from app.services.cache_generation import bot_cache_generations
 from app.db.session import SessionLocal
 from app.models.document import Document as DocumentModel
 # Import all related models to ensure SQLAlchemy registry is populated
@@ -17,6 +20,10 @@ from app.models.folder import Folder
 from app.models.tenant import Tenant
 from app.models.user import User
 
+# Ingests refused during a storage migration (migrations of big bots take minutes)
+MIGRATION_RETRY_DELAY = 60
+MIGRATION_MAX_RETRIES = 60
+
 
 @celery_app.task(bind=True, name="process_document")
 def process_document_task(
@@ -29,6 +36,7 @@ def process_document_task(
     enable_knowledge_graph: bool = False,
     chunk_size: int = 1000,
     chunk_overlap: int = 200,
+    vector_storage: str = "int8",
 ):
     """
     Background task to process document:
@@ -79,6 +87,7 @@ def process_document_task(
                 chunk_size=chunk_size,
                 chunk_overlap=chunk_overlap,
                 preloaded_documents=loaded_documents,
+                vector_storage=vector_storage,
             )
             num_chunks = ingest_result.get("chunks_created", 0)
 
@@ -121,7 +130,13 @@ def process_document_task(
             # Clean up temp file
             if os.path.exists(tmp_file_path):
                 os.remove(tmp_file_path)
-                
+
+    except BotMigrationInProgress as e:
+        # The bot's points are moving to a dedicated collection; writes resume after the flip
+        logger.info(f"Document {document_id} deferred: {e}")
+        _update_document_status(document_id, status="queued")
+        raise self.retry(exc=e, countdown=MIGRATION_RETRY_DELAY, max_retries=MIGRATION_MAX_RETRIES)
+
     except Exception as e:
         error_msg = str(e)
         logger.error(f"Error processing document {document_id}: {error_msg}")
@@ -194,7 +209,9 @@ def build_knowledge_graph_task(self, bot_id: str, full_text: str, filename: str,
 
         # Running the insert operation
         logger.info(f"[LightRAG] Calling insert_text for {filename}...")
-        asyncio.run(lightrag_service.insert_text(sanitized_text))
+        asyncio.run(run_closing_loop_clients(lightrag_service.insert_text(sanitized_text)))
+        # Answers and KG contexts cached before the graph grew are now stale
+        bot_cache_generations.bump_sync(bot_id)
 
         if document_id:
             _update_kg_status(document_id, "completed")
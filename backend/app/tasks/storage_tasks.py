@@ -0,0 +1,76 @@
+"""
+Qdrant storage maintenance tasks.
+
+Move a bot from the shared collection into its own dedicated collection, online:
+
+    python -m app.tasks.storage_tasks migrate <bot_id> [<bot_id> ...] [--storage int8|binary]
+
+or enqueue it on the worker: migrate_bot_collection_task.delay(bot_id).
+Reads keep being served from the shared collection until the alias flips, and ingests
+of the bot are deferred (Celery retry) until the migration finishes; see
+OpenRouterRAGService.migrate_bot_to_dedicated for the exact sequence.
+Without --storage, the new collection uses the bot's vector_storage (bot config,
+else its domain profile).
+"""
+import argparse
+import logging
+
+from uuid import UUID
+
+from app.worker import celery_app
+from app.services.domain_config import get_domain_profile
+from app.services.openrouter_rag_service import get_openrouter_rag_service
+from app.db.session import SessionLocal
+# Import all related models to ensure SQLAlchemy registry is populated
+from app.models.bot import Bot
+from app.models.folder import Folder
+from app.models.tenant import Tenant
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+
+def _bot_vector_storage(bot_id: str) -> str:
+    """vector_storage for a bot: explicit bot config, else its domain profile's default."""
+    db = SessionLocal()
+    try:
+        bot = db.query(Bot).filter(Bot.id == UUID(bot_id)).first()
+        config = (bot.config or {}) if bot else {}
+    finally:
+        db.close()
+    return config.get("vector_storage") or get_domain_profile(config.get("domain", "general")).vector_storage
+
+
+@celery_app.task(bind=True, name="migrate_bot_collection")
+def migrate_bot_collection_task(self, bot_id: str, batch_size: int = 256, vector_storage: str = None):
+    """Background migration of one bot into a dedicated Qdrant collection."""
+    logger.info(f"--- [START] Qdrant storage migration: bot={bot_id} ---")
+    self.update_state(state='PROCESSING', meta={'status': 'Copying points'})
+    rag_service = get_openrouter_rag_service()
+    result = rag_service.migrate_bot_to_dedicated(
+        bot_id, batch_size=batch_size, vector_storage=vector_storage or _bot_vector_storage(bot_id)
+    )
+    rag_service.invalidate_bot_cache(bot_id)
+    logger.info(f"--- [SUCCESS] Qdrant storage migration: {result} ---")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Qdrant storage maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser("migrate", help="move bots into dedicated collections (online)")
+    migrate.add_argument("bot_ids", nargs="+")
+    migrate.add_argument("--batch-size", type=int, default=256)
+    migrate.add_argument("--storage", choices=["int8", "binary"], help="default: the bot's vector_storage")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    rag_service = get_openrouter_rag_service()
+    for bot_id in args.bot_ids:
+        storage = args.storage or _bot_vector_storage(bot_id)
+        print(rag_service.migrate_bot_to_dedicated(bot_id, batch_size=args.batch_size, vector_storage=storage))
+        rag_service.invalidate_bot_cache(bot_id)
+
+
+if __name__ == "__main__":
+    main()
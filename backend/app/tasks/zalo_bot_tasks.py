@@ -3,6 +3,7 @@ Celery task for processing Zalo Bot messages asynchronously.
 """
 from app.worker import celery_app
 from app.services.channels.zalo_bot_service import get_zalo_bot_service
+from app.services.openrouter_rag_service import run_closing_loop_clients
 import asyncio
 import logging
 
@@ -20,9 +21,9 @@ def process_zalo_bot_webhook_task(bot_id: str, payload: dict):
     service = get_zalo_bot_service()
 
     try:
-        return asyncio.run(service.handle_webhook(bot_id, payload))
+        return asyncio.run(run_closing_loop_clients(service.handle_webhook(bot_id, payload)))
     except RuntimeError:
         # Fallback for environments where a loop might already exist
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
-        return loop.run_until_complete(service.handle_webhook(bot_id, payload))
+        return loop.run_until_complete(run_closing_loop_clients(service.handle_webhook(bot_id, payload)))
@@ -1,5 +1,6 @@
 from app.worker import celery_app
 from app.services.channels.zalo_hub_service import get_zalo_hub_service
+from app.services.openrouter_rag_service import run_closing_loop_clients
 import asyncio
 import logging
 
@@ -15,9 +16,9 @@ def process_zalo_hub_webhook_task(payload: dict):
     service = get_zalo_hub_service()
     
     try:
-        return asyncio.run(service.handle_hub_webhook(payload))
+        return asyncio.run(run_closing_loop_clients(service.handle_hub_webhook(payload)))
     except RuntimeError:
         # Fallback for environments where a loop might already exist (unlikely in worker prefork but safe)
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
-        return loop.run_until_complete(service.handle_hub_webhook(payload))
+        return loop.run_until_complete(run_closing_loop_clients(service.handle_hub_webhook(payload)))
@@ -0,0 +1,26 @@
+import pytest
+
+pytest.importorskip("qdrant_client")
+pytest.importorskip("langchain")
+
+from langchain.schema import Document as LangChainDocument
+
+from app.services.openrouter_rag_service import SPARSE_VECTOR_NAME, OpenRouterRAGService
+
+
+def test_build_points_references_parent_of_parent_child_chunk():
+    parent_text = "Điều 1. Phạm vi điều chỉnh. " * 20
+    chunk = LangChainDocument(
+        page_content="Điều 1. Phạm vi điều chỉnh.",
+        metadata={"parent_text": parent_text, "page": 1},
+    )
+
+    points = OpenRouterRAGService._build_points(
+        "bot-1", "luat.pdf", [chunk], [[0.1, 0.2, 0.3]], ["prefix"], ["prefix\n\nĐiều 1."],
+    )
+
+    assert len(points) == 1
+    payload = points[0].payload
+    assert payload["parent_id"] == OpenRouterRAGService._parent_id("bot-1", "luat.pdf", parent_text)
+    assert "parent_text" not in payload["metadata"]
+    assert SPARSE_VECTOR_NAME in points[0].vector
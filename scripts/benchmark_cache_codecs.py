@@ -0,0 +1,105 @@
+"""
+Benchmark CacheService codecs on real cached chat payloads: json vs orjson vs msgpack,
+each raw and zstd-compressed.
+
+Reports per codec: mean / p95 stored bytes, size relative to plain json, and mean
+encode / decode time per payload (round-trip verified on every payload).
+
+Usage (from repo root):
+    python scripts/benchmark_cache_codecs.py                      # last 200 chat turns from MongoDB
+    python scripts/benchmark_cache_codecs.py --limit 1000 --bot-id <uuid>
+    python scripts/benchmark_cache_codecs.py --payloads payloads.jsonl
+
+Payloads are the fields the answer cache stores for a turn (response, sources,
+retrieved_chunks, agent_logs, ...), rebuilt from the conversation log in MongoDB.
+--payloads: JSONL, one cached chat result per line.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from app.core.config import settings  # noqa: E402
+from app.services.cache_service import decode_value, encode_value, get_codec  # noqa: E402
+from app.services.semantic_cache import CACHED_FIELDS  # noqa: E402
+
+LOG_FIELDS = {"user_message": "search_query"}  # conversation log name → cached result name
+
+
+def load_payloads(path, limit, bot_id):
+    if path:
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()][:limit]
+
+    from pymongo import MongoClient
+    db = MongoClient(settings.MONGODB_URL, serverSelectionTimeoutMS=5000)[settings.MONGODB_DB_NAME]
+    query = {"bot_id": bot_id} if bot_id else {}
+    payloads = []
+    for doc in db.conversations.find(query).sort("timestamp", -1).limit(limit):
+        payload = {k: doc.get(k) for k in CACHED_FIELDS if k in doc}
+        for log_key, field in LOG_FIELDS.items():
+            payload.setdefault(field, doc.get(log_key))
+        payload["usage"] = doc.get("usage")
+        payloads.append(json.loads(json.dumps(payload, default=str)))  # datetimes/ObjectIds as stored in cache
+    return payloads
+
+
+def bench(payloads, codec, compress, repeat):
+    frames = [encode_value(p, codec, compress) for p in payloads]
+    for p, frame in zip(payloads, frames):
+        assert decode_value(frame) == p, f"{codec} round-trip mismatch"
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for p in payloads:
+            encode_value(p, codec, compress)
+    encode_us = (time.perf_counter() - start) / (repeat * len(payloads)) * 1e6
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for frame in frames:
+            decode_value(frame)
+    decode_us = (time.perf_counter() - start) / (repeat * len(payloads)) * 1e6
+
+    sizes = np.array([len(f) for f in frames])
+    return sizes, encode_us, decode_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payloads", help="JSONL of cached chat results (default: read MongoDB)")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--bot-id")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.payloads, args.limit, args.bot_id)
+    if not payloads:
+        sys.exit("No payloads found (chat with a bot first, or pass --payloads)")
+    print(f"{len(payloads)} payloads, compression threshold {settings.CACHE_COMPRESS_THRESHOLD} B, "
+          f"zstd level {settings.CACHE_ZSTD_LEVEL}\n")
+
+    rows, baseline = [], None
+    for codec in ("json", "orjson", "msgpack"):
+        if get_codec(codec).name != codec:
+            print(f"{codec}: not installed, skipped")
+            continue
+        for compress in (False, None):
+            sizes, encode_us, decode_us = bench(payloads, codec, compress, args.repeat)
+            if baseline is None:
+                baseline = sizes.mean()
+            label = f"{codec}{'' if compress is False else '+zstd'}"
+            rows.append((label, sizes.mean(), np.percentile(sizes, 95), sizes.mean() / baseline, encode_us, decode_us))
+
+    print(f"{'codec':<14}{'mean B':>10}{'p95 B':>10}{'vs json':>9}{'enc µs':>10}{'dec µs':>10}")
+    for label, mean, p95, ratio, enc, dec in rows:
+        print(f"{label:<14}{mean:>10.0f}{p95:>10.0f}{ratio:>9.2f}{enc:>10.1f}{dec:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
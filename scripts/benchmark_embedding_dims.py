@@ -0,0 +1,123 @@
+"""
+Benchmark Matryoshka truncation (EMBEDDING_DIMENSIONS) against full-size vectors.
+
+Uses a bot's stored chunks from the full-dimension shared collection, so it
+measures the exact vectors that production would truncate. Queries come from a
+file, or are synthesized from the chunks (the first words of a random chunk; that
+chunk is then the "gold" answer). For each dimension it reports:
+
+  - recall@k vs full : overlap of the truncated top-k with the full-vector top-k
+  - gold hit@k / MRR : how often / how high the gold chunk ranks (synthetic queries)
+  - memory per 1M vectors for float32, INT8 scalar and binary quantization
+
+Everything is computed in NumPy with exact cosine search; Qdrant is only read.
+
+Usage (from repo root):
+    python scripts/benchmark_embedding_dims.py --bot-id <uuid>
+    python scripts/benchmark_embedding_dims.py --bot-id <uuid> --dims 256 512 768 1024 --queries queries.txt
+"""
+import argparse
+import os
+import random
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from qdrant_client import QdrantClient  # noqa: E402
+from qdrant_client.models import FieldCondition, Filter, MatchValue  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.services.embedding_space import fit_dimensions  # noqa: E402
+from app.services.openrouter_service import get_openrouter_service  # noqa: E402
+
+SHARED_COLLECTION = "omnirag_openrouter_collection"
+
+
+def load_corpus(client, collection, bot_id, limit):
+    texts, vectors, offset = [], [], None
+    bot_filter = Filter(must=[FieldCondition(key="bot_id", match=MatchValue(value=bot_id))])
+    while len(texts) < limit:
+        records, offset = client.scroll(
+            collection_name=collection, scroll_filter=bot_filter, limit=256,
+            offset=offset, with_payload=["text"], with_vectors=[""],
+        )
+        for r in records:
+            vector = r.vector.get("") if isinstance(r.vector, dict) else r.vector
+            if vector:
+                texts.append(r.payload.get("text", ""))
+                vectors.append(vector)
+        if offset is None:
+            break
+    return texts[:limit], np.asarray(vectors[:limit], dtype=np.float32)
+
+
+def synth_queries(texts, n, words, seed):
+    rng = random.Random(seed)
+    picks = rng.sample(range(len(texts)), min(n, len(texts)))
+    return [" ".join(texts[i].split()[:words]) for i in picks], picks
+
+
+def top_k(queries, corpus, k):
+    q = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    c = corpus / np.linalg.norm(corpus, axis=1, keepdims=True)
+    scores = q @ c.T
+    idx = np.argpartition(-scores, min(k, scores.shape[1] - 1), axis=1)[:, :k]
+    return np.take_along_axis(idx, np.argsort(-np.take_along_axis(scores, idx, axis=1), axis=1), axis=1)
+
+
+def memory_mb(dim, n=1_000_000):
+    return dim * 4 * n / 2**20, dim * n / 2**20, dim / 8 * n / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bot-id", required=True)
+    parser.add_argument("--collection", default=SHARED_COLLECTION, help="full-dimension collection to read")
+    parser.add_argument("--dims", type=int, nargs="+", default=[256, 512, 768, 1024])
+    parser.add_argument("--queries", help="text file, one query per line (default: synthesized)")
+    parser.add_argument("--n-queries", type=int, default=100)
+    parser.add_argument("--query-words", type=int, default=12)
+    parser.add_argument("--limit", type=int, default=20000, help="max chunks to load")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=13)
+    args = parser.parse_args()
+
+    client = QdrantClient(host=settings.QDRANT_HOST, port=settings.QDRANT_PORT)
+    texts, corpus = load_corpus(client, args.collection, args.bot_id, args.limit)
+    if not len(texts):
+        sys.exit(f"No vectors for bot {args.bot_id} in '{args.collection}'")
+
+    if args.queries:
+        with open(args.queries) as f:
+            queries, gold = [line.strip() for line in f if line.strip()], None
+    else:
+        queries, gold = synth_queries(texts, args.n_queries, args.query_words, args.seed)
+    query_vectors = np.asarray(
+        get_openrouter_service().embed_batch(queries, batch_size=100), dtype=np.float32
+    )
+    full_dim = corpus.shape[1]
+    k = min(args.top_k, len(texts))
+    reference = top_k(query_vectors, corpus, k)
+
+    print(f"\n{len(texts)} chunks, {len(queries)} queries, full dim={full_dim}, k={k}\n")
+    print(f"{'dim':>6}{'recall@k':>10}{'hit@k':>8}{'MRR':>8}{'f32 MB/1M':>12}{'int8 MB/1M':>12}{'bin MB/1M':>11}")
+    for dim in sorted({d for d in args.dims if d < full_dim} | {full_dim}):
+        ranked = top_k(
+            np.asarray(fit_dimensions(query_vectors, dim), dtype=np.float32),
+            np.asarray(fit_dimensions(corpus, dim), dtype=np.float32),
+            k,
+        )
+        recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(ranked, reference)])
+        hit, mrr = float("nan"), float("nan")
+        if gold is not None:
+            ranks = [list(row).index(g) + 1 if g in row else None for row, g in zip(ranked, gold)]
+            hit = np.mean([r is not None for r in ranks])
+            mrr = np.mean([1 / r if r else 0.0 for r in ranks])
+        f32, i8, b1 = memory_mb(dim)
+        print(f"{dim:>6}{recall:>10.3f}{hit:>8.3f}{mrr:>8.3f}{f32:>12.0f}{i8:>12.0f}{b1:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark reranker engines on identical candidate pools: torch vs ONNX fp32 vs ONNX int8.
+
+Reports throughput (pairs/sec) and parity against the torch CrossEncoder
+(max |score diff| on the pipeline's sigmoid scale, Spearman rank correlation,
+top-k overlap per pool).
+
+Usage (from repo root):
+    python scripts/benchmark_reranker.py
+    python scripts/benchmark_reranker.py --model BAAI/bge-reranker-v2-m3 --pools pools.jsonl
+
+--pools: JSONL, one candidate pool per line: {"query": "...", "texts": ["...", ...]}
+(e.g. dumped from /bots/{id}/retrieve). Without it, synthetic pools are built from
+the parity sample in app/services/onnx_reranker.py.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from app.core.config import settings  # noqa: E402
+from app.services.onnx_reranker import (  # noqa: E402
+    FP32_FILE,
+    INT8_FILE,
+    PARITY_PAIRS,
+    OnnxCrossEncoder,
+    export_onnx,
+    onnx_model_dir,
+)
+from app.services.reranker_service import load_torch_cross_encoder  # noqa: E402
+
+
+def pipeline_score(x):
+    """Score scale the RAG pipeline thresholds on (sigmoid of the reranker output)."""
+    return 1 / (1 + np.exp(-x))
+
+
+def load_pools(path, pool_size):
+    if path:
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    passages = [p for _, p in PARITY_PAIRS]
+    queries = list(dict.fromkeys(q for q, _ in PARITY_PAIRS))
+    return [
+        {"query": q, "texts": [passages[(i + j) % len(passages)] for j in range(pool_size)]}
+        for i, q in enumerate(queries)
+    ]
+
+
+def score_pools(model, pools, batch_size):
+    return [
+        np.asarray(model.predict([[p["query"], t] for t in p["texts"]], batch_size=batch_size, show_progress_bar=False),
+                   dtype=np.float64).reshape(len(p["texts"]), -1)[:, 0]
+        for p in pools
+    ]
+
+
+def bench(model, pools, batch_size, repeat):
+    score_pools(model, pools[:1], batch_size)  # warm-up
+    n_pairs = sum(len(p["texts"]) for p in pools) * repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        scores = score_pools(model, pools, batch_size)
+    elapsed = time.perf_counter() - start
+    return scores, n_pairs / elapsed, elapsed / (len(pools) * repeat) * 1000
+
+
+def parity(scores, reference, top_k):
+    diffs, spearmans, overlaps = [], [], []
+    for a, b in zip(scores, reference):
+        diffs.append(np.abs(pipeline_score(a) - pipeline_score(b)).max())
+        if len(a) > 1:
+            spearmans.append(np.corrcoef(np.argsort(np.argsort(a)), np.argsort(np.argsort(b)))[0, 1])
+        k = min(top_k, len(a))
+        overlaps.append(len(set(np.argsort(-a)[:k]) & set(np.argsort(-b)[:k])) / k)
+    return max(diffs), float(np.mean(spearmans)) if spearmans else 1.0, float(np.mean(overlaps))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=settings.RERANKER_MODEL)
+    parser.add_argument("--pools", help="JSONL candidate pools")
+    parser.add_argument("--pool-size", type=int, default=24, help="synthetic pool size (top_k*2 .. initial_limit)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    pools = load_pools(args.pools, args.pool_size)
+    model_dir = onnx_model_dir(args.model)
+    if not os.path.exists(os.path.join(model_dir, INT8_FILE)):
+        print(f"Exporting {args.model} → {model_dir} ...")
+        export_onnx(args.model, model_dir, quantize=True)
+
+    engines = {
+        "torch (cpu)": lambda: load_torch_cross_encoder(args.model, device="cpu"),
+        "onnx fp32": lambda: OnnxCrossEncoder(model_dir, FP32_FILE),
+        "onnx int8": lambda: OnnxCrossEncoder(model_dir, INT8_FILE),
+    }
+
+    print(f"\n{len(pools)} pools, {sum(len(p['texts']) for p in pools)} pairs/pass, repeat={args.repeat}\n")
+    print(f"{'engine':<14}{'pairs/sec':>12}{'ms/pool':>10}{'max|Δ|':>10}{'spearman':>10}{'top-k ovl':>11}")
+    reference = None
+    for name, load in engines.items():
+        scores, pairs_per_sec, ms_per_pool = bench(load(), pools, args.batch_size, args.repeat)
+        if reference is None:
+            reference = scores
+        max_diff, spearman, overlap = parity(scores, reference, args.top_k)
+        print(f"{name:<14}{pairs_per_sec:>12.1f}{ms_per_pool:>10.1f}{max_diff:>10.4f}{spearman:>10.4f}{overlap:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()